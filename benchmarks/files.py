@@ -0,0 +1,82 @@
+"""
+Benchmarks for listing the files of a search
+"""
+
+import os
+
+import pandas
+import sqlalchemy as sqa
+
+from edb import db
+from edb.experimentdb import ExperimentDB
+
+
+class ListFiles:
+    """
+    List the files of a variable in a single stream
+    """
+
+    params = [10**4, 10**5, 10**6]
+    param_names = ["files"]
+    number = 1
+    timeout = 600
+
+    def setup(self, n):
+        self.engine = db.connect("sqlite+pysqlite://")
+
+        with self.engine.begin() as conn:
+            conn.execute(
+                db.experiment.insert().values(
+                    id=1, name="ab123", type_id="um-rose", path="/scratch/ab123"
+                )
+            )
+            conn.execute(db.stream.insert().values(id=1, experiment_id=1, name="pa"))
+            conn.execute(db.variable.insert().values(id=1, stream_id=1, name="tas"))
+            conn.execute(
+                db.file.insert(),
+                [
+                    {
+                        "stream_id": 1,
+                        "experiment_id": 1,
+                        "type_id": "um",
+                        "relative_path": f"share/data/History_Data/ab123a.pa{i:07d}",
+                    }
+                    for i in range(n)
+                ],
+            )
+
+        self.edb = ExperimentDB(conn=self.engine)
+
+    def teardown(self, n):
+        self.engine.dispose()
+
+    def time_files(self, n):
+        self.edb.files(variable_id=1)
+
+    def time_iter_files(self, n):
+        for _ in self.edb.iter_files(variable_id=1):
+            pass
+
+    def time_files_apply(self, n):
+        # Previous implementation, joining paths row by row in python
+        sel = (
+            sqa.select(
+                [
+                    db.experiment.c.path,
+                    db.file.c.relative_path,
+                    db.variable.c.id.label("variable_id"),
+                ]
+            )
+            .select_from(
+                db.experiment.join(db.stream)
+                .join(db.variable)
+                .join(db.file, db.file.c.stream_id == db.stream.c.id)
+            )
+            .where(db.variable.c.id == 1)
+        )
+        df = pandas.read_sql(sel, self.engine, index_col="variable_id")
+        df.apply(
+            lambda row: {"path": os.path.join(row.path, row.relative_path)},
+            axis=1,
+            result_type="expand",
+        )
@@ -0,0 +1,44 @@
+"""
+Benchmarks for finding the files of an experiment that has already been
+scanned
+"""
+
+import os
+import shutil
+import tempfile
+
+from edb.model.experiment.um import UMRose
+from edb.model.file import UMFile
+
+
+class RescanExperiment:
+    """
+    Rescan a UM experiment with a single stream where all files are known
+    """
+
+    params = [10**3, 10**4, 10**5]
+    param_names = ["files"]
+    timeout = 600
+
+    def setup(self, n):
+        self.path = tempfile.mkdtemp()
+        history = os.path.join(self.path, "share", "data", "History_Data")
+        os.makedirs(history)
+
+        self.exp = UMRose(self.path)
+        for i in range(n):
+            rel = os.path.join("share", "data", "History_Data", f"ab123a.pa{i:06d}")
+            open(os.path.join(self.path, rel), "w").close()
+            UMFile(rel, self.exp)
+
+        self.exp.collect_streams(self.exp.files)
+
+    def teardown(self, n):
+        shutil.rmtree(self.path)
+
+    def time_find_files(self, n):
+        for _ in self.exp.find_files():
+            pass
+
+    def time_collect_streams(self, n):
+        self.exp.collect_streams(self.exp.files)
@@ -0,0 +1,54 @@
+"""
+Benchmarks for the start up time of the command line tool
+
+Each import or command is timed in a fresh interpreter, so the data libraries
+that are only loaded when needed don't count towards the start up time
+"""
+
+
+class ImportTime:
+    """
+    Import the package and command line modules
+    """
+
+    def timeraw_import_edb(self):
+        return "import edb"
+
+    def timeraw_import_cli(self):
+        return "import edb.cli"
+
+    def timeraw_import_pandas(self):
+        # For comparison, the cost of a library that is imported lazily
+        return "import pandas"
+
+
+class CommandLine:
+    """
+    Build the command line parser, as every command including '--help' does,
+    and run a search without a server
+    """
+
+    def setup_cache(self):
+        from edb import db
+        from edb.tests import synthetic
+
+        engine = db.connect("sqlite:///cli.sqlite3")
+        with engine.begin() as conn:
+            synthetic.fill_database(conn, 1, 10, 100, 10)
+        engine.dispose()
+
+        with open("cli.yaml", "w") as f:
+            f.write("database: sqlite:///cli.sqlite3\n")
+
+    def timeraw_make_parser(self):
+        return "import edb.cli; edb.cli.make_parser()"
+
+    def timeraw_search(self):
+        # Run in the setup_cache directory, with no server to forward to
+        setup = (
+            "import os, sys; "
+            "os.environ['EDB_SOCKET'] = os.path.abspath('no-server.sock'); "
+            "sys.argv = ['edb', 'search', '--config', 'cli.yaml', "
+            "'--variable', 'temperature', '--limit', '10']"
+        )
+        return "import edb.cli; edb.cli.main()", setup
@@ -0,0 +1,97 @@
+"""
+Benchmarks for opening variables spread over many files
+
+Synthetic payu experiments are written and scanned once by ``setup_cache``,
+each benchmark then opens the daily sea surface temperature, which has one
+file in each output directory. UM experiments have a monthly file for each
+time.
+"""
+
+import os
+
+from edb import db
+from edb.experimentdb import ExperimentDB
+from edb.tests import synthetic
+
+
+class OpenDataArrays:
+    """
+    Open a variable from a payu experiment
+    """
+
+    params = [10, 100, 1000]
+    param_names = ["files"]
+    number = 1
+    repeat = 3
+    timeout = 1200
+
+    def setup_cache(self):
+        for n in self.params:
+            path = os.path.abspath(os.path.join(f"payu-{n}", "u-ab123"))
+            synthetic.payu_experiment(path, n, ntime=5)
+
+            engine = db.connect(f"sqlite:///open-{n}.sqlite3")
+            ExperimentDB(conn=engine).scan("access-om-payu", path)
+            engine.dispose()
+
+    def setup(self, _, n):
+        self.engine = db.connect(f"sqlite:///open-{n}.sqlite3")
+        self.edb = ExperimentDB(conn=self.engine)
+        self.search = {"stream": "ocean_daily", "variable_name": "sst"}
+
+    def teardown(self, _, n):
+        self.engine.dispose()
+
+    def time_open(self, _, n):
+        self.edb.open_dataarray(**self.search)
+
+    def time_open_lazy(self, _, n):
+        self.edb.open_dataarray(lazy=True, **self.search)
+
+    def time_open_lazy_compute(self, _, n):
+        self.edb.open_dataarray(lazy=True, **self.search).values
+
+
+class OpenUM:
+    """
+    Open a variable from a UM experiment, using the field index of each file
+    """
+
+    params = [120, 1200]
+    param_names = ["files"]
+    number = 1
+    repeat = 3
+    timeout = 1200
+
+    def setup_cache(self):
+        for n in self.params:
+            path = os.path.abspath(os.path.join(f"um-{n}", "u-ab123"))
+            synthetic.um_experiment(path, n, streams=["pa"])
+
+            engine = db.connect(f"sqlite:///open-um-{n}.sqlite3")
+            ExperimentDB(conn=engine).scan("um-rose", path)
+            engine.dispose()
+
+    def setup(self, _, n):
+        self.engine = db.connect(f"sqlite:///open-um-{n}.sqlite3")
+        self.edb = ExperimentDB(conn=self.engine)
+        self.search = {"variable_name": "m01s03i236"}
+
+    def teardown(self, _, n):
+        self.engine.dispose()
+
+    def time_open(self, _, n):
+        self.edb.open_dataarray(**self.search)
+
+    def time_open_compute(self, _, n):
+        self.edb.open_dataarray(**self.search).values
+
+    def time_open_repeat(self, _, n):
+        # Opens after the first are served from the cache
+        for _ in range(10):
+            self.edb.open_dataarray(**self.search)
+
+    def time_open_year(self, _, n):
+        self.edb.open_dataarray(
+            time=slice("1985-01-01", "1985-12-30"), **self.search
+        ).values
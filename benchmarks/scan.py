@@ -0,0 +1,88 @@
+"""
+Benchmarks for scanning synthetic experiments with :meth:`ExperimentDB.scan`
+
+The experiment trees are written once by ``setup_cache`` (into the temporary
+directory asv runs the benchmarks in), each benchmark then scans them into a
+new database. Scans read every new file so sizes stop at thousands of files,
+see :mod:`benchmarks.search` for queries on millions of rows.
+"""
+
+import os
+
+from edb import db
+from edb.experimentdb import ExperimentDB
+from edb.tests import synthetic
+
+
+class _Scan:
+    type: str
+    number = 1
+    repeat = 3
+    timeout = 1200
+
+    def write(self, path, n):
+        pass
+
+    def setup_cache(self):
+        for n in self.params:
+            self.write(os.path.join(f"{self.type}-{n}", "u-ab123"), n)
+
+    def setup(self, _, n):
+        self.engine = db.connect("sqlite+pysqlite://")
+        self.edb = ExperimentDB(conn=self.engine)
+        self.path = os.path.abspath(os.path.join(f"{self.type}-{n}", "u-*"))
+
+    def teardown(self, _, n):
+        self.engine.dispose()
+
+    def time_scan(self, _, n):
+        self.edb.scan(self.type, self.path)
+
+
+class ScanGeneric(_Scan):
+    """
+    Scan a generic experiment, where each NetCDF file is a stream
+    """
+
+    type = "generic"
+    params = [10**2, 10**3]
+    param_names = ["files"]
+
+    def write(self, path, n):
+        synthetic.generic_experiment(path, n)
+
+
+class ScanPayu(_Scan):
+    """
+    Scan a payu experiment, with two NetCDF files per output directory
+    """
+
+    type = "access-om-payu"
+    params = [10**2, 10**3]
+    param_names = ["outputs"]
+
+    def write(self, path, n):
+        synthetic.payu_experiment(path, n)
+
+
+class ScanUM(_Scan):
+    """
+    Scan a UM experiment, with two streams of fieldsfiles
+    """
+
+    type = "um-rose"
+    params = [10**2, 10**3, 10**4]
+    param_names = ["files"]
+
+    def write(self, path, n):
+        synthetic.um_experiment(path, n // 2)
+
+
+class RescanUM(ScanUM):
+    """
+    Scan a UM experiment that is already in the database and hasn't changed
+    """
+
+    def setup(self, _, n):
+        super().setup(_, n)
+        self.edb.scan(self.type, self.path)
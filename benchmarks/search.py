@@ -0,0 +1,60 @@
+"""
+Benchmarks for searching a large database and listing its files
+
+The database is filled by :func:`edb.tests.synthetic.fill_database` with
+UM-like experiments of 10 streams, each with 100 variables and 100 files, so
+the number of variable rows and file rows are both the benchmark parameter.
+"""
+
+from edb import db
+from edb.experimentdb import ExperimentDB
+from edb.tests import synthetic
+
+
+class Search:
+    """
+    Search variables and list files
+    """
+
+    params = [10**3, 10**4, 10**5, 10**6]
+    param_names = ["rows"]
+    timeout = 1200
+
+    def setup_cache(self):
+        for n in self.params:
+            engine = db.connect(f"sqlite:///search-{n}.sqlite3")
+            with engine.begin() as conn:
+                synthetic.fill_database(conn, n // 1000, 10, 100, 100)
+            engine.dispose()
+
+    def setup(self, _, n):
+        self.engine = db.connect(f"sqlite:///search-{n}.sqlite3")
+        self.edb = ExperimentDB(conn=self.engine)
+
+    def teardown(self, _, n):
+        self.engine.dispose()
+
+    def time_search_name(self, _, n):
+        self.edb.search(variable_name="m01s01i050")
+
+    def time_search_experiment(self, _, n):
+        self.edb.search(experiment="u-a00001")
+
+    def time_search_text(self, _, n):
+        self.edb.search(variable="temperature", limit=100)
+
+    def time_search_prefix(self, _, n):
+        self.edb.search(variable_prefix="temp", limit=100)
+
+    def time_search_part(self, _, n):
+        self.edb.search(variable_part="s01i05", limit=100)
+
+    def time_files_variable(self, _, n):
+        self.edb.files(variable_id=1)
+
+    def time_files_name(self, _, n):
+        self.edb.files(experiment="u-a00001", variable_name="m01s01i050")
+
+    def time_iter_paths(self, _, n):
+        for _ in self.edb.iter_paths(variable_name="m01s01i050"):
+            pass
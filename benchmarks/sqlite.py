@@ -0,0 +1,84 @@
+"""
+Benchmarks for reading the database while a scan is writing to it
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+
+import sqlalchemy as sqa
+
+from edb import db
+
+
+class ReadDuringScan:
+    """
+    Time searches while another connection repeatedly writes batches of files,
+    as happens during a scan
+    """
+
+    params = ["delete", "wal"]
+    param_names = ["journal_mode"]
+    timeout = 600
+
+    def setup(self, journal_mode):
+        self.path = tempfile.mkdtemp()
+        url = f"sqlite:///{os.path.join(self.path, 'edb.sqlite')}"
+        pragmas = {"journal_mode": journal_mode}
+
+        self.writer = db.connect(url, pragmas)
+        self.reader = db.connect(url, pragmas)
+
+        with self.writer.begin() as conn:
+            conn.execute(
+                db.experiment.insert().values(
+                    id=1, name="ab123", path="/scratch/ab123", type_id="um-rose"
+                )
+            )
+            conn.execute(
+                db.stream.insert().values(id=1, experiment_id=1, name="ab123a.pa")
+            )
+            conn.execute(
+                db.variable.insert(),
+                [{"stream_id": 1, "name": f"m01s00i{i:03d}"} for i in range(100)],
+            )
+
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.scan)
+        self.thread.start()
+
+    def teardown(self, journal_mode):
+        self.stop.set()
+        self.thread.join()
+        self.writer.dispose()
+        self.reader.dispose()
+        shutil.rmtree(self.path)
+
+    def scan(self):
+        i = 0
+        while not self.stop.is_set():
+            with self.writer.begin() as conn:
+                conn.execute(
+                    db.file.insert(),
+                    [
+                        {
+                            "stream_id": 1,
+                            "experiment_id": 1,
+                            "relative_path": f"ab123a.pa{i:06d}_{j:04d}",
+                            "type_id": "um",
+                        }
+                        for j in range(5000)
+                    ],
+                )
+            i += 1
+
+    def time_search(self, journal_mode):
+        sel = (
+            sqa.select([db.variable.c.id])
+            .select_from(db.stream.join(db.variable))
+            .where(db.variable.c.name == "m01s00i050")
+        )
+        with self.reader.connect() as conn:
+            for _ in range(100):
+                conn.execute(sel).fetchall()
@@ -0,0 +1,49 @@
+"""
+Benchmarks for listing directory trees, comparing :mod:`edb.walk` to the
+serial standard library functions
+
+On a local filesystem listings are cheap, the concurrent versions show their
+benefit on network filesystems where each listing has a high latency
+"""
+
+import glob
+import os
+import shutil
+import tempfile
+
+from edb import walk
+
+
+class WalkTree:
+    """
+    List a tree of payu-style output directories, each containing files
+    """
+
+    params = [10, 100, 1000]
+    param_names = ["dirs"]
+
+    def setup(self, n):
+        self.path = tempfile.mkdtemp()
+        for i in range(n):
+            ocean = os.path.join(self.path, f"output{i:03d}", "ocean")
+            os.makedirs(ocean)
+            for j in range(10):
+                open(os.path.join(ocean, f"ocean_{j}.nc"), "w").close()
+
+    def teardown(self, n):
+        shutil.rmtree(self.path)
+
+    def time_os_walk(self, n):
+        for _ in os.walk(self.path):
+            pass
+
+    def time_walk_files(self, n):
+        for _ in walk.walk_files(self.path):
+            pass
+
+    def time_glob(self, n):
+        glob.glob(os.path.join(self.path, "output*", "ocean", "*.nc"))
+
+    def time_iglob(self, n):
+        for _ in walk.iglob(os.path.join(self.path, "output*", "ocean", "*.nc")):
+            pass
@@ -0,0 +1,85 @@
+"""
+Benchmarks for writing scan results to the database
+"""
+
+import sqlalchemy.orm as sqo
+
+from edb import db
+from edb.bulk import write_experiment
+from edb.model.experiment.generic import Generic
+from edb.model.experiment.um import UMRose
+from edb.model.file import NCFile, UMFile
+from edb.model.variable import Variable
+from edb.tests import synthetic
+
+
+class WriteExperiment:
+    """
+    Write a newly scanned UM experiment with a single stream
+    """
+
+    params = [10**3, 10**4, 10**5]
+    param_names = ["files"]
+    number = 1
+    timeout = 600
+
+    def setup(self, n):
+        self.engine = db.connect("sqlite+pysqlite://")
+
+        self.exp = UMRose("/scratch/ab123")
+        for i in range(n):
+            UMFile(f"share/data/History_Data/ab123a.pa{i:06d}", self.exp)
+        self.exp.collect_streams(self.exp.files)
+
+        for i in range(100):
+            v = Variable()
+            v.name = f"m01s00i{i:03d}"
+            self.exp.streams["ab123a.pa"].variables.append(v)
+
+    def teardown(self, n):
+        self.engine.dispose()
+
+    def time_orm(self, n):
+        session = sqo.Session(self.engine)
+        session.add(self.exp)
+        session.commit()
+
+    def time_bulk(self, n):
+        with self.engine.begin() as conn:
+            write_experiment(conn, self.exp)
+
+
+class WriteGeneric:
+    """
+    Write a newly scanned generic experiment, which has a stream for each file
+    so every file adds new variables to the text indexes
+    """
+
+    params = [10**2, 10**3, 10**4]
+    param_names = ["files"]
+    number = 1
+    timeout = 600
+
+    def setup(self, n):
+        self.engine = db.connect("sqlite+pysqlite://")
+
+        self.exp = Generic("/scratch/generic")
+        for i in range(n):
+            NCFile(f"run{i // 100:04d}/out{i:06d}.nc", self.exp)
+        self.exp.collect_streams(self.exp.files)
+
+        for stream in self.exp.streams.values():
+            for name, standard_name, long_name, units in synthetic.nc_variables:
+                v = Variable()
+                v.name = name
+                v.standard_name = standard_name
+                v.long_name = long_name
+                v.units = units
+                stream.variables.append(v)
+
+    def teardown(self, n):
+        self.engine.dispose()
+
+    def time_bulk(self, n):
+        with self.engine.begin() as conn:
+            write_experiment(conn, self.exp)
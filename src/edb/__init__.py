@@ -1,3 +1,17 @@
-from .experimentdb import ExperimentDB
+import importlib
 
-from . import model
+
+def __getattr__(name):
+    # Submodules are imported on first use, so that the command line tool
+    # starts quickly
+    if name == "ExperimentDB":
+        from .experimentdb import ExperimentDB
+
+        return ExperimentDB
+
+    try:
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f"{__name__}.{name}":
+            raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,222 @@
+"""
+Bulk writes of scan results to the database
+
+Scanning an experiment builds up the ORM object graph of its streams, files
+and variables. Rather than flushing these through the ORM unit of work one row
+at a time, :func:`write_experiment` writes them with batched Core statements.
+Rows that are already in the database only have their changed columns
+written, so rescanning an unchanged experiment writes very little.
+"""
+
+from __future__ import annotations
+
+import collections
+import contextlib
+
+import sqlalchemy as sqa
+import typing as T
+
+from . import db
+
+if T.TYPE_CHECKING:
+    from .model.experiment import Experiment
+
+
+def _row(obj, table: sqa.Table, **values) -> T.Dict[str, T.Any]:
+    """
+    Values of the columns of 'table' held by the ORM object 'obj', with
+    overrides from 'values'
+    """
+    row = {c.name: getattr(obj, c.name, None) for c in table.columns if c.name != "id"}
+    row.update(values)
+    return row
+
+
+def _changes(obj, table: sqa.Table, **values) -> T.Dict[str, T.Any]:
+    """
+    Values of the columns of 'table' that have changed on the ORM object 'obj'
+    since it was loaded, and of 'values' that differ from the object's
+    """
+    attrs = sqa.inspect(obj).attrs
+
+    row = {}
+    for c in table.columns:
+        if c.name == "id":
+            continue
+        if c.name in values:
+            if values[c.name] != getattr(obj, c.name, None):
+                row[c.name] = values[c.name]
+        elif c.name in attrs and attrs[c.name].history.has_changes():
+            row[c.name] = getattr(obj, c.name)
+
+    return row
+
+
+def _batches(rows: T.List, batch_size: int) -> T.Iterator[T.List]:
+    for i in range(0, len(rows), batch_size):
+        yield rows[i : i + batch_size]
+
+
+def _upsert(
+    conn: sqa.engine.Connection,
+    table: sqa.Table,
+    objs: T.Iterable[T.Tuple[T.Any, T.Dict[str, T.Any]]],
+    batch_size: int,
+):
+    """
+    Write ORM objects to 'table' in batches
+
+    Objects without an id are inserted, ignoring rows that conflict with a
+    unique constraint. Objects with an id only update the columns that have
+    changed, objects that haven't changed aren't written.
+
+    Args:
+        objs: ORM objects, with values overriding their attributes
+    """
+    new = []
+    # Ids of the rows with each set of changes
+    changed: T.Dict[T.Tuple, T.List[int]] = collections.defaultdict(list)
+    for obj, values in objs:
+        if obj.id is None:
+            new.append(_row(obj, table, **values))
+            continue
+
+        row = _changes(obj, table, **values)
+        if len(row) > 0:
+            changed[tuple(sorted(row.items()))].append(obj.id)
+
+    insert = table.insert().prefix_with("OR IGNORE", dialect="sqlite")
+    for batch in _batches(new, batch_size):
+        conn.execute(insert, batch)
+
+    # Rows with the same changes, e.g. the 'last_seen' of unchanged files, are
+    # updated together, other rows with the same changed columns are batched
+    by_columns = collections.defaultdict(list)
+    for items, ids in changed.items():
+        if len(ids) == 1:
+            by_columns[tuple(k for k, _ in items)].append(
+                {**dict(items), "_id": ids[0]}
+            )
+            continue
+
+        for batch in _batches(ids, batch_size):
+            conn.execute(
+                table.update().where(table.c.id.in_(batch)).values(dict(items))
+            )
+
+    update = table.update().where(table.c.id == sqa.bindparam("_id"))
+    for rows in by_columns.values():
+        for batch in _batches(rows, batch_size):
+            conn.execute(update, batch)
+
+
+def _write_one(conn: sqa.engine.Connection, table: sqa.Table, obj, **values) -> int:
+    """
+    Write a single ORM object to 'table', returning its id
+    """
+    if obj.id is None:
+        r = conn.execute(table.insert().values(_row(obj, table, **values)))
+        return r.inserted_primary_key[0]
+
+    row = _changes(obj, table, **values)
+    if len(row) > 0:
+        conn.execute(table.update().where(table.c.id == obj.id).values(row))
+    return obj.id
+
+
+@contextlib.contextmanager
+def _deferred_fts(conn: sqa.engine.Connection):
+    """
+    Skip the full text index triggers while inserting variables, and index the
+    new rows afterwards with a single statement for each index
+
+    Indexing the rows together is several times faster than a trigger insert
+    for each row. The triggers are dropped and recreated within the caller's
+    transaction, so other connections always see them.
+    """
+    names = [f"{table}_ai" for table in db.fts_tables]
+    triggers = conn.execute(
+        sqa.text(
+            "SELECT name, sql FROM sqlite_master "
+            "WHERE type = 'trigger' AND name IN :names"
+        ).bindparams(sqa.bindparam("names", expanding=True)),
+        {"names": names},
+    ).fetchall()
+
+    # New rows get ids after the current largest
+    last_id = conn.execute(sqa.select([sqa.func.max(db.variable.c.id)])).scalar()
+
+    for name, _ in triggers:
+        conn.execute(sqa.text(f"DROP TRIGGER {name}"))
+
+    yield
+
+    for name, sql in triggers:
+        table = name[: -len("_ai")]
+        conn.execute(
+            sqa.text(
+                f"INSERT INTO {table} (rowid, name, long_name, standard_name) "
+                "SELECT id, name, long_name, standard_name FROM variable "
+                "WHERE id > :last_id"
+            ),
+            {"last_id": last_id or 0},
+        )
+        conn.execute(sqa.text(sql))
+
+
+def write_experiment(
+    conn: sqa.engine.Connection, exp: Experiment, batch_size: int = 1000
+) -> int:
+    """
+    Write an experiment and its streams, files and variables to the database
+
+    The experiment should not be attached to an ORM session, the caller is
+    responsible for committing the transaction
+
+    Args:
+        conn: Database connection
+        exp: Experiment to write
+        batch_size: Number of rows to write in each statement
+    Returns:
+        The database id of the experiment
+    """
+    exp_id = _write_one(conn, db.experiment, exp)
+
+    streams = list(exp.streams.values())
+    _upsert(
+        conn, db.stream, [(s, {"experiment_id": exp_id}) for s in streams], batch_size
+    )
+
+    # Ids of the streams, including those just inserted
+    stream_ids = dict(
+        conn.execute(
+            sqa.select([db.stream.c.name, db.stream.c.id]).where(
+                db.stream.c.experiment_id == exp_id
+            )
+        ).fetchall()
+    )
+
+    # Rows are batched across streams, generic experiments have a stream for
+    # each file
+    variables = [
+        (v, {"stream_id": stream_ids[s.name]}) for s in streams for v in s.variables
+    ]
+    new = any(v.id is None for v, _ in variables)
+    with _deferred_fts(conn) if new else contextlib.nullcontext():
+        _upsert(conn, db.variable, variables, batch_size)
+
+    # Only write files that are still part of the experiment
+    current = {id(f) for f in exp.files}
+    _upsert(
+        conn,
+        db.file,
+        [
+            (f, {"stream_id": stream_ids[s.name], "experiment_id": exp_id})
+            for s in streams
+            for f in s.files
+            if id(f) in current
+        ],
+        batch_size,
+    )
+
+    return exp_id
@@ -1,12 +1,20 @@
+from __future__ import annotations
+
 import argparse
+import datetime
 import textwrap
-import yaml
 import logging
-import pandas
+import os
+import sys
+import typing as T
+
+from . import options, server
+from .utils import ignore_broken_pipe
 
-from .experimentdb import ExperimentDB, search_params
-from .model.experiment import Experiment
-from .utils import all_subclasses
+# The database and data libraries are imported as commands need them, so that
+# commands forwarded to a running server start quickly
+if T.TYPE_CHECKING:
+    from .experimentdb import ExperimentDB
 
 
 class CLIFunction:
@@ -20,17 +28,17 @@ class CLIFunction:
             help=self.help,
         )
         self.setup_parser(parser)
-        parser.add_argument(
-            "--config", type=argparse.FileType("r"), help="configuration file"
-        )
+        parser.add_argument("--config", help="configuration file")
         parser.add_argument("--debug", action="store_true", help="print debug info")
-        parser.set_defaults(call=self.top_call)
+        parser.set_defaults(call=self.top_call, command=self)
 
     def top_call(self, args):
         if args.debug:
             logging.basicConfig(level=logging.DEBUG)
             logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
 
+        from .experimentdb import ExperimentDB
+
         expdb = ExperimentDB(args.config)
         self.call(expdb, args)
 
@@ -58,20 +66,67 @@ class Scan(CLIFunction):
     help = "scan filesystem for experiments"
 
     def setup_parser(self, parser):
-        expt_types = sorted(
-            [e.type for e in all_subclasses(Experiment) if e.type is not None]
+        parser.add_argument(
+            "--type",
+            default="generic",
+            help="experiment type",
+            choices=options.experiment_types,
+        )
+        parser.add_argument(
+            "-j",
+            "--workers",
+            type=int,
+            help="number of processes used to probe files",
         )
         parser.add_argument(
-            "--type", default="generic", help="experiment type", choices=expt_types
+            "--profile",
+            action="store_true",
+            help="print the time spent in each phase of the scan",
         )
         parser.add_argument("path", nargs="*", help="paths to scan")
 
     def call(self, expdb, args):
+        started = datetime.datetime.now()
+
         if len(args.path) > 0:
             for p in args.path:
-                expdb.scan(args.type, p)
+                expdb.scan(args.type, p, workers=args.workers)
         else:
-            expdb.scan_all()
+            expdb.scan_all(workers=args.workers)
+
+        if args.profile:
+            print_profile(expdb.scan_history(since=started))
+
+
+def print_profile(history):
+    """
+    Print the metrics of each experiment scanned, slowest first, and the totals
+    """
+    import pandas
+
+    history = history.drop(columns="started").set_index("experiment")
+    history = history.sort_values("seconds", ascending=False)
+
+    # Counts, then the phases that took the longest
+    counts = sorted(c for c in history.columns if not c.endswith("seconds"))
+    phases = [c for c in history.columns if c.endswith(" seconds")]
+    phases.sort(key=lambda c: history[c].sum(), reverse=True)
+    history = history[["seconds", *counts, *phases]]
+
+    history.loc["total"] = history.sum()
+    history[counts] = history[counts].astype(int)
+
+    with pandas.option_context(
+        "display.max_columns",
+        None,
+        "display.max_rows",
+        None,
+        "display.width",
+        None,
+        "display.float_format",
+        "{:.2f}".format,
+    ):
+        print(history)
 
 
 class List(CLIFunction):
@@ -83,11 +138,11 @@ class List(CLIFunction):
     help = "list known experiments"
 
     def setup_parser(self, parser):
-        expt_types = sorted(
-            [e.type for e in all_subclasses(Experiment) if e.type is not None]
-        )
         parser.add_argument(
-            "--type", default="generic", help="experiment type", choices=expt_types
+            "--type",
+            default="generic",
+            help="experiment type",
+            choices=options.experiment_types,
         )
 
     def call(self, expdb, args):
@@ -103,15 +158,21 @@ class Search(CLIFunction):
     help = "search output variables"
 
     def setup_parser(self, parser):
-        for k, v in search_params.items():
-            parser.add_argument(f"--{k}", help=v["description"])
+        for k, v in options.search_args.items():
+            parser.add_argument(f"--{k}", help=v)
+        parser.add_argument("--limit", type=int, help="maximum number of results")
 
     def call(self, expdb, args):
-        # search_params in args
+        limit = args.limit
+
+        # Search arguments in args
         args = vars(args)
-        args_params = args.keys() & search_params.keys()
+        args_params = args.keys() & options.search_args.keys()
+
+        import pandas
+
         with pandas.option_context("display.max_colwidth", None, "display.max_columns", None, "display.width", None):
-            print(expdb.search(**{k: args[k] for k in args_params}))
+            print(expdb.search(limit=limit, **{k: args[k] for k in args_params}))
 
 
 class Files(CLIFunction):
@@ -123,16 +184,69 @@ class Files(CLIFunction):
     help = "list file paths"
 
     def setup_parser(self, parser):
-        for k, v in search_params.items():
-            parser.add_argument(f"--{k}", help=v["description"])
+        for k, v in options.search_args.items():
+            parser.add_argument(f"--{k}", help=v)
+        parser.add_argument(
+            "--streaming",
+            action="store_true",
+            help="print tab separated 'variable_id path' lines as results are found",
+        )
 
     def call(self, expdb, args):
-        # search_params in args
+        streaming = args.streaming
+
+        # Search arguments in args
         args = vars(args)
-        args_params = args.keys() & search_params.keys()
+        args_params = args.keys() & options.search_args.keys()
+        search = {k: args[k] for k in args_params}
+
+        if streaming:
+            with ignore_broken_pipe():
+                for variable_id, path in expdb.iter_paths(**search):
+                    sys.stdout.write(f"{variable_id}\t{path}\n")
+                sys.stdout.flush()
+            return
+
+        import pandas
 
         with pandas.option_context("display.max_colwidth", None):
-            print(expdb.files(**{k: args[k] for k in args_params}))
+            print(expdb.files(**search))
+
+
+class Database(CLIFunction):
+    """
+    Database maintenance
+
+    'upgrade' applies any outstanding schema changes to the database in place.
+    This is also done automatically when connecting, unless the 'auto upgrade'
+    setting is false. 'version' prints the database schema version.
+    """
+
+    name = "db"
+    help = "database maintenance"
+
+    def setup_parser(self, parser):
+        parser.add_argument("action", choices=["upgrade", "version"])
+
+    def top_call(self, args):
+        if args.debug:
+            logging.basicConfig(level=logging.DEBUG)
+
+        from . import db
+        from .config import read_config
+
+        # Connect without checking the schema version
+        config = read_config(args.config)
+        engine = db.create_engine(config["database"], config.get("sqlite"))
+
+        with engine.connect() as conn:
+            version = db.schema_version(conn)
+
+        if args.action == "upgrade" and version < len(db.migrations):
+            logging.basicConfig(level=logging.INFO)
+            version = db.upgrade_schema(engine)
+
+        print(f"schema version {version} (current {len(db.migrations)})")
 
 
 class ShowConfig(CLIFunction):
@@ -147,9 +261,51 @@ class ShowConfig(CLIFunction):
         pass
 
     def call(self, expdb, args):
+        import yaml
+
         print(yaml.dump(expdb.config))
 
 
+class Serve(CLIFunction):
+    """
+    Run a query server
+
+    While the server is running the 'experiments', 'search' and 'files'
+    commands are sent to it instead of connecting to the database
+    themselves, so they don't pay the start up cost each time. Commands are
+    only sent to the server if they use the same --config file.
+
+    The socket is $EDB_SOCKET if set, otherwise a per-user socket in
+    $XDG_RUNTIME_DIR, or else in a private per-user directory in $TMPDIR.
+    """
+
+    name = "serve"
+    help = "run a query server for the other commands"
+
+    def setup_parser(self, parser):
+        parser.add_argument("--socket", help="socket path")
+
+    def top_call(self, args):
+        from . import db
+        from .config import read_config
+        from .experimentdb import ExperimentDB
+
+        logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+        config = read_config(args.config)
+        engine = db.connect(
+            config["database"],
+            config.get("sqlite"),
+            upgrade=config.get("auto upgrade", True),
+        )
+
+        # Each command reuses the one connection
+        with engine.connect() as conn:
+            expdb = ExperimentDB(args.config, conn=conn)
+            config_path = None if args.config is None else os.path.abspath(args.config)
+            server.serve(expdb, make_parser(), config_path, args.socket)
+
+
 description = """
 ⛅ Climate and Weather Experiment Database
 
@@ -158,8 +314,10 @@ outputs
 """
 
 
-def main():
-
+def make_parser() -> argparse.ArgumentParser:
+    """
+    Parser for the command line arguments
+    """
     parser = argparse.ArgumentParser(
         description=textwrap.dedent(description),
         formatter_class=argparse.RawTextHelpFormatter,
@@ -169,7 +327,16 @@ def main():
     for c in CLIFunction.__subclasses__():
         c(subparsers)
 
-    args = parser.parse_args()
+    return parser
+
+
+def main():
+    # Use a running server if possible
+    status = server.forward(sys.argv[1:])
+    if status is not None:
+        sys.exit(status)
+
+    args = make_parser().parse_args()
     args.call(args)
 
 
@@ -7,6 +7,12 @@ config_defaults = {
         f"sqlite:///{os.environ.get('TMPDIR', '/tmp')}/experimentdb.sqlite3"
     ),
     "scan paths": [],
+    "scan batch size": 1000,
+    "scan references": False,
+    "reidentify age": 30,
+    "auto upgrade": True,
+    "sqlite": {},
+    "cache": {},
 }
 
 config_schema = yaml.safe_load(
@@ -27,6 +33,40 @@ properties:
                 type:
                     type: string
             required: [name, path, type]
+    scan batch size:
+        type: integer
+        minimum: 1
+    scan references:
+        type: boolean
+    reidentify age:
+        type: number
+        minimum: 0
+    auto upgrade:
+        type: boolean
+    sqlite:
+        type: object
+        properties:
+            journal_mode:
+                enum: [delete, truncate, persist, memory, wal, "off"]
+            busy_timeout:
+                type: integer
+            synchronous:
+                enum: ["off", normal, full, extra]
+            mmap_size:
+                type: integer
+            cache_size:
+                type: integer
+        additionalProperties: false
+    cache:
+        type: object
+        properties:
+            arrays:
+                type: integer
+                minimum: 0
+            open files:
+                type: integer
+                minimum: 1
+        additionalProperties: false
 required: [database, scan paths]
 """
 )
@@ -5,79 +5,344 @@ These tables hold all of the data ExperimentDB knows about, and can be used for
 manual searches
 """
 
-
+import logging
 import sqlalchemy as sqa
+import typing as T
 
 metadata = sqa.MetaData()
 
 
-def connect(url):
+sqlite_defaults = {
+    "journal_mode": "wal",
+    "busy_timeout": 60000,
+    "synchronous": "normal",
+    "mmap_size": 256 * 1024**2,
+    "cache_size": -64 * 1024,
+}
+"""
+Default SQLite PRAGMA settings
+
+WAL mode lets searches continue while a scan is writing to the database
+"""
+
+
+def connect(url, sqlite: T.Optional[T.Dict[str, T.Any]] = None, upgrade: bool = True):
     """
     Connect to the database
 
     Args:
-        config: configuration data from :func:`experimentdb.config.read_config()`
+        url: database url, from the configuration's 'database' setting
+        sqlite: SQLite PRAGMA settings overriding :data:`sqlite_defaults`,
+            from the configuration's 'sqlite' setting
+        upgrade: Apply any outstanding :data:`migrations` to the database,
+            otherwise raise an error if there are any
     Returns:
         sqlalchemy.engine connected to the configured database
     """
+    engine = create_engine(url, sqlite)
+
+    with engine.connect() as conn:
+        version = schema_version(conn)
+
+    if version < len(migrations):
+        if not upgrade:
+            raise RuntimeError(
+                f"Database schema version {version} is out of date, "
+                f"run 'edb db upgrade' to upgrade it to version {len(migrations)}"
+            )
+        upgrade_schema(engine)
+
+    elif version > len(migrations):
+        logging.warning(
+            "Database schema version %d is newer than this version of edb (%d)",
+            version,
+            len(migrations),
+        )
+
+    return engine
+
+
+def create_engine(url, sqlite: T.Optional[T.Dict[str, T.Any]] = None):
+    """
+    Create a database engine without checking the schema, see :func:`connect`
+    """
     engine = sqa.create_engine(url)
 
-    experiment.create(engine, checkfirst=True)
-    stream.create(engine, checkfirst=True)
-    variable.create(engine, checkfirst=True)
-    file.create(engine, checkfirst=True)
+    if engine.dialect.name == "sqlite":
+        pragmas = {**sqlite_defaults, **(sqlite or {})}
 
-    with engine.connect() as conn:
-        r = conn.execute(sqa.text("PRAGMA table_info(variable_fts)")).fetchall()
-
-        # Setup fts
-        if len(r) == 0:
-            commands = [
-                """
-                CREATE VIRTUAL TABLE variable_fts
-                    USING fts5(
-                        name, 
-                        long_name, 
-                        standard_name, 
-                        tokenize = 'porter', 
-                        content = variable,
-                        content_rowid = id);
-                """,
-                """
-                CREATE TRIGGER variable_fts_ai AFTER INSERT ON variable BEGIN
-                INSERT INTO variable_fts (rowid, name, long_name, standard_name)
-                    VALUES (new.id, new.name, new.long_name, new.standard_name);
-                END;
-                """,
-                """
-                CREATE TRIGGER variable_fts_ad AFTER DELETE ON variable BEGIN
-                INSERT INTO variable_fts (rowid, name, long_name, standard_name)
-                    VALUES ('delete', old.name, old.long_name, old.standard_name);
-                END;
-                """,
-                """
-                CREATE TRIGGER variable_fts_au AFTER UPDATE ON variable BEGIN
-                INSERT INTO variable_fts (rowid, name, long_name, standard_name)
-                    VALUES ('delete', old.name, old.long_name, old.standard_name);
-                INSERT INTO variable_fts (rowid, name, long_name, standard_name)
-                    VALUES (new.id, new.name, new.long_name, new.standard_name);
-                END;
-                """,
-            ]
-
-            for c in commands:
-                conn.execute(sqa.text(c))
+        @sqa.event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for k, v in pragmas.items():
+                cursor.execute(f"PRAGMA {k} = {v}")
+            cursor.close()
 
     return engine
 
 
+def schema_version(conn) -> int:
+    """
+    Version of the database schema, the number of :data:`migrations` that
+    have been applied to it
+    """
+    return conn.execute(sqa.text("PRAGMA user_version")).scalar()
+
+
+def upgrade_schema(engine) -> int:
+    """
+    Apply any outstanding :data:`migrations` to the database
+
+    The changes are made in place in a single transaction, which holds the
+    database write lock so only one process upgrades at a time. Searches can
+    continue while the upgrade runs.
+
+    Returns:
+        The new schema version
+    """
+    with engine.begin() as conn:
+        # Take the write lock before checking the version
+        conn.execute(sqa.text("BEGIN IMMEDIATE"))
+
+        version = schema_version(conn)
+        for i, migration in enumerate(migrations[version:], start=version + 1):
+            logging.info("upgrading database schema to version %d", i)
+            migration(conn)
+            conn.execute(sqa.text(f"PRAGMA user_version = {i}"))
+
+        return max(version, len(migrations))
+
+
+def _migrate_baseline(conn):
+    """
+    Schema version 1
+
+    Creates the tables of a new database, or brings a database created before
+    schema versioning up to date
+    """
+    metadata.create_all(
+        conn, tables=[experiment, stream, variable, file], checkfirst=True
+    )
+    _add_missing_columns(conn)
+    _create_indexes(conn)
+
+    tables = fts_tables
+    if not has_trigram(conn):
+        logging.warning(
+            "SQLite %s has no trigram tokenizer (needs 3.34), "
+            "'variable_part' searches won't be available",
+            sqlite_version(conn),
+        )
+        tables = {k: v for k, v in tables.items() if k != "variable_trigram"}
+
+    _create_fts_tables(conn, tables)
+    _create_triggers(
+        conn, {k: v for table in tables for k, v in _fts_triggers(table).items()}
+    )
+
+
+def _migrate_scan_history(conn):
+    """
+    Schema version 2
+
+    Adds the 'scan_history' table
+    """
+    scan_history.create(conn, checkfirst=True)
+    for index in scan_history.indexes:
+        _create_index(conn, index)
+
+
+def _migrate_field_index(conn):
+    """
+    Schema version 3
+
+    Adds 'file.fields'
+    """
+    _add_missing_columns(conn)
+
+
+def _migrate_field_times(conn):
+    """
+    Schema version 4
+
+    Field indexes have both the t1 and t2 time of each field, clear the old
+    indexes so the next scan recreates them
+    """
+    conn.execute(file.update().values(fields=None))
+
+
+fts_tables = {
+    "variable_fts": """
+        CREATE VIRTUAL TABLE variable_fts
+            USING fts5(
+                name,
+                long_name,
+                standard_name,
+                tokenize = 'porter',
+                prefix = '2 3',
+                content = variable,
+                content_rowid = id)
+        """,
+    "variable_trigram": """
+        CREATE VIRTUAL TABLE variable_trigram
+            USING fts5(
+                name,
+                long_name,
+                standard_name,
+                tokenize = 'trigram',
+                content = variable,
+                content_rowid = id)
+        """,
+}
+"""
+Full text indexes of the 'variable' table
+
+'variable_fts' indexes words, with prefix indexes for autocompletion.
+'variable_trigram' indexes every three characters, so any part of a name
+can be matched
+"""
+
+
+def sqlite_version(conn) -> str:
+    """
+    Version of the SQLite library
+    """
+    return conn.execute(sqa.text("SELECT sqlite_version()")).scalar()
+
+
+def has_trigram(conn) -> bool:
+    """
+    Can the 'variable_trigram' full text index be created? The trigram
+    tokenizer is new in SQLite 3.34
+    """
+    version = tuple(int(v) for v in sqlite_version(conn).split("."))
+    return version >= (3, 34)
+
+
+def _fts_triggers(table):
+    return {
+        f"{table}_ai": f"""
+            CREATE TRIGGER {table}_ai AFTER INSERT ON variable BEGIN
+            INSERT INTO {table} (rowid, name, long_name, standard_name)
+                VALUES (new.id, new.name, new.long_name, new.standard_name);
+            END
+            """,
+        f"{table}_ad": f"""
+            CREATE TRIGGER {table}_ad AFTER DELETE ON variable BEGIN
+            INSERT INTO {table} ({table}, rowid, name, long_name, standard_name)
+                VALUES ('delete', old.id, old.name, old.long_name, old.standard_name);
+            END
+            """,
+        f"{table}_au": f"""
+            CREATE TRIGGER {table}_au AFTER UPDATE ON variable BEGIN
+            INSERT INTO {table} ({table}, rowid, name, long_name, standard_name)
+                VALUES ('delete', old.id, old.name, old.long_name, old.standard_name);
+            INSERT INTO {table} (rowid, name, long_name, standard_name)
+                VALUES (new.id, new.name, new.long_name, new.standard_name);
+            END
+            """,
+    }
+
+
+fts_triggers = {k: v for table in fts_tables for k, v in _fts_triggers(table).items()}
+"""
+Triggers keeping the full text indexes up to date
+"""
+
+
+def _create_fts_tables(conn, tables):
+    """
+    Create full text index tables, rebuilding existing tables with out of
+    date definitions
+    """
+    for name, sql in tables.items():
+        existing = conn.execute(
+            sqa.text(
+                "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"
+            ),
+            {"name": name},
+        ).scalar()
+
+        if existing is not None and existing.split() == sql.split():
+            continue
+
+        conn.execute(sqa.text(f"DROP TABLE IF EXISTS {name}"))
+        conn.execute(sqa.text(sql))
+        conn.execute(sqa.text(f"INSERT INTO {name} ({name}) VALUES ('rebuild')"))
+
+
+def _create_indexes(conn):
+    """
+    Create any indexes present in the table definitions but missing from an
+    existing database
+
+    The unique constraints also act as indexes on their leading columns, e.g.
+    'stream.experiment_id' and 'file.stream_id'
+    """
+    for table in [experiment, stream, variable, file]:
+        for index in table.indexes:
+            _create_index(conn, index)
+
+
+def _create_index(conn, index: sqa.Index):
+    """
+    Create an index if it doesn't exist yet
+
+    ``Index.create(checkfirst=True)`` needs SQLAlchemy 1.4
+    """
+    existing = conn.execute(
+        sqa.text("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"),
+        {"name": index.name},
+    ).scalar()
+
+    if existing is None:
+        index.create(conn)
+
+
+def _create_triggers(conn, triggers):
+    """
+    Create triggers, replacing existing triggers with out of date definitions
+    """
+    for name, sql in triggers.items():
+        existing = conn.execute(
+            sqa.text(
+                "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = :name"
+            ),
+            {"name": name},
+        ).scalar()
+
+        if existing is not None and existing.split() == sql.split():
+            continue
+
+        conn.execute(sqa.text(f"DROP TRIGGER IF EXISTS {name}"))
+        conn.execute(sqa.text(sql))
+
+
+def _add_missing_columns(conn):
+    """
+    Add any columns present in the table definitions but missing from an
+    existing database
+    """
+    for table in [experiment, stream, variable, file]:
+        r = conn.execute(sqa.text(f"PRAGMA table_info({table.name})")).fetchall()
+        existing = {row[1] for row in r}
+
+        for c in table.columns:
+            if c.name not in existing:
+                type = c.type.compile(dialect=conn.dialect)
+                conn.execute(
+                    sqa.text(f"ALTER TABLE {table.name} ADD COLUMN {c.name} {type}")
+                )
+
+
 experiment = sqa.Table(
     "experiment",
     metadata,
     sqa.Column("id", sqa.Integer, primary_key=True),
-    sqa.Column("name", sqa.String, nullable=False),
-    sqa.Column("path", sqa.Integer, nullable=False),
+    sqa.Column("name", sqa.String, nullable=False, index=True),
+    sqa.Column("path", sqa.String, nullable=False),
     sqa.Column("type_id", sqa.String, nullable=False),
+    sqa.Column("last_scanned", sqa.DateTime),
     sqa.UniqueConstraint("type_id", "path"),
 )
 """
@@ -86,6 +351,7 @@ A single model run
 :param name: Run name
 :param path: Base path of the run
 :param type_id: Experiment type, see :func:`experimentdb.model.experiment_factory`
+:param last_scanned: Start time of the last scan of the run
 """
 
 stream = sqa.Table(
@@ -93,10 +359,11 @@ stream = sqa.Table(
     metadata,
     sqa.Column("id", sqa.Integer, primary_key=True),
     sqa.Column("experiment_id", sqa.Integer, sqa.ForeignKey("experiment.id")),
-    sqa.Column("name", sqa.String, nullable=False),
+    sqa.Column("name", sqa.String, nullable=False, index=True),
     sqa.Column("time_units", sqa.String),
     sqa.Column("calendar", sqa.String),
     sqa.Column("last_seen", sqa.DateTime),
+    sqa.Column("template", sqa.Text),
     sqa.UniqueConstraint("experiment_id", "name"),
 )
 """
@@ -106,6 +373,11 @@ The stream is made up of multiple files, found in the 'file' table
 
 The stream is made up of multiple variables, present in all attached files,
 found in the 'variable' table
+
+The JSON 'template' describes the variables and non-time coordinates shared by
+all files, so that along with the file 'times' the stream can be opened
+without reading every file. Only the values of dimension and scalar
+coordinates are stored, others are read from the first file.
 """
 
 file = sqa.Table(
@@ -119,21 +391,41 @@ file = sqa.Table(
     sqa.Column("end_date", sqa.Float),
     sqa.Column("type_id", sqa.String, nullable=False),
     sqa.Column("last_seen", sqa.DateTime),
+    sqa.Column("size", sqa.Integer),
+    sqa.Column("mtime", sqa.Float),
+    sqa.Column("inode", sqa.Integer),
+    sqa.Column("times", sqa.LargeBinary),
+    sqa.Column("chunk_refs", sqa.LargeBinary),
+    sqa.Column("fields", sqa.LargeBinary),
     sqa.UniqueConstraint("stream_id", "relative_path"),
+    sqa.Index("ix_file_stream_id_start_date", "stream_id", "start_date"),
 )
 """
 A single file in the stream
 
 The file contains all the variables attached to the stream
+
+The size, mtime and inode of the file when it was last scanned are stored, so
+unchanged files can be skipped when rescanning
+
+The start and end dates and the 'times' of the file's time coordinate (as
+float64 bytes) are in the stream's time units
+
+The 'chunk_refs' are a zlib compressed JSON Kerchunk reference set, giving the
+byte ranges of the file's chunks
+
+The 'fields' of UM files are a zlib compressed array with a row for each field
+in the file, giving its STASH code, level, validity time (in the stream's time
+units) and where its data is, see :func:`edb.model.ff.field_index`
 """
 
 variable = sqa.Table(
     "variable",
     metadata,
     sqa.Column("id", sqa.Integer, primary_key=True),
-    sqa.Column("stream_id", sqa.Integer, sqa.ForeignKey("stream.id")),
+    sqa.Column("stream_id", sqa.Integer, sqa.ForeignKey("stream.id"), index=True),
     sqa.Column("name", sqa.String, nullable=False, index=True),
-    sqa.Column("long_name", sqa.String),
+    sqa.Column("long_name", sqa.String, index=True),
     sqa.Column("standard_name", sqa.String, index=True),
     sqa.Column("method", sqa.String),
     sqa.Column("time_resolution", sqa.String),
@@ -156,4 +448,59 @@ variable_fts = sqa.Table(
     sqa.Column("long_name", sqa.String),
     sqa.Column("standard_name", sqa.String),
     sqa.Column("variable_fts", sqa.String),
+    sqa.Column("rank", sqa.Float),
+)
+"""
+Word index of variable names, see :data:`fts_tables`
+"""
+
+variable_trigram = sqa.Table(
+    "variable_trigram",
+    metadata,
+    sqa.Column("rowid", sqa.Integer, sqa.ForeignKey("variable.id")),
+    sqa.Column("name", sqa.String),
+    sqa.Column("long_name", sqa.String),
+    sqa.Column("standard_name", sqa.String),
+    sqa.Column("variable_trigram", sqa.String),
+    sqa.Column("rank", sqa.Float),
+)
+"""
+Trigram index of variable names, see :data:`fts_tables`
+"""
+
+scan_history = sqa.Table(
+    "scan_history",
+    metadata,
+    sqa.Column("id", sqa.Integer, primary_key=True),
+    sqa.Column(
+        "experiment_id", sqa.Integer, sqa.ForeignKey("experiment.id"), index=True
+    ),
+    sqa.Column("started", sqa.DateTime, nullable=False, index=True),
+    sqa.Column("seconds", sqa.Float),
+    sqa.Column("metrics", sqa.Text),
 )
+"""
+A record of each time an experiment was scanned
+
+:param started: Start time of the scan
+:param seconds: Duration of the scan
+:param metrics: JSON counts of the files and streams found, and seconds spent
+    in each phase of the scan, see :meth:`ExperimentDB.scan`
+"""
+
+migrations: T.List[T.Callable[[sqa.engine.Connection], None]] = [
+    _migrate_baseline,
+    _migrate_scan_history,
+    _migrate_field_index,
+    _migrate_field_times,
+]
+"""
+Schema changes, each is applied once in order to bring a database up to the
+current schema, with the number applied stored as the SQLite 'user_version'
+
+To change the schema, update the table definitions and append a function
+making the same change to an existing database. New databases run every
+migration, starting from tables created with the current definitions, so
+migrations should check if their change is already present (e.g. by using
+:func:`_add_missing_columns` and :func:`_create_indexes`).
+"""
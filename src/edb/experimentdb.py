@@ -1,48 +1,75 @@
+from __future__ import annotations
+
 from .config import read_config
-from .model.experiment import experiment_factory, Experiment
-import sqlalchemy.orm as sqo
 import sqlalchemy as sqa
 from . import db
+from . import options
+from . import walk
+from .utils import LRUCache, timer
 import typing as T
 
-import glob
-import pandas
+import concurrent.futures
+import collections
+import contextlib
+import datetime
+import functools
+import json
 import logging
+import operator
 import os
-import xarray
+import re
+import time
+import zlib
 
-search_params = {
-    "experiment": {
-        "description": "experiment name",
-        "column": db.experiment.c.name,
-    },
-    "experiment_type": {
-        "description": "experiment type",
-        "column": db.experiment.c.type_id,
-    },
-    "stream": {
-        "description": "stream name",
-        "column": db.stream.c.name,
-    },
-    "variable": {"description": "variable text search", "special": "variable_fts"},
-    "variable_name": {
-        "description": "variable name",
-        "column": db.variable.c.name,
-    },
-    "variable_id": {
-        "description": "variable database id",
-        "column": db.variable.c.id,
-    },
-    "standard_name": {
-        "description": "variable cf standard_name",
-        "column": db.variable.c.standard_name,
+# The ORM model is imported as needed, searches only use the tables
+if T.TYPE_CHECKING:
+    import cftime
+    import numpy
+    import pandas
+    import sqlalchemy.orm as sqo
+    import xarray
+
+
+def _prefix_query(text: str) -> str:
+    """
+    Full text query matching words starting with each word of 'text'
+    """
+    return " ".join(_phrase_query(w) + "*" for w in text.split())
+
+
+def _phrase_query(text: str) -> str:
+    """
+    Full text query matching 'text' literally
+    """
+    return '"' + text.replace('"', '""') + '"'
+
+
+_search_columns = {
+    "experiment": {"column": db.experiment.c.name},
+    "experiment_type": {"column": db.experiment.c.type_id},
+    "stream": {"column": db.stream.c.name},
+    "variable": {"fts": db.variable_fts},
+    "variable_prefix": {
+        "fts": db.variable_fts,
+        "query": _prefix_query,
     },
-    "long_name": {
-        "description": "variable long_name",
-        "column": db.variable.c.long_name,
+    "variable_part": {
+        "fts": db.variable_trigram,
+        "query": _phrase_query,
     },
+    "variable_name": {"column": db.variable.c.name},
+    "variable_id": {"column": db.variable.c.id},
+    "standard_name": {"column": db.variable.c.standard_name},
+    "long_name": {"column": db.variable.c.long_name},
 }
 
+search_params = {
+    k: {"description": options.search_args[k], **v} for k, v in _search_columns.items()
+}
+"""
+Search arguments, filtering either a column or a full text index
+"""
+
 
 def document_search_args(func):
     """
@@ -66,19 +93,108 @@ def search_filter(sel: sqa.select, **kwargs):
     Args:
         {{search_args}}
     """
+    # Full text queries for each index
+    matches: T.Dict[sqa.Table, T.List[str]] = {}
+
     # Applies the filters listed in search_params
     for k, v in kwargs.items():
         if v is not None:
             if "column" in search_params[k]:
                 sel = sel.where(search_params[k]["column"] == v)
 
-            # Handle special filters
-            elif search_params[k]["special"] == "variable_fts":
-                sel = sel.where(db.variable_fts.c.variable_fts.match(v))
+            # Handle full text searches
+            else:
+                query = search_params[k].get("query", str)(v)
+                matches.setdefault(search_params[k]["fts"], []).append(query)
+
+    # The full text indexes are only joined if they are searched, with the
+    # best matches first
+    for table, queries in matches.items():
+        sel = (
+            _join(sel, table, table.c.rowid == db.variable.c.id)
+            .where(table.c[table.name].match(" AND ".join(f"({q})" for q in queries)))
+            .order_by(table.c.rank)
+        )
 
     return sel
 
 
+def _join(sel: sqa.select, table: sqa.Table, onclause) -> sqa.select:
+    """
+    Join a table to the FROM clause of a query
+
+    ``Select.join`` needs SQLAlchemy 1.4, older versions replace the query's
+    FROM with a join that contains it
+    """
+    if hasattr(sel, "join_from"):
+        return sel.join(table, onclause)
+
+    return sel.select_from(sel.froms[0].join(table, onclause))
+
+
+def _search_select(**kwargs) -> sqa.select:
+    """
+    Query for :meth:`ExperimentDB.search`
+    """
+    # Columns to return
+    sel = sqa.select(
+        [
+            db.experiment.c.name.label("experiment"),
+            db.stream.c.name.label("stream"),
+            db.variable.c.name.label("variable"),
+            db.variable.c.standard_name,
+            db.variable.c.long_name,
+            db.variable.c.time_resolution,
+            db.variable.c.id.label("variable_id"),
+        ]
+    ).select_from(db.experiment.join(db.stream).join(db.variable))
+
+    # Filter the search
+    return search_filter(sel, **kwargs)
+
+
+def _files_select(**kwargs) -> sqa.select:
+    """
+    Query for :meth:`ExperimentDB.files`, with the full path of each file
+    joined by the database
+    """
+    # As os.path.join, don't double up a trailing separator
+    exp_path = sqa.func.rtrim(db.experiment.c.path, "/")
+
+    # Columns to return
+    sel = sqa.select(
+        [
+            (exp_path + "/" + db.file.c.relative_path).label("path"),
+            db.variable.c.id.label("variable_id"),
+        ]
+    ).select_from(
+        db.experiment.join(db.stream)
+        .join(db.variable)
+        .join(db.file, db.file.c.stream_id == db.stream.c.id)
+    )
+
+    # Filter the search
+    return search_filter(sel, **kwargs)
+
+
+@contextlib.contextmanager
+def scan_map(workers: T.Optional[int] = None):
+    """
+    Context manager providing the map function used to probe files while
+    scanning
+
+    Args:
+        workers: Number of worker processes. If None or 1 files are probed
+            serially in this process
+    """
+    if workers is None or workers <= 1:
+        yield map
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(workers) as pool:
+        yield functools.partial(pool.map, chunksize=16)
+
+
 class ExperimentDB:
     """
     A database of numerical climate & weather experiments
@@ -98,52 +214,239 @@ class ExperimentDB:
         """
         self.config = read_config(config)
         if conn is None:
-            self.db = db.connect(self.config["database"])
+            self.db = db.connect(
+                self.config["database"],
+                self.config.get("sqlite"),
+                upgrade=self.config.get("auto upgrade", True),
+            )
         else:
             self.db = conn
-        self.session = sqo.Session(self.db)
 
-    def scan_all(self):
+        cache = self.config.get("cache", {})
+        self.cache = LRUCache(cache.get("arrays", 32))
+        self.open_files = _HandleCache(cache.get("open files", 128))
+
+    @functools.cached_property
+    def session(self) -> sqo.Session:
+        """
+        ORM session, created when first used
+        """
+        import sqlalchemy.orm as sqo
+
+        return sqo.Session(self.db)
+
+    def scan_all(
+        self, workers: T.Optional[int] = None, batch_size: T.Optional[int] = None
+    ) -> T.Counter[str]:
         """
         Scan all the paths listed in the config file
 
         It's expected that these paths will be globs, so doing a scan will find
         any new experiments
+
+        Args:
+            workers: Number of processes to use to probe files
+            batch_size: Number of rows written to the database per statement,
+                default from the 'scan batch size' config setting
+        Returns:
+            Counts of the experiments, files and streams found and updated, and
+            the seconds spent in each phase of the scan, see :meth:`scan`
         """
-        for p in self.config["scan paths"]:
-            self.scan(p["type"], p["path"])
+        if batch_size is None:
+            batch_size = self.config["scan batch size"]
 
-    def scan(self, type: str, path: str):
+        metrics = collections.Counter()
+        with scan_map(workers) as map:
+            for p in self.config["scan paths"]:
+                metrics.update(self._scan(p["type"], p["path"], map, batch_size))
+
+        logging.info("scan complete: %s", dict(metrics))
+        return metrics
+
+    def scan(
+        self,
+        type: str,
+        path: str,
+        workers: T.Optional[int] = None,
+        batch_size: T.Optional[int] = None,
+    ) -> T.Counter[str]:
         """
         Scan a path glob for new experiments, adding newly found experiments to
         the database and updating already known experiments
 
+        Files are probed and their variables identified by a pool of
+        ``workers`` processes, with the results committed to the database from
+        this process in batches of ``batch_size`` rows
+
+        The metrics of each experiment are also recorded in the database, see
+        :meth:`scan_history`. The seconds spent in each phase are:
+
+        - load: Reading the experiment's known files from the database
+        - list: Listing directories and checking known files for changes
+        - probe: Identifying the types of new files
+        - collect streams: Grouping files into streams
+        - identify: Reading the variables of new and changed streams
+        - templates, time ranges, references: Reading the other metadata of
+          new and changed files
+        - write, commit: Writing the results to the database
+
         Args:
             type: Experiment type name (see :func:`experiment_factory`)
             path: Path glob to scan
+            workers: Number of processes to use to probe files
+            batch_size: Number of rows written to the database per statement,
+                default from the 'scan batch size' config setting
+        Returns:
+            Counts of the experiments, files and streams found and updated, of
+            files that failed to be read, and the seconds spent in each phase
         """
-        for p in glob.glob(os.path.expanduser(path)):
-            try:
-                logging.debug("scanning path %s", p)
+        if batch_size is None:
+            batch_size = self.config["scan batch size"]
+
+        with scan_map(workers) as map:
+            metrics = self._scan(type, path, map, batch_size)
+
+        logging.info("scan complete: %s", dict(metrics))
+        return metrics
+
+    def _scan(
+        self, type: str, path: str, map: T.Callable, batch_size: int
+    ) -> T.Counter[str]:
+        import sqlalchemy.orm as sqo
+
+        from .bulk import write_experiment
+        from .model.experiment import Experiment, experiment_factory
+        from .model.stream import Stream
+
+        reidentify_age = datetime.timedelta(days=self.config.get("reidentify age", 30))
+
+        metrics = collections.Counter()
+        for p in walk.iglob(os.path.expanduser(path)):
+            logging.debug("scanning path %s", p)
+            started = datetime.datetime.now()
+            start = time.perf_counter()
+
+            exp_metrics = collections.Counter()
+
+            with timer(exp_metrics, "load"):
                 exp = (
-                    self.session.query(Experiment).filter_by(type_id=type, path=p).one()
+                    self.session.query(Experiment)
+                    .options(
+                        sqo.selectinload(Experiment.files),
+                        sqo.selectinload(Experiment.streams).selectinload(Stream.files),
+                        sqo.selectinload(Experiment.streams).selectinload(
+                            Stream.variables
+                        ),
+                    )
+                    .filter_by(type_id=type, path=p)
+                    .one_or_none()
                 )
-            except sqo.exc.NoResultFound:
-                exp = experiment_factory(type, p)
+                if exp is None:
+                    exp = experiment_factory(type, p)
+
+                # Work on the experiment outside of the session, it gets
+                # written to the database in bulk rather than through the ORM
+                self.session.expunge_all()
 
-            exp.update()
+            exp_metrics.update(
+                exp.update(
+                    map,
+                    references=self.config.get("scan references", False),
+                    reidentify_age=reidentify_age,
+                )
+            )
 
             if len(exp.files) > 0:
-                self.session.add(exp)
+                with timer(exp_metrics, "write"):
+                    exp_id = write_experiment(
+                        self.session.connection(), exp, batch_size
+                    )
 
                 # Commit the experiment to the database
-                self.session.commit()
+                with timer(exp_metrics, "commit"):
+                    self.session.commit()
+
+                self._record_scan(
+                    exp_id, started, time.perf_counter() - start, exp_metrics
+                )
+
+            metrics.update(exp_metrics)
+            metrics["experiments"] += 1
+
+        return metrics
+
+    def _record_scan(
+        self,
+        experiment_id: int,
+        started: datetime.datetime,
+        seconds: float,
+        metrics: T.Counter[str],
+    ):
+        """
+        Add a scan of an experiment to the 'scan_history' table
+        """
+        self.session.connection().execute(
+            db.scan_history.insert().values(
+                experiment_id=experiment_id,
+                started=started,
+                seconds=seconds,
+                metrics=json.dumps(dict(metrics)),
+            )
+        )
+        self.session.commit()
+
+    def scan_history(
+        self, since: T.Optional[datetime.datetime] = None
+    ) -> pandas.DataFrame:
+        """
+        List the recorded scans of each experiment, most recent first
+
+        The counts and seconds spent in each phase of the scan are returned as
+        columns, see :meth:`scan`
+
+        Args:
+            since: Only list scans started at or after this time
+        """
+        import pandas
+
+        sel = (
+            sqa.select(
+                [
+                    db.scan_history.c.id,
+                    db.experiment.c.name.label("experiment"),
+                    db.scan_history.c.started,
+                    db.scan_history.c.seconds,
+                    db.scan_history.c.metrics,
+                ]
+            )
+            .select_from(db.scan_history.join(db.experiment))
+            .order_by(db.scan_history.c.started.desc())
+        )
+        if since is not None:
+            sel = sel.where(db.scan_history.c.started >= since)
+
+        df = pandas.read_sql(sel, self.db, index_col="id", parse_dates=["started"])
+        # Metrics missing from a scan's counts are zero
+        metrics = pandas.DataFrame(
+            [json.loads(m) for m in df.pop("metrics")], index=df.index
+        )
+        return df.join(metrics.fillna(0))
 
     def experiments(self) -> pandas.DataFrame:
         """
         List the known experiments in the database
         """
-        return pandas.read_sql(sqa.select([db.experiment]), self.db, index_col="id")
+        import pandas
+
+        sel = sqa.select(
+            [
+                db.experiment.c.id,
+                db.experiment.c.name,
+                db.experiment.c.path,
+                db.experiment.c.type_id,
+            ]
+        )
+        return pandas.read_sql(sel, self.db, index_col="id")
 
     def query(self, *args) -> sqo.Query:
         """
@@ -154,8 +457,32 @@ class ExperimentDB:
         """
         return self.session.query(*args)
 
+    def _check_search(self, kwargs):
+        """
+        Raise an error if a search needs a full text index this database
+        doesn't have, e.g. 'variable_part' with SQLite older than 3.34
+        """
+        for k, v in kwargs.items():
+            table = search_params.get(k, {}).get("fts")
+            if v is None or table is None:
+                continue
+
+            exists = self.db.execute(
+                sqa.text(
+                    "SELECT 1 FROM sqlite_master "
+                    "WHERE type = 'table' AND name = :name"
+                ),
+                {"name": table.name},
+            ).scalar()
+            if exists is None:
+                raise ValueError(
+                    f"'{k}' searches are not available, the database has no "
+                    f"'{table.name}' index (needs SQLite 3.34 or newer, "
+                    f"have {db.sqlite_version(self.db)})"
+                )
+
     @document_search_args
-    def search(self, /, **kwargs) -> pandas.DataFrame:
+    def search(self, /, limit: T.Optional[int] = None, **kwargs) -> pandas.DataFrame:
         """
         Perform a search of experiments/streams/variables in the database
 
@@ -163,31 +490,43 @@ class ExperimentDB:
         `files(variable_id=ID)` to list the files containing the variable or
         `open_dataarray(variable_id=ID)` to open the files
 
+        Text searches return the best matches first
+
         Args:
+            limit: Maximum number of results
             {{search_args}}
         """
-        # Columns to return
-        sel = sqa.select(
-            [
-                db.experiment.c.name.label("experiment"),
-                db.stream.c.name.label("stream"),
-                db.variable.c.name.label("variable"),
-                db.variable.c.standard_name,
-                db.variable.c.long_name,
-                db.variable.c.time_resolution,
-                db.variable.c.id.label("variable_id"),
-            ]
-        ).select_from(
-            db.experiment.join(db.stream).join(db.variable).join(db.variable_fts)
+        import pandas
+
+        self._check_search(kwargs)
+        return pandas.read_sql(
+            _search_select(**kwargs).limit(limit),
+            self.db,
+            index_col="variable_id",
         )
 
-        # Filter the search
-        sel = search_filter(sel, **kwargs)
+    @document_search_args
+    def iter_search(
+        self, /, chunksize: int = 10000, limit: T.Optional[int] = None, **kwargs
+    ) -> T.Iterator[pandas.DataFrame]:
+        """
+        Streaming version of :meth:`search`, yielding the results in chunks
+        read from the database cursor so memory use doesn't depend on the
+        number of results
 
+        Args:
+            chunksize: Number of rows in each chunk
+            limit: Maximum number of results
+            {{search_args}}
+        """
+        import pandas
+
+        self._check_search(kwargs)
         return pandas.read_sql(
-            sel,
+            _search_select(**kwargs).limit(limit),
             self.db,
             index_col="variable_id",
+            chunksize=chunksize,
         )
 
     @document_search_args
@@ -201,38 +540,64 @@ class ExperimentDB:
         Args:
             {{search_args}}
         """
-        # Columns to return
-        sel = sqa.select(
-            [
-                db.experiment.c.path,
-                db.file.c.relative_path,
-                db.variable.c.id.label("variable_id"),
-            ]
-        ).select_from(
-            db.experiment.join(db.stream)
-            .join(db.variable)
-            .join(db.variable_fts)
-            .join(db.file, db.file.c.stream_id == db.stream.c.id)
+        import pandas
+
+        self._check_search(kwargs)
+        return pandas.read_sql(
+            _files_select(**kwargs),
+            self.db,
+            index_col="variable_id",
         )
 
-        # Filter the search
-        sel = search_filter(sel, **kwargs)
+    @document_search_args
+    def iter_files(
+        self, /, chunksize: int = 10000, **kwargs
+    ) -> T.Iterator[pandas.DataFrame]:
+        """
+        Streaming version of :meth:`files`, yielding the results in chunks
+        read from the database cursor so memory use doesn't depend on the
+        number of results
+
+        The full paths are built by the database
 
-        df = pandas.read_sql(
-            sel,
+        Args:
+            chunksize: Number of rows in each chunk
+            {{search_args}}
+        """
+        import pandas
+
+        self._check_search(kwargs)
+        return pandas.read_sql(
+            _files_select(**kwargs),
             self.db,
             index_col="variable_id",
+            chunksize=chunksize,
         )
 
-        return df.apply(
-            lambda row: {"path": os.path.join(row.path, row.relative_path)},
-            axis=1,
-            result_type="expand",
-        )
+    @document_search_args
+    def iter_paths(self, /, **kwargs) -> T.Iterator[T.Tuple[int, str]]:
+        """
+        Like :meth:`iter_files`, but yields plain (variable_id, path) tuples
+        straight from the database cursor without going through pandas
+
+        Args:
+            {{search_args}}
+        """
+        self._check_search(kwargs)
+        result = self.db.execute(_files_select(**kwargs))
+        try:
+            for path, variable_id in result:
+                yield variable_id, path
+        finally:
+            result.close()
 
     @document_search_args
     def open_dataarrays(
-        self, vars: pandas.DataFrame = None, time: slice = None, **kwargs
+        self,
+        vars: pandas.DataFrame = None,
+        time: slice = None,
+        lazy: bool = False,
+        **kwargs,
     ) -> pandas.Series:
         """
         Open variables as xarray objects
@@ -254,8 +619,18 @@ class ExperimentDB:
                   be the database id of the variable (as  is returned by
                   :meth:`search`)
             time: time slice to open
+            lazy: open NetCDF files together as a dask-backed array, without
+                  reading any data until it is computed
             {{search_args}}
+
+        Recently opened dask-backed variables (UM variables, or NetCDF
+        variables opened with 'lazy') are cached, the number kept is set by the
+        'cache: arrays' config setting and the number of UM files kept open by
+        'cache: open files', see :meth:`cache_info`. NetCDF files are kept
+        open by xarray, see its 'file_cache_maxsize' option.
         """
+        import numpy
+        import pandas
 
         if vars is None:
             vars = self.search(**kwargs)
@@ -263,9 +638,108 @@ class ExperimentDB:
             search_vars = self.search(**kwargs)
             vars = pandas.merge(vars, search_vars, how="inner")
 
-        results = [_open_var_id(self.db, id, time) for id in vars.index]
+        # Fill the series element by element, numpy would otherwise try to
+        # convert each DataArray into an array, loading all its data
+        results = numpy.empty(len(vars.index), dtype=object)
+        for i, id in enumerate(vars.index):
+            results[i] = self._open_cached(int(id), time, lazy)
+
         return pandas.Series(results, index=vars.index)
 
+    def _open_cached(
+        self, variable_id: int, time: T.Optional[slice], lazy: bool
+    ) -> xarray.DataArray:
+        """
+        Open a variable with :func:`_open_var_id`, or return it from the cache
+        if it was opened recently and its experiment hasn't been scanned since
+
+        Only dask-backed variables are cached. Changing their values in place
+        gives the copy a new dask array, while eager variables would share
+        their data with the cache. Eager NetCDF variables don't use the cache
+        at all, so they don't count as misses.
+        """
+        has_netcdf = (
+            sqa.select([db.file.c.id])
+            .where(db.file.c.stream_id == db.variable.c.stream_id)
+            .where(db.file.c.type_id == "netcdf")
+            .limit(1)
+        )
+        last_scanned, netcdf = self.db.execute(
+            sqa.select([db.experiment.c.last_scanned, sqa.exists(has_netcdf)])
+            .select_from(db.experiment.join(db.stream).join(db.variable))
+            .where(db.variable.c.id == variable_id)
+        ).fetchone()
+
+        key = (variable_id, last_scanned, lazy)
+        if time is not None:
+            key += (time.start, time.stop, time.step)
+
+        try:
+            hash(key)
+        except TypeError:
+            # e.g. a time slice of arrays, don't cache
+            key = None
+
+        if key is None or (netcdf and not lazy):
+            return _open_var_id(self.db, variable_id, time, lazy, self.open_files)
+
+        da = self.cache.get(key)
+        if da is None:
+            da = _open_var_id(self.db, variable_id, time, lazy, self.open_files)
+            if da.chunks is None:
+                return da
+            self.cache.put(key, da)
+
+        # Changes to the result's attributes shouldn't change the cached copy
+        return da.copy(deep=False)
+
+    def cache_info(self) -> T.Dict[str, T.Dict[str, int]]:
+        """
+        Statistics of the caches used when opening variables
+
+        Returns:
+            Hits, misses and sizes of the 'arrays' cache of recently opened
+            variables and the 'open files' cache of UM files, see
+            :meth:`edb.utils.LRUCache.stats`. NetCDF files are kept open by
+            xarray.
+        """
+        return {"arrays": self.cache.stats(), "open files": self.open_files.stats()}
+
+    def references(
+        self, variable_id: int, time: slice = None
+    ) -> T.Optional[T.Dict[str, T.Any]]:
+        """
+        Kerchunk reference set for the NetCDF files containing a variable
+
+        References are built when scanning if the 'scan references' setting is
+        enabled. The result can be saved as JSON and opened by other tools
+        with fsspec's 'reference://' filesystem
+
+        Args:
+            variable_id: Database id of the variable (as is returned by
+                  :meth:`search`)
+            time: Only include files overlapping this time slice
+
+        Returns:
+            The combined references of the files in time order, or None if any
+            file doesn't have references
+        """
+        files = _variable_files(self.db, variable_id, time)
+
+        template = self.db.execute(
+            sqa.select([db.stream.c.template])
+            .select_from(db.stream.join(db.variable))
+            .where(db.variable.c.id == variable_id)
+        ).scalar()
+
+        refs = self.db.execute(
+            files.with_only_columns([db.file.c.chunk_refs]).where(
+                db.file.c.type_id == "netcdf"
+            )
+        )
+
+        return _combine_references([r for r, in refs], template)
+
     @document_search_args
     def open_dataarray(self, **kwargs) -> xarray.DataArray:
         """
@@ -287,13 +761,141 @@ class ExperimentDB:
 
 
 def _open_var_id(
-    conn: sqa.engine.Connection, variable_id: int, time: slice = None
+    conn: sqa.engine.Connection,
+    variable_id: int,
+    time: slice = None,
+    lazy: bool = False,
+    open_files: T.Optional[LRUCache] = None,
 ) -> xarray.DataArray:
     """
     Open the files for a specific variable_id
+
+    If 'time' is given only files overlapping that time range are opened. UM
+    files whose field index shows they don't contain the variable are skipped.
+
+    If 'lazy' is true NetCDF files are opened as a dask-backed array, from the
+    stream's chunk references with :func:`_open_references` or template with
+    :func:`_open_template` if they are available, or else with
+    :func:`_open_mfdataarray`. Otherwise each file is opened and concatenated.
+
+    UM files are always dask-backed, assembled from their field indexes with
+    :func:`_open_um`, or else loaded with iris. The files are kept open in
+    'open_files' while the array is in use, a new cache is used if it is None.
+
+    Raises a ValueError if no files of the variable overlap 'time'.
+    """
+    import xarray
+
+    files = _variable_files(conn, variable_id, time)
+
+    template, units, calendar = conn.execute(
+        sqa.select([db.stream.c.template, db.stream.c.time_units, db.stream.c.calendar])
+        .select_from(db.stream.join(db.variable))
+        .where(db.variable.c.id == variable_id)
+    ).fetchone()
+
+    # NetCDF streams may name their time dimension something else, e.g.
+    # 'time_counter', which was found when the stream was scanned
+    time_dim = "time" if template is None else json.loads(template)["time"]
+
+    das = []
+    nc_files = []
+    um_files = []
+    for row in conn.execute(files):
+        path, rel_path, type, start, end, times, varname = row[:7]
+        path = os.path.join(path, rel_path)
+
+        if type == "netcdf":
+            if lazy:
+                nc_files.append((path, times))
+                continue
+
+            da = xarray.open_dataset(path)[varname]
+        else:
+            fields = _variable_fields(row.fields, varname, row.method)
+            if fields is not None and len(fields) == 0:
+                continue
+
+            um_files.append((path, row.mtime, fields))
+            continue
+
+        das.append(da)
+
+    if len(nc_files) > 0:
+        refs = _combine_references(
+            [
+                r
+                for r, in conn.execute(
+                    files.with_only_columns([db.file.c.chunk_refs]).where(
+                        db.file.c.type_id == "netcdf"
+                    )
+                )
+            ],
+            template,
+        )
+
+        if refs is not None:
+            da = _open_references(refs, varname)
+        else:
+            da = _open_template(nc_files, varname, template, units, calendar)
+        if da is None:
+            da = _open_mfdataarray([path for path, _ in nc_files], varname, time_dim)
+
+        das.append(da)
+
+    if len(um_files) > 0:
+        calendar, long_name, standard_name, units = conn.execute(
+            sqa.select(
+                [
+                    db.stream.c.calendar,
+                    db.variable.c.long_name,
+                    db.variable.c.standard_name,
+                    db.variable.c.units,
+                ]
+            )
+            .select_from(db.stream.join(db.variable))
+            .where(db.variable.c.id == variable_id)
+        ).fetchone()
+
+        attrs = {
+            "STASH": varname,
+            "long_name": long_name,
+            "standard_name": standard_name,
+            "units": units,
+        }
+
+        if open_files is None:
+            open_files = _HandleCache(128)
+        da = _open_um(um_files, varname, calendar, attrs, open_files)
+        if da is None:
+            da = _open_iris([path for path, _, _ in um_files], varname)
+
+        das.append(da)
+
+    if len(das) == 0:
+        if time is not None:
+            raise ValueError(
+                f"No data for variable {variable_id} between {time.start} and "
+                f"{time.stop}"
+            )
+        raise ValueError(f"No files found for variable {variable_id}")
+
+    da = xarray.concat(das, dim=time_dim)
+
+    if time is not None:
+        da = da.sel({time_dim: time})
+
+    return da
+
+
+def _variable_files(
+    conn: sqa.engine.Connection, variable_id: int, time: slice = None
+) -> sqa.select:
     """
+    Query the files containing a variable, in time order
 
-    # Find the files for this variable
+    If 'time' is given only files overlapping that time range are returned
+    """
     files = (
         sqa.select(
             [
@@ -302,7 +904,11 @@ def _open_var_id(
                 db.file.c.type_id,
                 db.file.c.start_date,
                 db.file.c.end_date,
+                db.file.c.times,
                 db.variable.c.name,
+                db.variable.c.method,
+                db.file.c.fields,
+                db.file.c.mtime,
             ]
         )
         .select_from(db.experiment.join(db.stream).join(db.file).join(db.variable))
@@ -310,19 +916,522 @@ def _open_var_id(
         .order_by(db.file.c.start_date)
     )
 
+    if time is not None:
+        files = _filter_time(conn, files, variable_id, time)
+
+    return files
+
+
+def _variable_fields(
+    fields: T.Optional[bytes], name: str, method: str
+) -> T.Optional[numpy.ndarray]:
+    """
+    Fields of a variable from a UM file's stored field index
+
+    Returns:
+        The variable's rows of the index, see :func:`ff.field_index`, or None
+        if the file has no index
+    """
+    if fields is None:
+        return None
+
+    from .model import ff
+
+    index = ff.load_field_index(zlib.decompress(fields))
+    return ff.select_fields(index, name, method)
+
+
+def _combine_references(
+    refs: T.List[T.Optional[bytes]], template: T.Optional[str]
+) -> T.Optional[T.Dict[str, T.Any]]:
+    """
+    Combine the stored chunk references of each file in a stream into a
+    single reference set, concatenated along time
+
+    Args:
+        refs: Stored references of each file, see
+              :meth:`edb.model.file.File.identify_references`
+        template: Stream template, used to find the time dimension and the
+              coordinates shared by all files
+
+    Returns:
+        The combined references, or None if any file doesn't have references
+    """
+    if len(refs) == 0 or any(r is None for r in refs):
+        return None
+
+    from kerchunk.combine import MultiZarrToZarr
+
+    time_dim = "time"
+    identical_dims = []
+    if template is not None:
+        template = json.loads(template)
+        time_dim = template["time"]
+        identical_dims = list(template["coords"])
+
+    return MultiZarrToZarr(
+        [json.loads(zlib.decompress(r)) for r in refs],
+        concat_dims=[time_dim],
+        identical_dims=identical_dims,
+    ).translate()
+
+
+def _open_references(refs: T.Dict[str, T.Any], varname: str) -> xarray.DataArray:
+    """
+    Lazily open a variable through a zarr reference filesystem
+
+    The file metadata comes from the references, so files are only opened to
+    read the chunks that are computed
+    """
+    import xarray
+
+    ds = xarray.open_dataset(
+        "reference://",
+        engine="zarr",
+        chunks={},
+        backend_kwargs={"consolidated": False, "storage_options": {"fo": refs}},
+    )
+
+    return ds[varname]
+
+
+def _open_mfdataarray(
+    paths: T.List[str], varname: str, time_dim: str = "time"
+) -> xarray.DataArray:
+    """
+    Lazily open a variable from multiple NetCDF files in the same stream
+
+    Files in a stream share the same structure, so only the time coordinate is
+    concatenated along 'time_dim' and the other coordinates are taken from the
+    first file. File metadata is read in parallel with dask.
+    """
+    import xarray
+
+    ds = xarray.open_mfdataset(
+        paths,
+        combine="nested",
+        concat_dim=time_dim,
+        preprocess=operator.itemgetter([varname]),
+        data_vars="minimal",
+        coords="minimal",
+        compat="override",
+        join="override",
+        parallel=True,
+        chunks={},
+    )
+
+    return ds[varname]
+
+
+def _decode_times(
+    time_dim: str, times: T.List[numpy.ndarray], attrs: T.Dict[str, T.Any]
+) -> xarray.DataArray:
+    """
+    Decode the stored times of each file in a stream to a single time
+    coordinate, the same way as :func:`xarray.open_dataset`
+
+    Args:
+        time_dim: Name of the time dimension
+        times: Raw time values of each file
+        attrs: Time attributes, including 'units' and 'calendar'
+
+    Returns:
+        The decoded time coordinate
+    """
+    import numpy
+    import xarray
+
+    ds = xarray.Dataset(coords={time_dim: (time_dim, numpy.concatenate(times), attrs)})
+    return xarray.decode_cf(ds)[time_dim]
+
+
+def _open_template(
+    files: T.List[T.Tuple[str, bytes]],
+    varname: str,
+    template: T.Optional[str],
+    units: str,
+    calendar: str,
+) -> T.Optional[xarray.DataArray]:
+    """
+    Assemble a lazy variable from a stream's template and the times of each
+    file stored in the database, without opening any of the files
+
+    Each file is only read when its chunk is computed.
+
+    Args:
+        files: Path and stored times of each file in the stream
+        varname: Variable to open
+        template: Stream template, see :meth:`edb.model.file.File.identify_template`
+        units: Stream time units
+        calendar: Stream calendar
+
+    Returns:
+        The variable, or None if the stream template or file times are not known
+    """
+    import dask
+    import dask.array
+    import numpy
+    import xarray
+
+    if template is None or any(times is None for _, times in files):
+        return None
+
+    template = json.loads(template)
+    var = template["variables"].get(varname)
+    if var is None:
+        return None
+
+    time_dim = template["time"]
+    axis = var["dims"].index(time_dim)
+
+    chunks = []
+    times = []
+    for path, t in files:
+        t = numpy.frombuffer(t, dtype="f8")
+        shape = list(var["shape"])
+        shape[axis] = len(t)
+
+        chunks.append(
+            dask.array.from_delayed(
+                dask.delayed(_read_variable)(path, varname),
+                shape=shape,
+                dtype=var["dtype"],
+            )
+        )
+        times.append(t)
+
+    time = _decode_times(
+        time_dim,
+        times,
+        {**template["time_attrs"], "units": units, "calendar": calendar},
+    )
+
+    coords = {
+        k: v
+        for k, v in template["coords"].items()
+        if set(v["dims"]) <= set(var["dims"])
+    }
+
+    # Coordinates without stored values come from the first file
+    missing = [k for k, v in coords.items() if "data" not in v]
+    values = _read_coords(files[0][0], missing) if missing else {}
+
+    coords = {
+        k: (v["dims"], v["data"] if k not in missing else values[k], v["attrs"])
+        for k, v in coords.items()
+    }
+    coords[time_dim] = time
+
+    return xarray.DataArray(
+        dask.array.concatenate(chunks, axis=axis),
+        dims=var["dims"],
+        coords=coords,
+        attrs=var["attrs"],
+        name=varname,
+    )
+
+
+def _open_um(
+    files: T.List[T.Tuple[str, T.Optional[float], T.Optional[numpy.ndarray]]],
+    varname: str,
+    calendar: T.Optional[str],
+    attrs: T.Dict[str, T.Any],
+    open_files: _HandleCache,
+) -> T.Optional[xarray.DataArray]:
+    """
+    Assemble a lazy variable from the field index of each UM file stored in
+    the database, without opening any of the files
+
+    Each file is a chunk, which only reads the variable's fields from the file
+    when it is computed. The time and level axes come from the field index,
+    and the latitude and longitude from the grid of regular grids.
+
+    Args:
+        files: Path, scanned mtime and the variable's fields of each file,
+            see :func:`_variable_fields`
+        varname: STASH code of the variable
+        calendar: Stream calendar
+        attrs: Attributes of the result, None values are skipped
+        open_files: Cache of open files used when reading
+
+    Returns:
+        The variable, or None if a file has no field index, the fields can't be
+        read or they don't form a regular array
+    """
+    import dask
+    import dask.array
+    import numpy
+    import xarray
+
+    from .model import ff
+    from .model.stream import Stream
+
+    if calendar is None or any(f is None for _, _, f in files):
+        return None
+
+    every = numpy.concatenate([f for _, _, f in files])
+
+    # All fields must be on the same grid, and readable
+    grid = ["lbrow", "lbnpt", "lbuser1", "bzy", "bdy", "bzx", "bdx"]
+    if any(len(numpy.unique(every[k])) > 1 for k in grid):
+        return None
+    if not all(ff.can_unpack(int(p)) for p in numpy.unique(every["lbpack"])):
+        return None
+    if numpy.isnan(ff.field_times(every)).any():
+        return None
+
+    # Levels of the first file, which each time should have
+    first = files[0][2]
+    levels = numpy.unique(numpy.stack([first["lblev"], first["blev"]], axis=-1), axis=0)
+    nlev = len(levels)
+
+    field = every[0]
+    rows = int(field["lbrow"])
+    cols = int(field["lbnpt"])
+    dtype = "f8" if field["lbuser1"] == 1 else "i8"
+
+    # One task per file, building the graph directly is much faster than
+    # concatenating a dask array per file
+    name = "open_um-" + dask.base.tokenize(
+        [(path, mtime) for path, mtime, _ in files], every.tobytes(), varname
+    )
+    graph = {}
+    times = []
+    for i, (path, mtime, fields) in enumerate(files):
+        # Order by time then level
+        fields = fields[
+            numpy.lexsort((fields["blev"], fields["lblev"], ff.field_times(fields)))
+        ]
+        t = numpy.unique(ff.field_times(fields))
+
+        if len(fields) != len(t) * nlev:
+            return None
+        lev = numpy.stack([fields["lblev"], fields["blev"]], axis=-1)
+        if (lev.reshape(len(t), nlev, 2) != levels).any():
+            return None
+
+        graph[(name, i, 0, 0, 0)] = (
+            _read_fields,
+            open_files,
+            path,
+            mtime,
+            fields,
+            (len(t), nlev, rows, cols),
+        )
+        times.append(t)
+
+    data = dask.array.Array(
+        graph,
+        name,
+        chunks=(tuple(len(t) for t in times), (nlev,), (rows,), (cols,)),
+        dtype=dtype,
+    )
+
+    time = _decode_times(
+        "time", times, {"units": Stream.default_time_units, "calendar": calendar}
+    )
+
+    coords = {"time": time, "level": ("level", levels[:, 1])}
+    if field["bdy"] != 0 and field["bdx"] != 0:
+        coords["latitude"] = field["bzy"] + field["bdy"] * numpy.arange(1, rows + 1)
+        coords["longitude"] = field["bzx"] + field["bdx"] * numpy.arange(1, cols + 1)
+
+    da = xarray.DataArray(
+        data,
+        dims=["time", "level", "latitude", "longitude"],
+        coords=coords,
+        attrs={k: v for k, v in attrs.items() if v is not None},
+        name=varname,
+    )
+
+    # Single level fields have no level dimension, like iris
+    if nlev == 1:
+        da = da.isel(level=0, drop=True)
+
+    return da
+
+
+class _Handle:
+    """
+    A file opened for reading with :func:`os.pread`, closed once unused
+    """
+
+    def __init__(self, path: str):
+        self.fd = os.open(path, os.O_RDONLY)
+
+    def __del__(self):
+        # Not set if opening failed
+        if hasattr(self, "fd"):
+            os.close(self.fd)
+
+
+class _HandleCache(LRUCache):
+    """
+    Open UM files, by path and scanned mtime so replaced files are opened
+    again. Evicted files are closed when no read is using them.
+
+    Open files can't be shared between processes, so this pickles as an empty
+    cache
+    """
+
+    def __reduce__(self):
+        return type(self), (self.maxsize,)
+
+
+def _read_fields(
+    open_files: _HandleCache,
+    path: str,
+    mtime: T.Optional[float],
+    fields: numpy.ndarray,
+    shape: T.Tuple[int, ...],
+) -> numpy.ndarray:
+    """
+    Read fields from a UM file, see :func:`ff.unpack_field`
+    """
+    import numpy
+
+    from .model import ff
+
+    handle = open_files.get((path, mtime))
+    if handle is None:
+        handle = _Handle(path)
+        open_files.put((path, mtime), handle)
+
+    data = [
+        ff.unpack_field(
+            os.pread(handle.fd, int(field["size"]), int(field["offset"])), field
+        )
+        for field in fields
+    ]
+
+    return numpy.stack(data).reshape(shape)
+
+
+def _open_iris(paths: T.List[str], varname: str) -> xarray.DataArray:
+    """
+    Load a variable from UM files with iris
+    """
+    import iris
+    import xarray
+
     das = []
-    for path, rel_path, type, start, end, varname in conn.execute(files):
-        path = os.path.join(path, rel_path)
+    for path in paths:
+        cubes = iris.load_cubes(path, iris.AttributeConstraint(STASH=varname))
+        # TODO: handle multiple matches
+        das.append(xarray.DataArray.from_iris(cubes[0]))
 
-        if type == "netcdf":
-            da = xarray.open_dataset(path)[varname]
+    return xarray.concat(das, dim="time")
+
+
+def _read_coords(path: str, names: T.List[str]) -> T.Dict[str, numpy.ndarray]:
+    """
+    Read the values of coordinates from a NetCDF file
+    """
+    import xarray
+
+    with xarray.open_dataset(path) as ds:
+        return {k: ds[k].values for k in names}
+
+
+def _read_variable(path: str, varname: str) -> numpy.ndarray:
+    """
+    Read the values of a variable from a NetCDF file
+    """
+    import xarray
+
+    with xarray.open_dataset(path) as ds:
+        return ds[varname].values
+
+
+def _filter_time(
+    conn: sqa.engine.Connection, sel: sqa.select, variable_id: int, time: slice
+) -> sqa.select:
+    """
+    Filter a query on the file table to files overlapping a time slice
+
+    A partial date string covers its whole period, so as with xarray's
+    :meth:`sel` a stop of '1991' includes all of 1991. Files without a known
+    time range are always included.
+    """
+    units, calendar = conn.execute(
+        sqa.select([db.stream.c.time_units, db.stream.c.calendar])
+        .select_from(db.stream.join(db.variable))
+        .where(db.variable.c.id == variable_id)
+    ).fetchone()
+
+    if units is None:
+        return sel
+
+    if time.start is not None:
+        start = _date_number(time.start, units, calendar)
+        sel = sel.where(
+            sqa.or_(db.file.c.end_date.is_(None), db.file.c.end_date >= start)
+        )
+
+    if time.stop is not None:
+        if isinstance(time.stop, str):
+            stop = _date_number(_period_end(time.stop, calendar), units, calendar)
+            before = db.file.c.start_date < stop
         else:
-            import iris
+            stop = _date_number(time.stop, units, calendar)
+            before = db.file.c.start_date <= stop
+        sel = sel.where(sqa.or_(db.file.c.start_date.is_(None), before))
 
-            cubes = iris.load_cubes(path, iris.AttributeConstraint(STASH=varname))
-            # TODO: handle multiple matches
-            da = xarray.DataArray.from_iris(cubes[0])
+    return sel
 
-    das.append(da)
 
-    return xarray.concat(das, dim="time")
+def _period_end(date: str, calendar: str) -> cftime.datetime:
+    """
+    End of the period given by a partial ISO format date string, e.g. the end
+    of 1991 for '1991', the same as pandas' partial string indexing
+
+    Returns:
+        The start of the next period, which is not in the period itself
+    """
+    import cftime
+
+    fields = [int(x) for x in re.findall(r"\d+", date)[:6]]
+
+    if len(fields) == 1:
+        return cftime.datetime(fields[0] + 1, 1, 1, calendar=calendar)
+    if len(fields) == 2:
+        year, month = fields
+        return cftime.datetime(year + month // 12, month % 12 + 1, 1, calendar=calendar)
+
+    step = ["days", "hours", "minutes", "seconds"][len(fields) - 3]
+    start = cftime.datetime(*fields, calendar=calendar)
+    return start + datetime.timedelta(**{step: 1})
+
+
+def _date_number(date, units: str, calendar: str) -> float:
+    """
+    Convert a date to a number in the given units and calendar
+
+    Args:
+        date: A cftime or datetime-like object (e.g. datetime.datetime or
+            numpy.datetime64), or an ISO format string like '1990-01-01'
+    """
+    import cftime
+
+    if isinstance(date, str):
+        fields = [int(x) for x in re.findall(r"\d+", date)[:6]]
+        fields += [1] * (3 - len(fields))
+        date = cftime.datetime(*fields, calendar=calendar)
+
+    elif not isinstance(date, cftime.datetime):
+        import pandas
+
+        # Also accepts numpy.datetime64, as xarray's sel does
+        date = pandas.Timestamp(date)
+        date = cftime.datetime(
+            date.year,
+            date.month,
+            date.day,
+            date.hour,
+            date.minute,
+            date.second,
+            date.microsecond,
+            calendar=calendar,
+        )
+
+    return float(cftime.date2num(date, units, calendar))
@@ -1,23 +1,99 @@
 from __future__ import annotations
 
+import collections
+import fnmatch
+import functools
+import json
 import os
 import typing as T
 import pathlib
-from glob import glob
+import zlib
 import logging
-from ..file import file_factory
-from datetime import datetime
-from itertools import chain
+from ..file import File, file_class, file_type
+from ... import walk
+from ...utils import timer
+from datetime import datetime, timedelta
 
 from ..stream import Stream
 
 if T.TYPE_CHECKING:
-    from ..file import File
+    from ..variable import Variable
+
+# Allowance for clock skew and coarse timestamps between the filesystem and this
+# host when checking if a directory has changed since the last scan
+mtime_margin = timedelta(minutes=1)
+
+# Default age after which a stream's variables are identified again, even if its
+# files haven't changed
+reidentify_age = timedelta(days=30)
+
+
+class FileError(T.NamedTuple):
+    """
+    Returned by :func:`_file_method` if the method raised an error
+    """
+
+    relative_path: str
+    message: str
+
+
+def _file_method(method: str, exp_path: str, type: str, relative_path: str):
+    """
+    Call 'method' on a single file of an experiment, e.g. 'identify_variables'
+
+    This only needs plain values, so it can be run in a process pool
+
+    Returns:
+        The result of the method, or a :class:`FileError` if it failed so
+        that one bad file doesn't stop the scan
+    """
+    exp = Experiment(exp_path)
+    try:
+        return getattr(file_class(type)(relative_path, exp), method)()
+    except Exception as e:
+        logging.warning("%s failed for %s: %s", method, relative_path, e)
+        return FileError(relative_path, str(e))
+
+
+def _probe_file(
+    exp_path: str, relative_path: str
+) -> T.Union[T.Tuple[str, T.Optional[os.stat_result], T.Optional[str]], FileError]:
+    """
+    Stat a new file of an experiment and identify its type
+
+    This only needs plain values, so it can be run in a process pool
+
+    Returns:
+        The relative path, stat result and :func:`file_type` of the file, with
+        a type of None if the file is missing or not recognised, or a
+        :class:`FileError` if it couldn't be checked, e.g. permission denied
+    """
+    path = os.path.join(exp_path, relative_path)
+
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return relative_path, None, None
+    except OSError as e:
+        logging.warning("cannot stat %s: %s", path, e)
+        return FileError(relative_path, str(e))
+
+    return relative_path, st, file_type(path)
+
+
+def _json_default(obj):
+    """
+    Convert numpy values in file attributes to JSON
+    """
+    if hasattr(obj, "tolist"):
+        return obj.tolist()
+    return str(obj)
 
 
 class Experiment:
     type: T.Optional[str] = None
     file_pattern: T.Union[str, T.List[str]] = "*"
+    last_scanned: T.Optional[datetime]
 
     def __init__(self, path: T.Union[str, pathlib.Path]):
         self.name: str = os.path.basename(path)
@@ -25,38 +101,165 @@ class Experiment:
         self.files: T.List[File] = []
         self.streams: T.Dict[str, Stream] = {}
 
-    def find_files(self) -> T.Iterable[File]:
+    def find_paths(self) -> T.Iterable[str]:
         """
-        Find all files that are part of the experiment
+        Find the paths, relative to the experiment, of all candidate files
+
+        Directories that haven't been modified since the last scan aren't
+        listed again, instead the known files in that directory are returned
         """
         if isinstance(self.file_pattern, str):
             fps = [self.file_pattern]
         else:
             fps = self.file_pattern
 
-        for path in chain(*[glob(os.path.join(self.path, fp)) for fp in fps]):
-            rel = os.path.relpath(path, self.path)
-            ff: T.Optional[File] = None
-            for ef in self.files:
-                if ef.relative_path == rel:
-                    ff = ef
-                    logging.debug("existing file %s", rel)
+        known: T.Dict[str, T.List[str]] = {}
+        for f in self.files:
+            known.setdefault(os.path.dirname(f.relative_path), []).append(
+                f.relative_path
+            )
 
-            if ff is None:
-                ff = file_factory(rel, self)
-                logging.debug("new file %s", rel)
+        for fp in fps:
+            head, tail = os.path.split(fp)
+
+            def list_dir(d: str):
+                rel_d = os.path.relpath(d, self.path)
+                if rel_d == os.curdir:
+                    rel_d = ""
+
+                if self._unchanged_since_scan(d) and rel_d in known:
+                    logging.debug("unchanged directory %s", rel_d)
+                    return fnmatch.filter(known[rel_d], os.path.join(rel_d, tail)), []
+
+                return [
+                    os.path.relpath(p, self.path) for p in walk.scandir_match(d, tail)
+                ], []
+
+            # Directories matching the pattern are listed concurrently
+            yield from walk.imap_unordered(
+                list_dir, walk.iglob(os.path.join(self.path, head))
+            )
+
+    def _unchanged_since_scan(self, path: str) -> bool:
+        """
+        Is the directory listing of 'path' unchanged since the last scan?
+
+        True if the directory was last modified at least :data:`mtime_margin`
+        (1 minute) before the last scan started, allowing for clock
+        differences between the scanning host and the filesystem. False if it
+        may have changed, the experiment hasn't been scanned, or 'path' can't
+        be stat'd.
+        """
+        if self.last_scanned is None:
+            return False
 
+        try:
+            mtime = datetime.fromtimestamp(os.stat(path).st_mtime)
+            return mtime < self.last_scanned - mtime_margin
+        except OSError:
+            return False
+
+    def find_files(self, map: T.Callable = map) -> T.Iterable[File]:
+        """
+        Find all files that are part of the experiment
+
+        Known files are only checked for changes to their size and mtime, new
+        files have their type probed. New and changed files are listed in
+        :attr:`modified_files`, and :attr:`find_metrics` counts the files
+        found and the time spent listing directories
+
+        Args:
+            map: Function used to probe the types of new files, e.g.
+                 ``ProcessPoolExecutor.map`` to probe in parallel
+        """
+        known = {f.relative_path: f for f in self.files}
+
+        self.modified_files: T.List[File] = []
+        self.find_metrics: T.Counter[str] = collections.Counter()
+        metrics = self.find_metrics
+
+        # Files seen in this scan share a time, so unchanged files can be
+        # marked as seen with a single update
+        seen = datetime.now()
+
+        existing = []
+
+        def check(rel: str) -> bool:
+            # Check a known file for changes, returns False if 'rel' is new
+            ff = known.get(rel)
             if ff is None:
+                return False
+
+            try:
+                st = os.stat(os.path.join(self.path, rel))
+            except FileNotFoundError:
+                logging.debug("missing file %s", rel)
+                return True
+            except OSError as e:
+                # Keep the file as it was, e.g. a stale NFS handle may only
+                # be temporary
+                logging.warning("cannot stat %s: %s", os.path.join(self.path, rel), e)
+                metrics["files failed"] += 1
+                existing.append(ff)
+                return True
+
+            if ff.update_fingerprint(st):
+                logging.debug("changed file %s", rel)
+                metrics["files changed"] += 1
+                self.modified_files.append(ff)
+            else:
+                logging.debug("existing file %s", rel)
+                metrics["files unchanged"] += 1
+
+            ff.last_seen = seen
+            existing.append(ff)
+            return True
+
+        def new_paths() -> T.Iterator[str]:
+            # Checks known files, passing new files on to be probed as soon as
+            # they are found. Time spent here is counted as listing, the rest
+            # of find_files is spent probing new files
+            paths = iter(self.find_paths())
+            while True:
+                with timer(metrics, "list"):
+                    rel = next(paths, None)
+                    known_file = rel is not None and check(rel)
+
+                if rel is None:
+                    return
+                if not known_file:
+                    yield rel
+
+        probed = map(functools.partial(_probe_file, self.path), new_paths())
+
+        for result in probed:
+            if isinstance(result, FileError):
+                metrics["files failed"] += 1
                 continue
 
-            ff.last_seen = datetime.now()
+            rel, st, type = result
+            if type is None:
+                if st is not None:
+                    metrics["files unrecognised"] += 1
+                continue
+
+            logging.debug("new file %s", rel)
+            metrics["files new"] += 1
+            ff = file_class(type)(rel, self)
+            ff.update_fingerprint(st)
+            ff.last_seen = seen
+            self.modified_files.append(ff)
 
             yield ff
 
+        yield from existing
+
     def collect_streams(self, files: T.Iterable[File]) -> T.Dict[str, Stream]:
         """
         Group the listed files into streams containing similar variables
         """
+        # Files already in each stream, by identity
+        members: T.Dict[str, T.Set[int]] = {}
 
         for f in files:
             stream_name = self.identify_stream(f)
@@ -67,23 +270,281 @@ class Experiment:
                 stream = Stream(stream_name)
                 self.streams[stream_name] = stream
 
-            if f not in stream.files:
+            if stream_name not in members:
+                members[stream_name] = {id(sf) for sf in stream.files}
+
+            if id(f) not in members[stream_name]:
                 logging.debug("adding to stream %s", stream_name)
                 stream.files.append(f)
+                members[stream_name].add(id(f))
 
         return self.streams
 
-    def update(self):
+    def update(
+        self,
+        map: T.Callable = map,
+        references: bool = False,
+        reidentify_age: timedelta = reidentify_age,
+    ) -> T.Counter[str]:
         """
         Update the experiment with the latest filesystem state
+
+        A stream's variables and template are identified from its first file
+        when the stream is new, when that file has changed, or when they were
+        last identified more than ``reidentify_age`` ago
+
+        Args:
+            map: Function used to probe files and identify variables, e.g.
+                 ``ProcessPoolExecutor.map`` to work in parallel
+            references: Also build chunk reference indexes for the files, see
+                 :meth:`update_references`
+            reidentify_age: Age after which unchanged streams are identified
+                 again
+        Returns:
+            Counts of the files and streams found and updated, of files that
+            failed to be read, and the seconds spent in each phase of the
+            update
         """
-        self.files = list(self.find_files())
-        self.streams = self.collect_streams(self.files)
+        start = datetime.now()
+
+        metrics = collections.Counter()
+
+        with timer(metrics, "find files"):
+            self.files = list(self.find_files(map))
+        metrics.update(self.find_metrics)
+
+        # Listing is timed separately, the rest was spent probing new files
+        metrics["probe seconds"] = (
+            metrics["find files seconds"] - metrics["list seconds"]
+        )
+        del metrics["find files seconds"]
+
+        with timer(metrics, "collect streams"):
+            self.streams = self.collect_streams(self.files)
 
+        # First file of each stream that is still present
+        current = {id(f) for f in self.files}
+        first = {}
         for s in self.streams.values():
-            if s.last_seen is None or (s.last_seen - datetime.now()).days > 30:
-                s.identify_variables()
-                s.last_seen = datetime.now()
+            f = next((f for f in s.files if id(f) in current), None)
+            if f is not None:
+                first[s.name] = f
+
+        modified = {id(f) for f in self.modified_files}
+        stale = [
+            (s, first[s.name])
+            for s in self.streams.values()
+            if s.name in first
+            and (
+                s.last_seen is None
+                or len(s.variables) == 0
+                or id(first[s.name]) in modified
+                or start - s.last_seen > reidentify_age
+            )
+        ]
+
+        def store_variables(s, variables):
+            self.merge_variables(s, variables)
+            s.last_seen = start
+
+        with timer(metrics, "identify"):
+            # Failed streams are tried again next scan
+            metrics["files failed"] += self.identify_files(
+                "identify_variables", stale, store_variables, map
+            )
+
+        with timer(metrics, "templates"):
+            metrics["files failed"] += self.update_templates(stale, map)
+
+        with timer(metrics, "time ranges"):
+            metrics["files failed"] += self.update_time_ranges(map)
+
+        with timer(metrics, "fields"):
+            metrics["files failed"] += self.update_fields(map)
+
+        if references:
+            with timer(metrics, "references"):
+                metrics["files failed"] += self.update_references(map)
+
+        self.last_scanned = start
+
+        metrics.update(
+            {
+                "files": len(self.files),
+                "files modified": len(self.modified_files),
+                "streams": len(self.streams),
+                "streams identified": len(stale),
+            }
+        )
+        logging.debug("updated %s: %s", self.path, dict(metrics))
+
+        return metrics
+
+    def merge_variables(self, stream: Stream, variables: T.List[Variable]):
+        """
+        Update a stream's variables with newly identified variables
+
+        Variables are matched by name and method, so matching variables keep
+        their database ids. Variables that are no longer present are kept.
+        """
+        existing = {(v.name, v.method): v for v in stream.variables}
+
+        for v in variables:
+            old = existing.get((v.name, v.method))
+            if old is None:
+                stream.variables.append(v)
+                continue
+
+            old.long_name = v.long_name
+            old.standard_name = v.standard_name
+            old.units = v.units
+
+    def identify_files(
+        self,
+        method: str,
+        files: T.List[T.Tuple[T.Any, File]],
+        store: T.Callable[[T.Any, T.Any], None],
+        map: T.Callable = map,
+    ) -> int:
+        """
+        Call a :class:`File` method on each file with 'map', and store the
+        results
+
+        Args:
+            method: Name of the File method, e.g. 'identify_time_range'
+            files: Files to read, each with a key passed on to 'store'
+            store: Called with the key and result of each file that could be
+                read
+            map: Map function used to call the method
+        Returns:
+            Number of files that couldn't be read
+        """
+        found = map(
+            _file_method,
+            [method] * len(files),
+            [self.path] * len(files),
+            [f.type for _, f in files],
+            [f.relative_path for _, f in files],
+        )
+
+        failed = 0
+        for (key, _), result in zip(files, found):
+            if isinstance(result, FileError):
+                failed += 1
+                continue
+            store(key, result)
+
+        return failed
+
+    def update_time_ranges(self, map: T.Callable = map) -> int:
+        """
+        Record the time range covered by new and changed files
+
+        The dates are stored as numbers in the units and calendar of the file's
+        stream
+
+        Returns:
+            Number of files that couldn't be read
+        """
+        import cftime
+        import numpy
+
+        modified = {id(f) for f in self.modified_files}
+        files = [
+            ((s, f), f)
+            for s in self.streams.values()
+            for f in s.files
+            if id(f) in modified
+        ]
+
+        def store(key, r):
+            s, f = key
+            if r is None:
+                return
+
+            if s.time_units is None:
+                s.time_units = Stream.default_time_units
+                s.calendar = r[0].calendar
+
+            start, end = cftime.date2num([r.start, r.end], s.time_units, s.calendar)
+            f.start_date = float(start)
+            f.end_date = float(end)
+
+            if r.values is not None:
+                times = cftime.date2num(r.values, s.time_units, s.calendar)
+                f.times = numpy.asarray(times, dtype="f8").tobytes()
+
+        return self.identify_files("identify_time_range", files, store, map)
+
+    def update_references(self, map: T.Callable = map) -> int:
+        """
+        Record the chunk byte ranges of new and changed files, and of files
+        that don't have references yet, see :meth:`File.identify_references`
+
+        The references are stored as zlib compressed JSON
+
+        Returns:
+            Number of files that couldn't be read
+        """
+        modified = {id(f) for f in self.modified_files}
+        files = [
+            (f, f)
+            for f in self.files
+            if type(f).identify_references is not File.identify_references
+            and (id(f) in modified or f.chunk_refs is None)
+        ]
+
+        def store(f, refs):
+            if refs is not None:
+                refs = zlib.compress(json.dumps(refs).encode())
+            f.chunk_refs = refs
+
+        return self.identify_files("identify_references", files, store, map)
+
+    def update_fields(self, map: T.Callable = map) -> int:
+        """
+        Record the field index of new and changed files, and of files that
+        don't have an index yet, see :meth:`File.identify_fields`
+
+        The index is stored as zlib compressed bytes
+
+        Returns:
+            Number of files that couldn't be read
+        """
+        modified = {id(f) for f in self.modified_files}
+        files = [
+            (f, f)
+            for f in self.files
+            if type(f).identify_fields is not File.identify_fields
+            and (id(f) in modified or f.fields is None)
+        ]
+
+        def store(f, fields):
+            if fields is not None:
+                fields = zlib.compress(fields.tobytes())
+            f.fields = fields
+
+        return self.identify_files("identify_fields", files, store, map)
+
+    def update_templates(
+        self, streams: T.List[T.Tuple[Stream, File]], map: T.Callable = map
+    ) -> int:
+        """
+        Record the structure of the files in each stream, see
+        :meth:`File.identify_template`
+
+        Args:
+            streams: Streams to update, with the file to read from each
+        Returns:
+            Number of files that couldn't be read
+        """
+
+        def store(s, template):
+            if template is not None:
+                template = json.dumps(template, default=_json_default)
+            s.template = template
+
+        return self.identify_files("identify_template", streams, store, map)
 
     def identify_stream(self, file: File) -> str:
         """
@@ -17,13 +17,13 @@ class UMRose(Experiment):
     def __init__(self, path):
         super().__init__(path)
 
-    def find_files(self) -> T.Iterator[File]:
+    def find_files(self, map: T.Callable = map) -> T.Iterator[File]:
         """
         Finds files in a Rose run
         """
 
         os.environ["UMDIR"] = "/g/data/access/projects/access/umdir"
-        yield from super().find_files()
+        yield from super().find_files(map)
 
     def identify_stream(self, file) -> str:
         """
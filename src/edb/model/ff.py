@@ -0,0 +1,416 @@
+"""
+Minimal reader for UM fieldsfiles
+
+Only the parts of the format needed to index files and read field data are
+read, see UM documentation paper F3 for the full layout. Files are assumed to
+be big-endian with 64-bit words.
+"""
+
+from __future__ import annotations
+
+import re
+import typing as T
+
+if T.TYPE_CHECKING:
+    import cftime
+    import numpy
+
+# Missing value for integer header words
+imdi = -32768
+
+# Length of the fixed length header in words
+fixed_header_words = 256
+
+# Fixed length header calendar codes
+calendars = {1: "standard", 2: "360_day", 3: "365_day"}
+
+# UM version that wrote the file, e.g. 1003 for 10.3
+model_version_index = 11
+
+# Start of the first and last validity times in the fixed length header
+t1_index = 20
+t2_index = 27
+
+# Fixed length header words giving the position and size of the lookup table
+lookup_start_index = 149
+lookup_dim1_index = 150
+lookup_dim2_index = 151
+
+# Fixed length header words giving the position and size of the data
+data_start_index = 159
+data_dim1_index = 160
+
+# Integer words of each lookup table entry
+lbyr = 0  # Validity time t1, 6 words
+lbyrd = 6  # Data time t2, 6 words
+lbtim = 12
+lblrec = 14
+lbrow = 17
+lbnpt = 18
+lbpack = 20
+lbrel = 21
+lbproc = 24
+lbegin = 28
+lbnrec = 29
+lblev = 32
+lbuser1 = 38
+lbuser4 = 41
+lbuser7 = 44
+
+# Real words of each lookup table entry
+blev = 51
+bzy = 58
+bdy = 59
+bzx = 60
+bdx = 61
+bmdi = 62
+
+# Header release number of unused lookup table entries
+unused_lbrel = -99
+
+# Processing codes of lbproc, and the matching cell method
+lbproc_methods = {128: "mean", 4096: "minimum", 8192: "maximum"}
+
+
+def read_fixed_header(f: T.BinaryIO) -> numpy.ndarray:
+    """
+    Read the fixed length header from the start of an open file
+
+    Returns:
+        Array of the header words, using zero-based indices
+    """
+    import numpy
+
+    f.seek(0)
+    return numpy.fromfile(f, dtype=">i8", count=fixed_header_words)
+
+
+def header_time(flh: numpy.ndarray, index: int) -> T.Optional[cftime.datetime]:
+    """
+    Read a date from the fixed length header
+
+    Args:
+        flh: Fixed length header from :func:`read_fixed_header`
+        index: Index of the year word of the date, e.g. :data:`t1_index`
+    Returns:
+        The date in the file's calendar, or None if it is not set
+    """
+    import cftime
+
+    calendar = calendars.get(int(flh[7]))
+    ymdhms = [int(x) for x in flh[index : index + 6]]
+
+    if calendar is None or imdi in ymdhms:
+        return None
+
+    return cftime.datetime(*ymdhms, calendar=calendar)
+
+
+def read_lookup(f: T.BinaryIO, flh: numpy.ndarray) -> numpy.ndarray:
+    """
+    Read the used entries of the lookup table, which describes each field in
+    the file
+
+    Only the integer words of the entries are meaningful
+
+    Args:
+        f: Open file
+        flh: Fixed length header from :func:`read_fixed_header`
+    Returns:
+        Array of shape (fields, lookup length), using zero-based indices
+    """
+    import numpy
+
+    start = int(flh[lookup_start_index])
+    dim1 = int(flh[lookup_dim1_index])
+    dim2 = int(flh[lookup_dim2_index])
+
+    if imdi in (start, dim1, dim2) or dim1 <= 0 or dim2 <= 0:
+        return numpy.empty((0, max(dim1, 0)), dtype=">i8")
+
+    # 'start' is a one-based word position
+    f.seek((start - 1) * 8)
+    lookup = numpy.fromfile(f, dtype=">i8", count=dim1 * dim2)
+    lookup = lookup[: lookup.size // dim1 * dim1].reshape(-1, dim1)
+
+    return lookup[lookup[:, lbrel] != unused_lbrel]
+
+
+# Columns of a field index, see :func:`field_index`
+field_index_columns = [
+    ("model", "<i2"),
+    ("stash", "<i4"),
+    ("lbproc", "<i4"),
+    ("lbtim", "<i4"),
+    ("lblev", "<i4"),
+    ("blev", "<f4"),
+    ("t1", "<f8"),
+    ("t2", "<f8"),
+    ("offset", "<i8"),
+    ("size", "<i4"),
+    ("lbpack", "<i4"),
+    ("lbrow", "<i4"),
+    ("lbnpt", "<i4"),
+    ("lbuser1", "<i2"),
+    ("bzy", "<f8"),
+    ("bdy", "<f8"),
+    ("bzx", "<f8"),
+    ("bdx", "<f8"),
+    ("bmdi", "<f8"),
+]
+
+
+def field_index(flh: numpy.ndarray, lookup: numpy.ndarray, units: str) -> numpy.ndarray:
+    """
+    Summarise the fields of a file from its lookup table
+
+    This is enough to find the fields of a variable and read their data
+    without reading the headers again
+
+    Args:
+        flh: Fixed length header from :func:`read_fixed_header`
+        lookup: Lookup table from :func:`read_lookup`
+        units: CF time units for the validity times
+    Returns:
+        Structured array with :data:`field_index_columns`, one row per field.
+        't1' and 't2' are the validity and data times in 'units' (NaN if the
+        calendar or date is unknown), 'offset' and 'size' are the position and
+        length in bytes of the field's data record
+    """
+    import numpy
+
+    index = numpy.zeros(len(lookup), dtype=field_index_columns)
+
+    index["model"] = lookup[:, lbuser7]
+    index["stash"] = lookup[:, lbuser4]
+    for name, word in [
+        ("lbproc", lbproc),
+        ("lbtim", lbtim),
+        ("lblev", lblev),
+        ("lbpack", lbpack),
+        ("lbrow", lbrow),
+        ("lbnpt", lbnpt),
+        ("lbuser1", lbuser1),
+    ]:
+        index[name] = lookup[:, word]
+
+    reals = lookup.view(">f8")
+    for name, word in [
+        ("blev", blev),
+        ("bzy", bzy),
+        ("bdy", bdy),
+        ("bzx", bzx),
+        ("bdx", bdx),
+        ("bmdi", bmdi),
+    ]:
+        index[name] = reals[:, word]
+
+    # Fieldsfiles give the length on disk in lbnrec, other files only lblrec
+    index["offset"] = lookup[:, lbegin] * 8
+    index["size"] = (
+        numpy.where(lookup[:, lbnrec] > 0, lookup[:, lbnrec], lookup[:, lblrec]) * 8
+    )
+
+    calendar = calendars.get(int(flh[7]))
+    index["t1"] = _lookup_times(lookup[:, lbyr : lbyr + 6], units, calendar)
+    index["t2"] = _lookup_times(lookup[:, lbyrd : lbyrd + 6], units, calendar)
+
+    return index
+
+
+def _lookup_times(
+    ymdhms: numpy.ndarray, units: str, calendar: T.Optional[str]
+) -> numpy.ndarray:
+    """
+    Convert the date words of lookup entries to numbers in 'units', NaN if
+    the calendar or date is unknown
+    """
+    import cftime
+    import numpy
+
+    times = numpy.full(len(ymdhms), numpy.nan)
+    if calendar is None or len(ymdhms) == 0:
+        return times
+
+    # Many fields share a time, only convert the distinct times. Packing the
+    # date words into one key is faster than a 2d unique
+    key = ymdhms[:, 0]
+    for word, scale in zip(ymdhms.T[1:], [13, 32, 24, 60, 60]):
+        key = key * scale + word
+    _, first, inverse = numpy.unique(key, return_index=True, return_inverse=True)
+
+    distinct = numpy.full(len(first), numpy.nan)
+    for i, t in enumerate(ymdhms[first]):
+        try:
+            date = cftime.datetime(*map(int, t), calendar=calendar)
+        except ValueError:
+            # Unset or invalid date
+            continue
+        distinct[i] = cftime.date2num(date, units, calendar)
+
+    return distinct[inverse]
+
+
+def field_times(fields: numpy.ndarray) -> numpy.ndarray:
+    """
+    Time coordinate of fields, the same as iris gives them
+
+    Fields processed over a period (LBTIM IB=2, e.g. means) are at the middle
+    of the period from t1 to t2, other fields are at t1
+
+    Args:
+        fields: Rows of a field index, see :func:`field_index`
+    Returns:
+        Times of each field, in the units of the field index
+    """
+    import numpy
+
+    period = fields["lbtim"] // 10 % 10 == 2
+    return numpy.where(period, 0.5 * (fields["t1"] + fields["t2"]), fields["t1"])
+
+
+def load_field_index(data: bytes) -> numpy.ndarray:
+    """
+    Read a field index stored as bytes, see :func:`field_index`
+    """
+    import numpy
+
+    return numpy.frombuffer(data, dtype=field_index_columns)
+
+
+def select_fields(index: numpy.ndarray, name: str, method: str) -> numpy.ndarray:
+    """
+    Fields of a variable from a field index, in file order
+
+    Args:
+        index: Field index from :func:`field_index`
+        name: STASH code of the variable, see :func:`stash_code`
+        method: Cell methods of the variable, see :func:`cell_method`
+    Returns:
+        The matching rows of the index
+    """
+    import numpy
+
+    model, section, item = (int(x) for x in re.findall(r"\d+", name))
+
+    # Files written by older models leave the model number unset
+    match = (index["stash"] == section * 1000 + item) & (
+        (index["model"] == model) | ((index["model"] == 0) & (model == 1))
+    )
+    fields = index[match]
+
+    # Check the time processing of each distinct combination
+    methods = {}
+    keep = []
+    for key in zip(fields["lbproc"].tolist(), fields["lbtim"].tolist()):
+        if key not in methods:
+            methods[key] = _cell_method(*key)
+        keep.append(methods[key] == method)
+
+    return fields[numpy.asarray(keep, dtype=bool)]
+
+
+def can_unpack(lbpack: int) -> bool:
+    """
+    Check if :func:`read_field` can read fields with a packing code
+
+    WGDOS packed fields need the 'mule' package, land or sea compressed
+    fields and other packing methods are not supported
+    """
+    import importlib.util
+
+    method = lbpack % 10
+    compression = lbpack // 10 % 10
+
+    if compression != 0:
+        return False
+    if method == 1:
+        return importlib.util.find_spec("mule") is not None
+    return method in (0, 2)
+
+
+def read_field(f: T.BinaryIO, field: numpy.void) -> numpy.ndarray:
+    """
+    Read and unpack the data of a field
+
+    Args:
+        f: Open file
+        field: Row of the file's field index, see :func:`field_index`
+    Returns:
+        See :func:`unpack_field`
+    """
+    f.seek(int(field["offset"]))
+    return unpack_field(f.read(int(field["size"])), field)
+
+
+def unpack_field(data: bytes, field: numpy.void) -> numpy.ndarray:
+    """
+    Unpack the data record of a field
+
+    Args:
+        data: The 'size' bytes at the field's 'offset'
+        field: Row of the file's field index, see :func:`field_index`
+    Returns:
+        Array of shape (lbrow, lbnpt), float64 with missing values as NaN for
+        real fields, else int64
+    """
+    import numpy
+
+    shape = (int(field["lbrow"]), int(field["lbnpt"]))
+    lbpack = int(field["lbpack"])
+    real = field["lbuser1"] == 1
+
+    if not can_unpack(lbpack):
+        raise NotImplementedError(f"Can't read fields with lbpack={lbpack}")
+
+    if lbpack % 10 == 1:
+        import mule.packing
+
+        values = mule.packing.wgdos_unpack(data, float(field["bmdi"]))
+    else:
+        # Unpacked 64-bit or 32-bit data
+        width = 8 if lbpack % 10 == 0 else 4
+        dtype = f">{'f' if real else 'i'}{width}"
+        values = numpy.frombuffer(data, dtype=dtype, count=shape[0] * shape[1])
+
+    if real:
+        # Compare at the data's precision, bmdi is rounded in 32 bit fields
+        values = numpy.asarray(values).reshape(shape)
+        missing = values == numpy.asarray(field["bmdi"], dtype=values.dtype)
+        return numpy.where(missing, numpy.nan, values.astype("f8"))
+
+    return numpy.asarray(values, dtype="i8").reshape(shape)
+
+
+def stash_code(entry: numpy.ndarray) -> str:
+    """
+    STASH code of a lookup table entry, e.g. 'm01s03i236'
+    """
+    model = int(entry[lbuser7]) or 1
+    section, item = divmod(int(entry[lbuser4]), 1000)
+
+    return f"m{model:02d}s{section:02d}i{item:03d}"
+
+
+def cell_method(entry: numpy.ndarray) -> str:
+    """
+    Time processing of a lookup table entry as CF cell methods, e.g.
+    'mean: time (1 hour)'
+    """
+    return _cell_method(entry[lbproc], entry[lbtim])
+
+
+def _cell_method(proc: int, tim: int) -> str:
+    proc = int(proc)
+    # Sampling interval in hours
+    interval = int(tim) // 100
+
+    methods = []
+    for code, method in lbproc_methods.items():
+        if proc & code:
+            if interval > 0:
+                methods.append(f"{method}: time ({interval} hour)")
+            else:
+                methods.append(f"{method}: time")
+
+    return " ".join(methods)
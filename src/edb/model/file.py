@@ -4,15 +4,70 @@ import pathlib
 import typing as T
 import os
 import logging
-import netCDF4
-import xarray
+import struct
 
 from .variable import Variable
+from . import ff
+from ..utils import all_subclasses
 
 if T.TYPE_CHECKING:
+    import cftime
+    import netCDF4
+    import numpy
     from .experiment.base import Experiment
 
 
+class TimeRange(T.NamedTuple):
+    """
+    Times covered by a file
+    """
+
+    start: cftime.datetime
+    end: cftime.datetime
+
+    #: All values of the time coordinate, if known
+    values: T.Optional[T.List[cftime.datetime]] = None
+
+
+# Number of bytes read from the start of a file to identify its type
+header_size = 2048
+
+
+def file_type(path: str) -> T.Optional[str]:
+    """
+    Identify the File type of the file at 'path' from its contents
+
+    Only the first :data:`header_size` bytes of the file are read, these are
+    checked by :meth:`File.sniff` of each File subclass. This only needs the
+    path, so it can be run in a process pool
+
+    Returns:
+        The 'type' of the matching File subclass, or None if the file isn't
+        recognised
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(header_size)
+    except OSError as e:
+        logging.debug("cannot read %s: %s", path, e)
+        return None
+
+    for c in all_subclasses(File):
+        if c.type is not None and c.sniff(header):
+            return c.type
+
+    return None
+
+
+def file_class(type: str) -> T.Type[File]:
+    """
+    Get the File subclass with the given 'type'
+    """
+    types = {c.type: c for c in all_subclasses(File) if c.type is not None}
+
+    return types[type]
+
+
 def file_factory(path: str, exp: Experiment) -> T.Optional[File]:
     """
     Creates a File of the right type for its contents
@@ -20,29 +75,20 @@ def file_factory(path: str, exp: Experiment) -> T.Optional[File]:
     if not os.path.isabs(path):
         path = os.path.join(exp.path, path)
 
-    try:
-        # UM file
-        import mule
-
-        mf = mule.load_umfile(path)
-        return UMFile(path, exp)
-    except:
-        pass
+    type = file_type(path)
 
-    try:
-        # Netcdf file
-        ds = netCDF4.Dataset(path)
-        ds.close()
-        return NCFile(path, exp)
-    except:
-        pass
+    if type is None:
+        return None
 
-    return None
+    return file_class(type)(path, exp)
 
 
 class File:
     type: T.Optional[str] = None
     experiment: Experiment
+    size: T.Optional[int]
+    mtime: T.Optional[float]
+    inode: T.Optional[int]
 
     def __init__(
         self,
@@ -62,52 +108,334 @@ class File:
 
         self.experiment = exp
 
+    @classmethod
+    def sniff(cls, header: bytes) -> bool:
+        """
+        Check if a file is of this type
+
+        Subclasses should override this to recognise their format, e.g. from
+        magic numbers. New formats are registered by creating a subclass.
+
+        Args:
+            header: The first :data:`header_size` bytes of the file
+        """
+        return False
+
+    def update_fingerprint(self, st: os.stat_result) -> bool:
+        """
+        Record the size, mtime and inode of the file
+
+        Args:
+            st: Result of :func:`os.stat` on the file
+        Returns:
+            True if the file has changed since it was last fingerprinted
+        """
+        fingerprint = (st.st_size, st.st_mtime, st.st_ino)
+        changed = fingerprint != (self.size, self.mtime, self.inode)
+
+        self.size, self.mtime, self.inode = fingerprint
+
+        return changed
+
     def identify_variables(self) -> T.List[Variable]:
         """
         Returns the variables found in this file
         """
         return []
 
+    def identify_time_range(self) -> T.Optional[TimeRange]:
+        """
+        Returns the times covered by this file, or None if unknown
+        """
+        return None
+
+    def identify_template(self) -> T.Optional[T.Dict[str, T.Any]]:
+        """
+        Returns the structure of the variables and non-time coordinates in
+        this file, which is shared by all files in its stream, or None if the
+        file type doesn't support opening from a template
+        """
+        return None
+
+    def identify_references(self) -> T.Optional[T.Dict[str, T.Any]]:
+        """
+        Returns a Kerchunk reference set giving the byte ranges of each chunk
+        of the file's variables, or None if the file type doesn't support
+        references
+        """
+        return None
+
+    def identify_fields(self) -> T.Optional[numpy.ndarray]:
+        """
+        Returns an index of the fields in this file, giving where the data of
+        each variable and time is, or None if the file type doesn't have one
+        """
+        return None
+
 
 class NCFile(File):
     type = "netcdf"
 
+    # Magic numbers for the NetCDF classic, 64-bit offset and 64-bit data formats
+    classic_signatures = [b"CDF\x01", b"CDF\x02", b"CDF\x05"]
+
+    # NetCDF4 files are HDF5, whose superblock may follow a user block
+    hdf5_signature = b"\x89HDF\r\n\x1a\n"
+    hdf5_offsets = [0, 512, 1024]
+
     def __init__(self, path: T.Union[str, pathlib.Path], exp: Experiment):
         super().__init__(path, exp)
 
+    @classmethod
+    def sniff(cls, header: bytes) -> bool:
+        if header[:4] in cls.classic_signatures:
+            return True
+
+        return any(
+            header[o : o + len(cls.hdf5_signature)] == cls.hdf5_signature
+            for o in cls.hdf5_offsets
+        )
+
     def identify_variables(self) -> T.List[Variable]:
         """
         Returns the variables found in this file
+
+        Only the file metadata is read, coordinates aren't decoded
         """
+        import netCDF4
+
         path = os.path.join(self.experiment.path, self.relative_path)
 
-        try:
-            with xarray.open_dataset(path) as ds:
-                return [Variable.from_xarray(v) for v in ds.data_vars.values()]
-        except ValueError:
-            # Bad dates?
-            with xarray.open_dataset(path, decode_times=False) as ds:
-                return [Variable.from_xarray(v) for v in ds.data_vars.values()]
+        with netCDF4.Dataset(path) as ds:
+            # Dimension coordinates and auxiliary coordinates aren't variables
+            coords = set(ds.dimensions)
+            for v in ds.variables.values():
+                coords.update(str(getattr(v, "coordinates", "")).split())
+
+            return [
+                Variable.from_netcdf(v)
+                for k, v in ds.variables.items()
+                if k not in coords
+            ]
+
+    def identify_time_range(self) -> T.Optional[TimeRange]:
+        import cftime
+        import netCDF4
+
+        path = os.path.join(self.experiment.path, self.relative_path)
+
+        with netCDF4.Dataset(path) as ds:
+            time = _find_time(ds)
+            if time is None:
+                return None
+
+            values = time[:]
+            if values.size == 0:
+                return None
+
+            # Include the cell bounds if present
+            bounds = ds.variables.get(getattr(time, "bounds", None), time)[:]
+
+            units = time.units
+            calendar = getattr(time, "calendar", "standard")
+
+        start, end = cftime.num2date([bounds.min(), bounds.max()], units, calendar)
+        values = cftime.num2date(values, units, calendar)
+
+        return TimeRange(start, end, list(values))
+
+    def identify_template(self) -> T.Optional[T.Dict[str, T.Any]]:
+        import netCDF4
+        import xarray
+
+        path = os.path.join(self.experiment.path, self.relative_path)
+
+        with netCDF4.Dataset(path) as ds:
+            time = _find_time(ds)
+            if time is None or time.dimensions != (time.name,):
+                return None
+            time_dim = time.name
+
+        with xarray.open_dataset(path) as ds:
+            variables = {
+                k: {
+                    "dims": list(v.dims),
+                    "shape": list(v.shape),
+                    "dtype": str(v.dtype),
+                    "attrs": v.attrs,
+                }
+                for k, v in ds.data_vars.items()
+                if time_dim in v.dims
+            }
+            # Only the values of dimension and scalar coordinates are kept,
+            # others like 2d curvilinear grids can be large and are read from
+            # the first file when opening
+            coords = {}
+            for k, v in ds.coords.items():
+                if time_dim in v.dims:
+                    continue
+                coords[k] = {"dims": list(v.dims), "attrs": v.attrs}
+                if v.dims == (k,) or v.ndim == 0:
+                    coords[k]["data"] = v.values.tolist()
+
+            return {
+                "time": time_dim,
+                "time_attrs": ds[time_dim].attrs,
+                "variables": variables,
+                "coords": coords,
+            }
+
+    def identify_references(self) -> T.Optional[T.Dict[str, T.Any]]:
+        """
+        Returns a Kerchunk reference set giving the byte ranges of each chunk
+        of the file's variables, so the file can be read through a zarr
+        reference filesystem without parsing its metadata again
+
+        Requires the 'kerchunk' package
+        """
+        path = os.path.join(self.experiment.path, self.relative_path)
+
+        with open(path, "rb") as f:
+            header = f.read(header_size)
+
+        if header[:4] in self.classic_signatures:
+            from kerchunk.netCDF3 import NetCDF3ToZarr
+
+            return NetCDF3ToZarr(path).translate()
+
+        from kerchunk.hdf import SingleHdf5ToZarr
+
+        with open(path, "rb") as f:
+            return SingleHdf5ToZarr(f, path).translate()
+
+
+def _find_time(ds: netCDF4.Dataset) -> T.Optional[netCDF4.Variable]:
+    """
+    Find the CF time coordinate of a NetCDF dataset
+    """
+    for v in ds.variables.values():
+        if (
+            getattr(v, "axis", None) == "T"
+            or getattr(v, "standard_name", None) == "time"
+        ):
+            break
+    else:
+        v = ds.variables.get("time")
+
+    if v is None or "since" not in getattr(v, "units", ""):
+        return None
+
+    return v
 
 
 class UMFile(File):
     type = "um"
 
+    # Values of the fixed length header 'data_set_format_version' and
+    # 'dataset_type' for UM files
+    format_versions = [15, 20]
+    dataset_types = [1, 2, 3, 4, 5]
+
     def __init__(self, path: T.Union[str, pathlib.Path], exp: Experiment):
         super().__init__(path, exp)
 
+    @classmethod
+    def sniff(cls, header: bytes) -> bool:
+        # First words of the big-endian 64-bit fixed length header
+        if len(header) < 5 * 8:
+            return False
+        flh = struct.unpack(">5q", header[: 5 * 8])
+
+        return flh[0] in cls.format_versions and flh[4] in cls.dataset_types
+
+    def identify_time_range(self) -> T.Optional[TimeRange]:
+        path = os.path.join(self.experiment.path, self.relative_path)
+
+        with open(path, "rb") as f:
+            flh = ff.read_fixed_header(f)
+
+        start = ff.header_time(flh, ff.t1_index)
+        end = ff.header_time(flh, ff.t2_index)
+
+        if start is None or end is None:
+            return None
+
+        return TimeRange(start, end)
+
+    def identify_fields(self) -> numpy.ndarray:
+        """
+        Returns the field index of this file, see :func:`ff.field_index`
+
+        Validity times are in the default stream time units, the units used by
+        :meth:`Experiment.update_time_ranges` for UM files
+        """
+        from .stream import Stream
+
+        path = os.path.join(self.experiment.path, self.relative_path)
+
+        with open(path, "rb") as f:
+            flh = ff.read_fixed_header(f)
+            lookup = ff.read_lookup(f, flh)
+
+        return ff.field_index(flh, lookup, Stream.default_time_units)
+
     def identify_variables(self) -> T.List[Variable]:
+        """
+        Returns the variables found in this file
+
+        Only the lookup table is read, a variable is returned for each
+        distinct STASH code and time processing
+        """
+        import numpy
+
         logging.debug("identify_variables %s", self.relative_path)
         try:
-            import iris
-            import mule
-
             path = os.path.join(self.experiment.path, self.relative_path)
-            mf = mule.load_umfile(path)
-            stashmaster = mule.STASHmaster.from_umfile(mf)
-            cubes = iris.load(path)
 
-            return [Variable.from_iris(c, stashmaster=stashmaster) for c in cubes]
+            with open(path, "rb") as f:
+                flh = ff.read_fixed_header(f)
+                lookup = ff.read_lookup(f, flh)
+
+            # One field of each variable, in file order
+            keys = lookup[:, [ff.lbuser7, ff.lbuser4, ff.lbproc, ff.lbtim]]
+            keys[:, 3] //= 100
+            _, first = numpy.unique(keys, axis=0, return_index=True)
+            fields = lookup[numpy.sort(first)]
+
+            stashmaster = _stashmaster(int(flh[ff.model_version_index]))
+            cf_names = _stash_to_cf()
+
+            return [
+                Variable.from_um_field(
+                    e, stashmaster=stashmaster, cf_name=cf_names.get(ff.stash_code(e))
+                )
+                for e in fields
+            ]
         except Exception as e:
             logging.warning(e)
             return []
+
+
+def _stashmaster(version: int):
+    """
+    Load the STASHmaster for a UM version with mule, if available
+    """
+    try:
+        import mule
+
+        return mule.STASHmaster.from_version(version)
+    except Exception as e:
+        logging.debug("no STASHmaster: %s", e)
+        return None
+
+
+def _stash_to_cf() -> T.Dict[str, T.Any]:
+    """
+    iris's mapping of STASH codes to CF names, if available
+    """
+    try:
+        from iris.fileformats.um_cf_map import STASH_TO_CF
+
+        return STASH_TO_CF
+    except ImportError:
+        return {}
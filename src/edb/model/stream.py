@@ -3,6 +3,9 @@ from .file import File
 
 
 class Stream:
+    # Units of the file start and end dates in new streams
+    default_time_units = "days since 1970-01-01 00:00:00"
+
     def __init__(self, name: str, files: T.List[File] = []):
         self.name = name
         self.files = files
@@ -1,6 +1,13 @@
 from __future__ import annotations
 
-import xarray
+import typing as T
+
+from . import ff
+
+if T.TYPE_CHECKING:
+    import netCDF4
+    import numpy
+    import xarray
 
 
 class Variable:
@@ -56,3 +63,50 @@ class Variable:
         v.method = da.attrs.get("method", None)
 
         return v
+
+    @classmethod
+    def from_netcdf(cls, var: netCDF4.Variable) -> Variable:
+        """
+        Create a Variable from the attributes of a netCDF4 Variable, without
+        reading its data
+        """
+        v = cls()
+
+        attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+
+        v.name = str(var.name)
+        v.long_name = attrs.get("long_name", None)
+        v.standard_name = attrs.get("standard_name", None)
+        v.units = attrs.get("units", None)
+        v.method = attrs.get("method", None)
+
+        return v
+
+    @classmethod
+    def from_um_field(
+        cls, entry: numpy.ndarray, stashmaster=None, cf_name=None
+    ) -> Variable:
+        """
+        Create a Variable from a UM lookup table entry, see
+        :func:`edb.model.ff.read_lookup`
+
+        Args:
+            entry: Lookup table entry of a field
+            stashmaster: mule.stashmaster.STASHmaster with variable metadata
+            cf_name: iris.fileformats.um_cf_map.CFName of the field's STASH code
+        """
+        v = cls()
+
+        v.name = ff.stash_code(entry)
+        v.method = ff.cell_method(entry)
+
+        stash = stashmaster.get(int(entry[ff.lbuser4])) if stashmaster else None
+        if stash is not None:
+            v.long_name = stash.name
+        else:
+            v.long_name = getattr(cf_name, "long_name", None)
+
+        v.standard_name = getattr(cf_name, "standard_name", None)
+        v.units = getattr(cf_name, "units", None)
+
+        return v
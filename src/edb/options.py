@@ -0,0 +1,37 @@
+"""
+Names and help text of command line options
+
+Building the command line parser only needs these, so this module has no
+dependencies to keep ``edb --help`` and forwarded commands quick to start
+"""
+
+experiment_types = [
+    "access-cm-payu",
+    "access-cm-rose",
+    "access-cm-script",
+    "access-om-payu",
+    "generic",
+    "um-rose",
+    "um-umui",
+]
+"""
+Values of the 'type' of each :class:`edb.model.experiment.Experiment` class
+"""
+
+search_args = {
+    "experiment": "experiment name",
+    "experiment_type": "experiment type",
+    "stream": "stream name",
+    "variable": "variable text search, ranked by relevance",
+    "variable_prefix": "variable text search matching the start of words",
+    "variable_part": "variable search matching any part of the names, e.g. "
+    "partial STASH codes (at least 3 characters)",
+    "variable_name": "variable name",
+    "variable_id": "variable database id",
+    "standard_name": "variable cf standard_name",
+    "long_name": "variable long_name",
+}
+"""
+Search arguments and their descriptions, see
+:data:`edb.experimentdb.search_params`
+"""
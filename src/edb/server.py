@@ -0,0 +1,370 @@
+"""
+Query server for the command line tool
+
+Each run of ``edb`` pays for starting python, importing the database
+libraries, reading the configuration and checking the database schema.
+``edb serve`` does this once, then answers commands sent to it over a Unix
+socket. While it is running the read-only commands in
+:data:`forwarded_commands` are sent to it by :func:`forward`, rather than
+being run by the command line tool itself.
+
+Only the standard library is imported at the top of this module, so that
+forwarding a command stays fast.
+
+Requests are a line of JSON holding the command line arguments. The reply is
+a series of frames, each a channel byte and a 4 byte length followed by that
+many bytes of output, ending with an exit frame whose length field is the
+exit status of the command.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import sys
+import traceback
+import typing as T
+
+from .utils import ignore_broken_pipe
+
+if T.TYPE_CHECKING:
+    import argparse
+    from .experimentdb import ExperimentDB
+
+# Commands that only read the database, so can be answered by the server
+forwarded_commands = {"experiments", "search", "files"}
+
+_frame = struct.Struct(">cI")
+
+# Frame channels
+_stdout = b"o"
+_stderr = b"e"
+_exit = b"x"
+_refused = b"r"
+
+
+def socket_path() -> str:
+    """
+    Default path of the server socket
+
+    This is $EDB_SOCKET if set, otherwise a per-user socket in
+    $XDG_RUNTIME_DIR, or else in a private per-user directory in $TMPDIR
+    """
+    path = os.environ.get("EDB_SOCKET")
+    if path:
+        return path
+
+    run_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if run_dir:
+        return os.path.join(run_dir, f"experimentdb-{os.getuid()}.sock")
+
+    # $TMPDIR is often shared, e.g. /tmp, where other users could create the
+    # socket first
+    tmp_dir = os.environ.get("TMPDIR", "/tmp")
+    return os.path.join(tmp_dir, f"experimentdb-{os.getuid()}", "edb.sock")
+
+
+def _check_private_dir(path: str):
+    """
+    Raise an error unless only the current user can add files to the
+    directory 'path'
+    """
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise RuntimeError(
+            f"Refusing to serve from {path}, as other users can write to it"
+        )
+
+
+def _peer_uid(sock: socket.socket) -> T.Optional[int]:
+    """
+    User id of the process at the other end of a Unix socket, or None if the
+    platform doesn't provide it
+    """
+    if not hasattr(socket, "SO_PEERCRED"):
+        return None
+
+    creds = sock.getsockopt(
+        socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")
+    )
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def config_arg(argv: T.List[str]) -> T.Optional[str]:
+    """
+    Absolute path of the '--config' argument in 'argv', or None if it isn't
+    given
+    """
+    path = None
+    for i, arg in enumerate(argv):
+        if arg == "--config" and i + 1 < len(argv):
+            path = argv[i + 1]
+        elif arg.startswith("--config="):
+            path = arg.split("=", 1)[1]
+
+    if path is None:
+        return None
+    return os.path.abspath(path)
+
+
+def _connect(path: str) -> T.Optional[socket.socket]:
+    """
+    Connect to the server at 'path', returning None if it isn't running
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    return sock
+
+
+def forward(argv: T.List[str], path: T.Optional[str] = None) -> T.Optional[int]:
+    """
+    Run a command on the server, if one is running
+
+    Commands are only forwarded if they are in :data:`forwarded_commands`,
+    they don't ask for debug output and they use the same configuration file
+    as the server. The socket and the server must belong to the current user,
+    so that another user can't answer commands in its place.
+
+    Args:
+        argv: Command line arguments, without the program name
+        path: Socket path, default :func:`socket_path`
+    Returns:
+        The exit status of the command, or None if it wasn't run and should
+        be run locally instead
+    """
+    if len(argv) == 0 or argv[0] not in forwarded_commands or "--debug" in argv:
+        return None
+
+    if path is None:
+        path = socket_path()
+
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        return None
+
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid != os.getuid():
+        print(f"edb: ignoring {path}, not a socket owned by you", file=sys.stderr)
+        return None
+
+    sock = _connect(path)
+    if sock is None:
+        return None
+
+    uid = _peer_uid(sock)
+    if uid is not None and uid != os.getuid():
+        sock.close()
+        print(f"edb: ignoring server at {path} run by another user", file=sys.stderr)
+        return None
+
+    request = {"argv": argv, "config": config_arg(argv)}
+
+    with sock, sock.makefile("rb") as reply:
+        sock.sendall(json.dumps(request).encode() + b"\n")
+
+        started = False
+        with ignore_broken_pipe():
+            while True:
+                header = reply.read(_frame.size)
+                if len(header) < _frame.size:
+                    if not started:
+                        # Server closed without answering
+                        return None
+                    print("edb: lost connection to server", file=sys.stderr)
+                    return 1
+
+                channel, length = _frame.unpack(header)
+                if channel == _refused:
+                    return None
+                if channel == _exit:
+                    sys.stdout.flush()
+                    return length
+
+                started = True
+                out = sys.stdout if channel == _stdout else sys.stderr
+                out.buffer.write(reply.read(length))
+                if out is sys.stderr:
+                    out.flush()
+
+        # Only reached if the output was closed early
+        return 0
+
+
+class _FrameWriter(io.RawIOBase):
+    """
+    Writes to a socket as frames on a channel
+    """
+
+    def __init__(self, sock: socket.socket, channel: bytes):
+        self.sock = sock
+        self.channel = channel
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.sock.sendall(_frame.pack(self.channel, len(b)) + bytes(b))
+        return len(b)
+
+
+def _text_writer(sock: socket.socket, channel: bytes) -> io.TextIOWrapper:
+    return io.TextIOWrapper(
+        io.BufferedWriter(_FrameWriter(sock, channel), buffer_size=65536),
+        encoding="utf-8",
+    )
+
+
+def _exit_status(code) -> int:
+    """
+    Exit status of a :class:`SystemExit` code, as :func:`sys.exit` would give
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    print(code, file=sys.stderr)
+    return 1
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        server: Server = self.server
+
+        line = self.rfile.readline()
+        if not line:
+            # Connection closed without a request, e.g. checking if the
+            # server is running
+            return
+
+        request = json.loads(line)
+        argv = request.get("argv", [])
+
+        if (
+            len(argv) == 0
+            or argv[0] not in forwarded_commands
+            or request.get("config") != server.config
+        ):
+            self.connection.sendall(_frame.pack(_refused, 0))
+            return
+
+        logging.debug("request %s", argv)
+
+        stdout = _text_writer(self.connection, _stdout)
+        stderr = _text_writer(self.connection, _stderr)
+        status = 0
+
+        try:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    args = server.parser.parse_args(argv)
+                    args.command.call(server.expdb, args)
+                except SystemExit as e:
+                    status = _exit_status(e.code)
+                except Exception:
+                    traceback.print_exc()
+                    status = 1
+
+                stdout.flush()
+                stderr.flush()
+
+            self.connection.sendall(_frame.pack(_exit, status))
+
+        except OSError:
+            logging.debug("client disconnected")
+
+
+class Server(socketserver.UnixStreamServer):
+    """
+    Answers forwarded commands using a shared :class:`ExperimentDB`
+
+    Requests are handled one at a time, as command output is captured by
+    redirecting :data:`sys.stdout`
+
+    Args:
+        path: Socket path
+        expdb: Database to query
+        parser: Command line parser
+        config: Absolute path of the configuration file used by 'expdb', only
+            commands with the same '--config' are answered
+    """
+
+    def __init__(
+        self,
+        path: str,
+        expdb: ExperimentDB,
+        parser: argparse.ArgumentParser,
+        config: T.Optional[str] = None,
+    ):
+        self.expdb = expdb
+        self.parser = parser
+        self.config = config
+        super().__init__(path, _Handler)
+
+
+def serve(
+    expdb: ExperimentDB,
+    parser: argparse.ArgumentParser,
+    config: T.Optional[str] = None,
+    path: T.Optional[str] = None,
+):
+    """
+    Answer forwarded commands until interrupted
+
+    The socket is only accessible by the current user, and is removed when
+    the server stops. Its directory is created if needed, and must not be
+    writable by other users.
+
+    Args:
+        expdb: Database to query
+        parser: Command line parser
+        config: Absolute path of the configuration file used by 'expdb'
+        path: Socket path, default :func:`socket_path`
+    """
+    if path is None:
+        path = socket_path()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, mode=0o700, exist_ok=True)
+    _check_private_dir(directory)
+
+    sock = _connect(path)
+    if sock is not None:
+        sock.close()
+        raise RuntimeError(f"An edb server is already running at {path}")
+
+    # Remove a socket left by a server that didn't stop cleanly
+    with contextlib.suppress(FileNotFoundError):
+        os.unlink(path)
+
+    umask = os.umask(0o077)
+    try:
+        server = Server(path, expdb, parser, config)
+    finally:
+        os.umask(umask)
+
+    # Stop cleanly when terminated
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    logging.info("serving on %s", path)
+
+    try:
+        with server:
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(path)
@@ -0,0 +1,328 @@
+"""
+Synthetic experiments for tests and benchmarks
+
+The ``*_experiment`` functions write directory trees laid out like real model
+output, with small files that have valid metadata so that scans find the
+same streams and variables they would in production. :func:`fill_database`
+instead inserts rows straight into the database, for sizes that would take
+too long to write and scan.
+"""
+
+from __future__ import annotations
+
+import os
+import typing as T
+
+import numpy
+
+from .. import db
+from ..model import ff
+
+if T.TYPE_CHECKING:
+    import sqlalchemy as sqa
+
+# (name, standard_name, long_name, units) of the NetCDF variables written
+nc_variables = [
+    ("tas", "air_temperature", "Near-Surface Air Temperature", "K"),
+    ("pr", "precipitation_flux", "Precipitation", "kg m-2 s-1"),
+    ("psl", "air_pressure_at_mean_sea_level", "Sea Level Pressure", "Pa"),
+    ("uas", "eastward_wind", "Eastward Near-Surface Wind", "m s-1"),
+    ("vas", "northward_wind", "Northward Near-Surface Wind", "m s-1"),
+    ("sst", "sea_surface_temperature", "Sea Surface Temperature", "K"),
+    ("sos", "sea_surface_salinity", "Sea Surface Salinity", "0.001"),
+    ("hfls", "surface_upward_latent_heat_flux", "Surface Latent Heat Flux", "W m-2"),
+]
+
+# STASH section * 1000 + item of the UM fields written
+um_stash = [3236, 5216, 16222, 3225, 3226, 2207, 3217, 3234, 30201, 30202]
+
+_month_names = "jan feb mar apr may jun jul aug sep oct nov dec".split()
+
+
+def write_netcdf(
+    path: str,
+    variables: T.Sequence[T.Tuple[str, str, str, str]] = nc_variables[:2],
+    start: float = 0,
+    ntime: int = 1,
+    shape: T.Tuple[int, int] = (4, 8),
+):
+    """
+    Write a small CF-NetCDF file
+
+    Args:
+        path: File to write
+        variables: (name, standard_name, long_name, units) of the variables
+        start: First time, in days since 1980-01-01
+        ntime: Number of daily time steps
+        shape: Size of the (lat, lon) grid
+    """
+    import netCDF4
+
+    with netCDF4.Dataset(path, "w") as ds:
+        ds.createDimension("time", None)
+        ds.createDimension("lat", shape[0])
+        ds.createDimension("lon", shape[1])
+
+        time = ds.createVariable("time", "f8", ("time",))
+        time.units = "days since 1980-01-01"
+        time.calendar = "proleptic_gregorian"
+        time.axis = "T"
+        time[:] = start + numpy.arange(ntime)
+
+        lat = ds.createVariable("lat", "f8", ("lat",))
+        lat.units = "degrees_north"
+        lat[:] = numpy.linspace(-90, 90, shape[0])
+
+        lon = ds.createVariable("lon", "f8", ("lon",))
+        lon.units = "degrees_east"
+        lon[:] = numpy.linspace(0, 360, shape[1], endpoint=False)
+
+        for name, standard_name, long_name, units in variables:
+            v = ds.createVariable(name, "f4", ("time", "lat", "lon"))
+            v.standard_name = standard_name
+            v.long_name = long_name
+            v.units = units
+            v[:] = numpy.zeros((ntime, *shape), dtype="f4")
+
+
+def write_um(
+    path: str,
+    stash: T.Sequence[int] = um_stash[:2],
+    year: int = 1980,
+    month: int = 1,
+    shape: T.Tuple[int, int] = (4, 8),
+):
+    """
+    Write a small UM fieldsfile holding monthly means on a 360 day calendar
+
+    Each field is unpacked 64-bit data, with values equal to its STASH code
+
+    Args:
+        path: File to write
+        stash: STASH codes (section * 1000 + item) of the fields
+        year: Year of the fields
+        month: Month of the fields, 1-12
+        shape: Size of the (rows, columns) grid
+    """
+    nfields = len(stash)
+    size = shape[0] * shape[1]
+
+    # Header sections are the fixed length header then the lookup table,
+    # data starts at the next word
+    lookup_start = ff.fixed_header_words + 1
+    data_start = lookup_start + nfields * 64
+
+    start = [year, month, 1, 0, 0, 0]
+    end = [year + month // 12, month % 12 + 1, 1, 0, 0, 0]
+
+    flh = numpy.full(ff.fixed_header_words, ff.imdi, dtype=">i8")
+    flh[0] = 20
+    flh[4] = 3  # Fieldsfile
+    flh[7] = 2  # 360 day calendar
+    flh[ff.model_version_index] = 1003
+    flh[ff.t1_index : ff.t1_index + 6] = start
+    flh[ff.t2_index : ff.t2_index + 6] = end
+    flh[ff.lookup_start_index] = lookup_start
+    flh[ff.lookup_dim1_index] = 64
+    flh[ff.lookup_dim2_index] = nfields
+    flh[ff.data_start_index] = data_start
+    flh[ff.data_dim1_index] = nfields * size
+
+    lookup = numpy.zeros((nfields, 64), dtype=">i8")
+    lookup[:, ff.lbyr : ff.lbyr + 6] = start
+    lookup[:, ff.lbyrd : ff.lbyrd + 6] = end
+    lookup[:, ff.lbtim] = 122  # Mean over a period, 360 day calendar
+    lookup[:, ff.lblrec] = size
+    lookup[:, ff.lbrow] = shape[0]
+    lookup[:, ff.lbnpt] = shape[1]
+    lookup[:, ff.lbpack] = 0
+    lookup[:, ff.lbrel] = 3
+    lookup[:, ff.lbegin] = (data_start - 1) + numpy.arange(nfields) * size
+    lookup[:, ff.lbnrec] = size
+    lookup[:, ff.lbproc] = 128
+    lookup[:, ff.lbuser1] = 1  # Real data
+    lookup[:, ff.lbuser4] = stash
+    lookup[:, ff.lbuser7] = 1  # Atmosphere model
+
+    reals = lookup.view(">f8")
+    reals[:, ff.bdy] = 180 / shape[0]
+    reals[:, ff.bzy] = -90 - reals[:, ff.bdy] / 2
+    reals[:, ff.bdx] = 360 / shape[1]
+    reals[:, ff.bzx] = -reals[:, ff.bdx]
+    reals[:, ff.bmdi] = -1.0e30
+
+    data = numpy.repeat(numpy.asarray(stash, dtype=">f8"), size)
+
+    with open(path, "wb") as f:
+        f.write(flh.tobytes())
+        f.write(lookup.tobytes())
+        f.write(data.tobytes())
+
+
+def generic_experiment(path: str, files: int, per_dir: int = 100, **kwargs):
+    """
+    Write a 'generic' experiment, NetCDF files spread through subdirectories
+
+    Args:
+        path: Experiment directory
+        files: Number of files
+        per_dir: Number of files in each subdirectory
+        **kwargs: Passed to :func:`write_netcdf`
+    """
+    for i in range(files):
+        d = os.path.join(path, f"run{i // per_dir:04d}")
+        os.makedirs(d, exist_ok=True)
+        write_netcdf(os.path.join(d, f"out{i:06d}.nc"), start=i, **kwargs)
+
+
+def payu_experiment(path: str, outputs: int, ntime: int = 1, **kwargs):
+    """
+    Write an 'access-om-payu' experiment, with daily and monthly ocean
+    streams in each output directory
+
+    Args:
+        path: Experiment directory
+        outputs: Number of output directories
+        ntime: Number of time steps in each daily file
+        **kwargs: Passed to :func:`write_netcdf`
+    """
+    variables = nc_variables[5:]
+
+    for i in range(outputs):
+        d = os.path.join(path, f"output{i:03d}", "ocean")
+        os.makedirs(d, exist_ok=True)
+        write_netcdf(
+            os.path.join(d, "ocean_daily.nc"),
+            variables,
+            start=i * ntime,
+            ntime=ntime,
+            **kwargs,
+        )
+        write_netcdf(
+            os.path.join(d, "ocean_month.nc"),
+            variables,
+            start=i * ntime,
+            **kwargs,
+        )
+
+
+def um_experiment(
+    path: str, files: int, streams: T.Sequence[str] = ("pa", "pe"), **kwargs
+):
+    """
+    Write a 'um-rose' experiment, with monthly files for each stream in
+    'share/data/History_Data'
+
+    Args:
+        path: Experiment directory
+        files: Number of files in each stream
+        streams: Stream names
+        **kwargs: Passed to :func:`write_um`
+    """
+    d = os.path.join(path, "share", "data", "History_Data")
+    os.makedirs(d, exist_ok=True)
+
+    name = os.path.basename(os.path.normpath(path))[-5:]
+    for s in streams:
+        for i in range(files):
+            year = 1980 + i // 12
+            month = i % 12 + 1
+            write_um(
+                os.path.join(d, f"{name}a.{s}{year}{_month_names[month - 1]}"),
+                year=year,
+                month=month,
+                **kwargs,
+            )
+
+
+def fill_database(
+    conn: sqa.engine.Connection,
+    experiments: int,
+    streams: int,
+    variables: int,
+    files: int,
+    batch_size: int = 10000,
+):
+    """
+    Insert synthetic UM experiments straight into the database
+
+    Each experiment has the same number of streams, and each stream the same
+    number of variables and files, so there are ``experiments * streams *
+    variables`` variable rows and ``experiments * streams * files`` file rows
+
+    Args:
+        conn: Database connection
+        experiments: Number of experiments
+        streams: Number of streams in each experiment
+        variables: Number of variables in each stream
+        files: Number of files in each stream
+        batch_size: Number of rows inserted per statement
+    """
+
+    def insert(table, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                conn.execute(table.insert(), batch)
+                batch = []
+        if len(batch) > 0:
+            conn.execute(table.insert(), batch)
+
+    stream_ids = [
+        (e, s) for e in range(1, experiments + 1) for s in range(1, streams + 1)
+    ]
+
+    def stream_id(e, s):
+        return (e - 1) * streams + s
+
+    insert(
+        db.experiment,
+        (
+            {
+                "id": e,
+                "name": f"u-a{e:05d}",
+                "type_id": "um-rose",
+                "path": f"/scratch/cylc-run/u-a{e:05d}",
+            }
+            for e in range(1, experiments + 1)
+        ),
+    )
+    insert(
+        db.stream,
+        (
+            {"id": stream_id(e, s), "experiment_id": e, "name": f"a{e:05d}a.p{s}"}
+            for e, s in stream_ids
+        ),
+    )
+    insert(
+        db.variable,
+        (
+            {
+                "stream_id": stream_id(e, s),
+                "name": f"m01s{c // 1000:02d}i{c % 1000:03d}",
+                "standard_name": nc_variables[v % len(nc_variables)][1],
+                "long_name": nc_variables[v % len(nc_variables)][2],
+                "units": nc_variables[v % len(nc_variables)][3],
+                "method": "mean: time",
+            }
+            for e, s in stream_ids
+            for v, c in enumerate(range(1000, 1000 + variables))
+        ),
+    )
+    insert(
+        db.file,
+        (
+            {
+                "stream_id": stream_id(e, s),
+                "experiment_id": e,
+                "type_id": "um",
+                "relative_path": "share/data/History_Data/"
+                f"a{e:05d}a.p{s}{1980 + i // 12}{_month_names[i % 12]}",
+                "start_date": i * 30.0,
+                "end_date": (i + 1) * 30.0,
+            }
+            for e, s in stream_ids
+            for i in range(files)
+        ),
+    )
@@ -54,3 +54,16 @@ def test_parse_config(tmp_path):
 
 def test_config_defaults():
     jsonschema.validate(config_defaults, schema=config_schema)
+
+
+def test_sqlite_config(tmp_path):
+    path = tmp_path / "a.yaml"
+    path.write_text("sqlite:\n    journal_mode: wal\n    mmap_size: 0\n")
+
+    c = read_config(path)
+    assert c["sqlite"] == {"journal_mode": "wal", "mmap_size": 0}
+
+    # Only known pragmas may be set
+    path.write_text("sqlite:\n    foo: 1\n")
+    with pytest.raises(jsonschema.ValidationError):
+        read_config(path)
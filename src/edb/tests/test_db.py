@@ -1,7 +1,17 @@
-from ..db import experiment
+from ..db import (
+    experiment,
+    scan_history,
+    connect,
+    migrations,
+    schema_version,
+    upgrade_schema,
+)
+from ..experimentdb import ExperimentDB
 from ..model.experiment import Experiment
+from .. import db
 from .conftest import setup_sample_data
 
+import pytest
 import sqlalchemy as sqa
 
 
@@ -23,3 +33,190 @@ def test_sample_data(session):
     setup_sample_data(session)
 
     exp = session.query(Experiment).filter_by(type_id="um-rose").one()
+
+
+def test_add_missing_columns(tmp_path):
+    url = f"sqlite:///{tmp_path}/old.sqlite"
+
+    # A database created before the fingerprint columns were added
+    engine = sqa.create_engine(url)
+    with engine.connect() as c:
+        c.execute(
+            sqa.text(
+                "CREATE TABLE file (id INTEGER PRIMARY KEY, stream_id INTEGER, "
+                "experiment_id INTEGER, relative_path VARCHAR NOT NULL, "
+                "start_date FLOAT, end_date FLOAT, type_id VARCHAR NOT NULL, "
+                "last_seen DATETIME)"
+            )
+        )
+
+    engine = connect(url)
+    with engine.connect() as c:
+        r = c.execute(sqa.text("PRAGMA table_info(file)")).fetchall()
+
+    assert {"size", "mtime", "inode"} <= {row[1] for row in r}
+
+
+def test_sqlite_pragmas(tmp_path):
+    engine = connect(f"sqlite:///{tmp_path}/db.sqlite", {"busy_timeout": 1234})
+
+    with engine.connect() as c:
+        assert c.execute(sqa.text("PRAGMA journal_mode")).scalar() == "wal"
+        assert c.execute(sqa.text("PRAGMA busy_timeout")).scalar() == 1234
+
+
+def test_rebuild_fts(tmp_path):
+    url = f"sqlite:///{tmp_path}/old.sqlite"
+
+    # A database with an older definition of the text index, from before
+    # schema versions
+    engine = connect(url)
+    with engine.begin() as c:
+        c.execute(sqa.text("PRAGMA user_version = 0"))
+        c.execute(sqa.text("DROP TABLE variable_fts"))
+        c.execute(
+            sqa.text(
+                "CREATE VIRTUAL TABLE variable_fts USING fts5(name, long_name, "
+                "standard_name, content = variable, content_rowid = id)"
+            )
+        )
+        c.execute(sqa.text("INSERT INTO variable (id, name) VALUES (1, 'temp')"))
+
+    # The index is recreated and filled
+    engine = connect(url)
+    with engine.connect() as c:
+        sql = c.execute(
+            sqa.text("SELECT sql FROM sqlite_master WHERE name = 'variable_fts'")
+        ).scalar()
+        assert "prefix" in sql
+
+        r = c.execute(
+            sqa.text("SELECT rowid FROM variable_fts WHERE variable_fts MATCH 'te*'")
+        ).fetchall()
+        assert r == [(1,)]
+
+
+def test_create_indexes(tmp_path):
+    url = f"sqlite:///{tmp_path}/old.sqlite"
+
+    # A database created before the index was added, from before schema
+    # versions
+    engine = connect(url)
+    with engine.begin() as c:
+        c.execute(sqa.text("PRAGMA user_version = 0"))
+        c.execute(sqa.text("DROP INDEX ix_variable_stream_id"))
+
+    engine = connect(url)
+    with engine.connect() as c:
+        r = c.execute(sqa.text("PRAGMA index_list(variable)")).fetchall()
+
+    assert "ix_variable_stream_id" in {row[1] for row in r}
+
+
+def test_schema_version(tmp_path):
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+
+    # New databases are at the current version
+    engine = connect(url)
+    with engine.connect() as c:
+        assert schema_version(c) == len(migrations)
+
+    # Out of date databases are upgraded when connecting, unless disabled
+    with engine.begin() as c:
+        c.execute(sqa.text("PRAGMA user_version = 0"))
+
+    with pytest.raises(RuntimeError):
+        connect(url, upgrade=False)
+
+    engine = connect(url)
+    with engine.connect() as c:
+        assert schema_version(c) == len(migrations)
+
+    # Upgrading an up to date database does nothing
+    assert upgrade_schema(engine) == len(migrations)
+
+
+def test_migrate_scan_history(tmp_path):
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+
+    # A version 1 database
+    engine = connect(url)
+    with engine.begin() as c:
+        c.execute(sqa.text("DROP TABLE scan_history"))
+        c.execute(sqa.text("PRAGMA user_version = 1"))
+
+    engine = connect(url)
+    with engine.connect() as c:
+        assert (
+            c.execute(sqa.select([sqa.func.count()]).select_from(scan_history)).scalar()
+            == 0
+        )
+
+
+def test_migrate_field_index(tmp_path):
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+
+    # A version 2 database
+    engine = connect(url)
+    with engine.begin() as c:
+        c.execute(sqa.text("ALTER TABLE file DROP COLUMN fields"))
+        c.execute(sqa.text("PRAGMA user_version = 2"))
+
+    engine = connect(url)
+    with engine.connect() as c:
+        columns = [r[1] for r in c.execute(sqa.text("PRAGMA table_info(file)"))]
+        assert "fields" in columns
+        assert schema_version(c) == len(migrations)
+
+
+def test_migrate_field_times(tmp_path):
+    url = f"sqlite:///{tmp_path}/db.sqlite"
+
+    # A version 3 database with an old field index
+    engine = connect(url)
+    with engine.begin() as c:
+        c.execute(
+            db.experiment.insert(),
+            {"id": 1, "name": "a", "path": "/a", "type_id": "um-rose"},
+        )
+        c.execute(db.stream.insert(), {"id": 1, "experiment_id": 1, "name": "s"})
+        c.execute(
+            db.file.insert(),
+            {
+                "stream_id": 1,
+                "experiment_id": 1,
+                "relative_path": "a.pa1980jan",
+                "type_id": "um",
+                "fields": b"old",
+            },
+        )
+        c.execute(sqa.text("PRAGMA user_version = 3"))
+
+    # The index is recreated by the next scan
+    engine = connect(url)
+    with engine.connect() as c:
+        assert c.execute(sqa.select([db.file.c.fields])).scalar() is None
+
+
+def test_no_trigram(tmp_path, monkeypatch):
+    # SQLite older than 3.34
+    monkeypatch.setattr(db, "has_trigram", lambda conn: False)
+
+    engine = db.connect(f"sqlite:///{tmp_path}/test.db")
+    with engine.begin() as conn:
+        tables = sqa.inspect(conn).get_table_names()
+        assert "variable_fts" in tables
+        assert "variable_trigram" not in tables
+
+        conn.execute(
+            db.experiment.insert(),
+            {"id": 1, "name": "a", "path": "/a", "type_id": "generic"},
+        )
+        conn.execute(db.stream.insert(), {"id": 1, "experiment_id": 1, "name": "s"})
+        conn.execute(db.variable.insert(), {"id": 1, "stream_id": 1, "name": "tas"})
+
+    edb = ExperimentDB(conn=engine)
+    assert list(edb.search(variable="tas").index) == [1]
+
+    with pytest.raises(ValueError, match="variable_part"):
+        edb.search(variable_part="tas")
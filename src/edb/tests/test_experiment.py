@@ -1,7 +1,14 @@
-from ..model.experiment import experiment_factory
+from ..model.experiment import Experiment, experiment_factory
+from ..options import experiment_types
+from ..utils import all_subclasses
 from ..model.experiment.generic import Generic
+from ..model.experiment.payu import Payu
+import os
 import xarray
 import numpy
+import pandas
+import cftime
+from datetime import timedelta
 
 
 def test_experiment_generic(session, tmp_path):
@@ -37,3 +44,96 @@ def test_experiment_factory():
 
     exp = experiment_factory("access-cm-payu", "")
     assert exp.type == "access-cm-payu"
+
+
+def test_experiment_rescan(tmp_path):
+    ds = xarray.DataArray(
+        numpy.zeros((10, 10, 10)), dims=["time", "latitude", "longitude"], name="foo"
+    )
+    ocean = tmp_path / "output000" / "ocean"
+    ocean.mkdir(parents=True)
+    ds.to_netcdf(ocean / "ocean.nc")
+
+    exp = Payu(tmp_path)
+    exp.update()
+
+    assert len(exp.files) == 1
+    f = exp.files[0]
+    assert f.size == (ocean / "ocean.nc").stat().st_size
+    assert exp.last_scanned is not None
+
+    # A directory that hasn't changed since the last scan isn't listed again
+    ds.to_netcdf(ocean / "ocean_month.nc")
+    os.utime(ocean, (0, 0))
+    exp.update()
+    assert len(exp.files) == 1
+
+    # Once the directory is modified the new file is found
+    os.utime(ocean)
+    exp.update()
+    assert len(exp.files) == 2
+
+    # Changed files are detected by their fingerprint
+    st = (ocean / "ocean.nc").stat()
+    assert not f.update_fingerprint(st)
+    (ocean / "ocean.nc").write_bytes(b"changed")
+    assert f.update_fingerprint((ocean / "ocean.nc").stat())
+
+
+def test_experiment_time_range(tmp_path):
+    ds = xarray.DataArray(
+        numpy.zeros((12,)),
+        dims=["time"],
+        coords={"time": pandas.date_range("1990-01-01", periods=12, freq="MS")},
+        name="foo",
+    )
+    ds.to_netcdf(tmp_path / "foo.nc")
+
+    exp = Generic(tmp_path)
+    exp.update()
+
+    stream = exp.streams["foo.nc"]
+    assert stream.calendar in ["standard", "proleptic_gregorian"]
+
+    f = exp.files[0]
+    start, end = cftime.num2date(
+        [f.start_date, f.end_date], stream.time_units, stream.calendar
+    )
+    assert (start.year, start.month) == (1990, 1)
+    assert (end.year, end.month) == (1990, 12)
+
+
+def test_experiment_reidentify(tmp_path):
+    ds = xarray.Dataset({"foo": (("time",), numpy.zeros(3))})
+    ds.to_netcdf(tmp_path / "foo.nc")
+
+    exp = Generic(tmp_path)
+    metrics = exp.update()
+    assert metrics["streams identified"] == 1
+
+    stream = exp.streams["foo.nc"]
+    foo = stream.variables[0]
+
+    # Unchanged streams aren't identified again
+    metrics = exp.update()
+    assert metrics["streams identified"] == 0
+
+    # Until their first file changes, variables are merged by name
+    ds["bar"] = ds["foo"]
+    ds["foo"].attrs["long_name"] = "Foo"
+    ds.to_netcdf(tmp_path / "foo.nc")
+    metrics = exp.update()
+    assert metrics["streams identified"] == 1
+    assert [v.name for v in stream.variables] == ["foo", "bar"]
+    assert stream.variables[0] is foo
+    assert foo.long_name == "Foo"
+
+    # Or the stream is old enough
+    metrics = exp.update(reidentify_age=timedelta(0))
+    assert metrics["streams identified"] == 1
+
+
+def test_experiment_types():
+    # The command line choices match the experiment classes
+    types = [e.type for e in all_subclasses(Experiment) if e.type is not None]
+    assert experiment_types == sorted(types)
@@ -1,10 +1,25 @@
-from ..experimentdb import ExperimentDB
+from ..experimentdb import (
+    ExperimentDB,
+    search_params,
+    _read_variable,
+    _search_select,
+    _files_select,
+    _variable_files,
+    _variable_fields,
+    _period_end,
+)
 import sqlalchemy as sqa
 from .. import db
 import pytest
+import json
+import os
+import pickle
+import subprocess
+import sys
 from unittest.mock import patch
 import xarray
 import numpy
+import pandas
 
 
 @pytest.fixture
@@ -50,6 +65,100 @@ def test_fts(conn, sample_generic):
     assert len(r) == 1
 
 
+def test_fts_rank(conn, sample_generic):
+    conn.execute(
+        db.variable.insert(),
+        [
+            {"id": 7, "stream_id": 1, "name": "m01s03i236", "long_name": "air"},
+            {"id": 8, "stream_id": 1, "name": "m01s03i237", "long_name": "air air"},
+        ],
+    )
+    edb = ExperimentDB(conn=conn)
+
+    # Best matches first
+    r = edb.search(variable="air")
+    assert list(r.index) == [8, 7]
+    assert list(edb.search(variable="air", limit=1).index) == [8]
+
+    # Prefix searches
+    assert list(edb.search(variable_prefix="temp").index) == [5]
+    assert list(edb.search(variable_prefix="u_w").index) == [6]
+
+    # Partial names
+    assert sorted(edb.search(variable_part="s03i23").index) == [7, 8]
+    assert list(edb.search(variable_part="3i237").index) == [8]
+
+
+def test_search_without_fts():
+    # Text indexes are only joined for text searches
+    assert "variable_fts" not in str(_search_select(variable_name="T"))
+    assert "variable_fts" not in str(_files_select(standard_name="temperature"))
+    assert "variable_fts" in str(_search_select(variable="T"))
+
+
+def query_plan(conn, sel):
+    sql = str(sel.compile(conn, compile_kwargs={"literal_binds": True}))
+    return [r[3] for r in conn.execute(sqa.text("EXPLAIN QUERY PLAN " + sql))]
+
+
+@pytest.mark.parametrize("param", search_params.keys())
+@pytest.mark.parametrize("select", [_search_select, _files_select])
+def test_search_query_plan(conn, param, select):
+    plan = query_plan(conn, select(**{param: "foo"}))
+
+    # Searches start from an index rather than scanning a table, other than
+    # the full text index itself
+    scans = [p for p in plan if p.startswith("SCAN") and "VIRTUAL TABLE" not in p]
+    assert scans == [], plan
+
+
+def test_files_query_plan(conn):
+    plan = query_plan(conn, _variable_files(conn, 1))
+
+    # Files are read from the index in date order
+    assert all(p.startswith("SEARCH") for p in plan), plan
+
+
+def test_iter_search(conn, sample_generic):
+    edb = ExperimentDB(conn=conn)
+
+    chunks = list(edb.iter_search(chunksize=1))
+    assert [len(c) for c in chunks] == [1, 1]
+    pandas.testing.assert_frame_equal(pandas.concat(chunks), edb.search())
+
+
+def test_iter_files(conn, sample_generic):
+    edb = ExperimentDB(conn=conn)
+
+    chunks = list(edb.iter_files(chunksize=1, standard_name="temperature"))
+    assert len(chunks) == 1
+    assert chunks[0].loc[5, "path"] == "/foo/foo.nc"
+
+    pandas.testing.assert_frame_equal(pandas.concat(edb.iter_files()), edb.files())
+
+
+def test_iter_paths(conn, sample_generic):
+    edb = ExperimentDB(conn=conn)
+
+    assert list(edb.iter_paths(standard_name="temperature")) == [(5, "/foo/foo.nc")]
+
+    files = edb.files()
+    assert sorted(edb.iter_paths()) == sorted(zip(files.index, files["path"]))
+
+
+def test_lazy_imports():
+    # The command line tool shouldn't load the data libraries or the database
+    # model until needed, even to build its parser
+    code = "import sys, edb.cli; edb.cli.make_parser(); print(' '.join(sys.modules))"
+    out = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    loaded = set(out.stdout.split())
+
+    for mod in ["pandas", "xarray", "numpy", "netCDF4", "dask", "edb.model"]:
+        assert mod not in loaded
+
+
 def test_open_dataarrays(conn, sample_generic):
 
     edb = ExperimentDB(conn=conn)
@@ -75,3 +184,621 @@ def test_open_dataarrays(conn, sample_generic):
 
         # Returned value is the 'temperature' from sample
         xarray.testing.assert_identical(r.iloc[0], sample["T"])
+
+
+def test_scan_parallel(conn, tmp_path):
+    for name in ["a", "b", "c"]:
+        ds = xarray.Dataset({name: (("time", "lat", "lon"), numpy.zeros((10, 10, 10)))})
+        ds.to_netcdf(tmp_path / f"{name}.nc")
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("generic", str(tmp_path), workers=2)
+
+    r = edb.search(experiment=tmp_path.name)
+    assert sorted(r.variable) == ["a", "b", "c"]
+
+    # Rescanning doesn't duplicate anything
+    edb.scan("generic", str(tmp_path), workers=2)
+
+    r = edb.search(experiment=tmp_path.name)
+    assert sorted(r.variable) == ["a", "b", "c"]
+
+
+def test_scan_rescan(conn, tmp_path):
+    def write(name):
+        ds = xarray.Dataset({name: (("time", "lat", "lon"), numpy.zeros((10, 10, 10)))})
+        ds.to_netcdf(tmp_path / f"{name}.nc")
+
+    write("a")
+    write("b")
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("generic", str(tmp_path), batch_size=1)
+
+    # New files are added to the known experiment
+    write("c")
+    metrics = edb.scan("generic", str(tmp_path), batch_size=1)
+
+    # Only the new stream's variables are identified
+    assert metrics["files modified"] == 1
+    assert metrics["streams identified"] == 1
+
+    count = lambda t: conn.execute(
+        sqa.select([sqa.func.count()]).select_from(t)
+    ).scalar()
+    assert count(db.experiment) == 1
+    assert count(db.stream) == 3
+    assert count(db.file) == 3
+    assert count(db.variable) == 3
+
+    # The text index stays in sync with the variables
+    r = edb.search(variable="a")
+    assert list(r.variable) == ["a"]
+
+
+def test_scan_rescan_writes(conn, tmp_path):
+    from . import synthetic
+
+    synthetic.generic_experiment(tmp_path, 20, per_dir=5)
+
+    writes = []
+
+    @sqa.event.listens_for(conn, "before_cursor_execute")
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.split()[0] in ("INSERT", "UPDATE"):
+            writes.append(statement.split()[0:3])
+
+    # Rows of all the streams are written together
+    edb = ExperimentDB(conn=conn)
+    edb.scan("generic", str(tmp_path))
+    assert len(writes) < 10
+
+    # Rescanning unchanged files only updates the scan times
+    writes.clear()
+    edb.scan("generic", str(tmp_path))
+    assert sorted(w[1] for w in writes if w[0] == "UPDATE") == ["experiment", "file"]
+    assert not any("stream" in w or "variable" in w for w in writes)
+
+    # A changed file has its row written
+    path = tmp_path / "run0000" / "out000001.nc"
+    os.utime(path, (0, 0))
+    writes.clear()
+    edb.scan("generic", str(tmp_path))
+    assert sum(w[:2] == ["UPDATE", "file"] for w in writes) == 2
+
+    r = conn.execute(
+        sqa.select([db.file.c.mtime]).where(
+            db.file.c.relative_path == "run0000/out000001.nc"
+        )
+    ).scalar()
+    assert r == 0
+
+
+def test_scan_fts(conn, tmp_path):
+    from . import synthetic
+
+    synthetic.generic_experiment(tmp_path / "a", 3)
+
+    def triggers():
+        return sorted(
+            r
+            for r, in conn.execute(
+                sqa.text("SELECT name FROM sqlite_master WHERE type = 'trigger'")
+            )
+        )
+
+    before = triggers()
+
+    # New variables are indexed after they are all written
+    edb = ExperimentDB(conn=conn)
+    edb.scan("generic", str(tmp_path / "a"))
+    assert len(edb.search(variable="near surface air")) == 3
+    assert len(edb.search(variable_part="Precip")) == 3
+    assert triggers() == before
+
+    # Other inserts are still indexed by the triggers
+    conn.execute(
+        db.variable.insert(), {"stream_id": 1, "name": "x", "long_name": "air"}
+    )
+    assert len(edb.search(variable="air")) == 4
+
+
+def test_scan_stat_error(conn, tmp_path, monkeypatch):
+    from . import synthetic
+
+    synthetic.generic_experiment(tmp_path, 3)
+    bad = str(tmp_path / "run0000" / "out000001.nc")
+
+    stat = os.stat
+
+    def stat_error(path, *args, **kwargs):
+        if str(path) == bad:
+            raise PermissionError(13, "Permission denied", path)
+        return stat(path, *args, **kwargs)
+
+    edb = ExperimentDB(conn=conn)
+
+    # New files that can't be checked are counted as failed, and the rest of
+    # the scan continues
+    with monkeypatch.context() as m:
+        m.setattr(os, "stat", stat_error)
+        metrics = edb.scan("generic", str(tmp_path))
+    assert metrics["files failed"] == 1
+    assert metrics["files new"] == 2
+
+    # Known files are kept
+    edb.scan("generic", str(tmp_path))
+    with monkeypatch.context() as m:
+        m.setattr(os, "stat", stat_error)
+        metrics = edb.scan("generic", str(tmp_path))
+    assert metrics["files failed"] == 1
+    assert edb.files().path.nunique() == 3
+
+
+def test_scan_history(conn, tmp_path):
+    ds = xarray.Dataset({"a": (("time",), numpy.zeros(3))})
+    ds.to_netcdf(tmp_path / "a.nc")
+
+    # Not NetCDF, but looks like it
+    (tmp_path / "b.nc").write_bytes(b"CDF\x01" + b"\xff" * 100)
+
+    edb = ExperimentDB(conn=conn)
+    metrics = edb.scan("generic", str(tmp_path))
+
+    # A bad file is counted but doesn't stop the scan
+    assert metrics["files new"] == 2
+    assert metrics["files failed"] >= 1
+    assert metrics["identify seconds"] > 0
+
+    edb.scan("generic", str(tmp_path))
+
+    # Each scan of the experiment is recorded, most recent first
+    history = edb.scan_history()
+    assert list(history.experiment) == [tmp_path.name] * 2
+    assert list(history["files unchanged"]) == [2, 0]
+    assert history.iloc[0].seconds > 0
+
+
+def test_scan_fields(conn, tmp_path):
+    from . import synthetic
+
+    path = tmp_path / "u-ab123"
+    synthetic.um_experiment(path, 2, stash=[3236, 5216], streams=["pa"])
+
+    edb = ExperimentDB(conn=conn)
+    metrics = edb.scan("um-rose", str(path))
+    assert metrics["fields seconds"] > 0
+
+    # Each UM file has an index of its fields
+    rows = conn.execute(
+        sqa.select([db.file.c.fields, db.file.c.start_date]).order_by(
+            db.file.c.start_date
+        )
+    ).fetchall()
+    assert len(rows) == 2
+
+    for fields, start in rows:
+        index = _variable_fields(fields, "m01s03i236", "mean: time (1 hour)")
+        assert list(index["stash"]) == [3236]
+        assert index[0]["t1"] == start
+        assert index[0]["t2"] == start + 30
+
+    assert len(_variable_fields(rows[0].fields, "m01s01i001", "")) == 0
+    assert _variable_fields(None, "m01s03i236", "") is None
+
+    # Files without an index, e.g. from before indexes were added, get one
+    conn.execute(db.file.update().values(fields=None))
+    edb.scan("um-rose", str(path))
+    assert all(f is not None for f, in conn.execute(sqa.select([db.file.c.fields])))
+
+
+def test_open_um(conn, tmp_path):
+    import cftime
+    import dask.array
+    from . import synthetic
+
+    path = tmp_path / "u-ab123"
+    synthetic.um_experiment(path, 3, stash=[3236, 5216], streams=["pa"])
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("um-rose", str(path))
+
+    # Read lazily from the field index, without iris
+    da = edb.open_dataarray(variable_name="m01s05i216")
+    assert isinstance(da.data, dask.array.Array)
+    assert da.dims == ("time", "latitude", "longitude")
+    assert da.shape == (3, 4, 8)
+    assert da.attrs["STASH"] == "m01s05i216"
+    assert (da.values == 5216).all()
+    assert list(da.latitude.values) == [-67.5, -22.5, 22.5, 67.5]
+
+    # Means are at the middle of the month
+    assert da.time.values[0] == cftime.datetime(1980, 1, 16, calendar="360_day")
+
+    da = edb.open_dataarray(
+        variable_name="m01s05i216", time=slice("1980-02", "1980-02")
+    )
+    assert da.shape == (1, 4, 8)
+    assert da.time.values[0] == cftime.datetime(1980, 2, 16, calendar="360_day")
+
+
+def test_open_um_iris(conn, tmp_path):
+    pytest.importorskip("iris")
+    from . import synthetic
+    from ..experimentdb import _open_iris
+
+    path = tmp_path / "u-ab123"
+    synthetic.um_experiment(path, 2, stash=[3236], streams=["pa"])
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("um-rose", str(path))
+
+    # The same coordinates as when loading with iris
+    da = edb.open_dataarray(variable_name="m01s03i236")
+    paths = sorted(str(p) for p in (path / "share/data/History_Data").iterdir())
+    expected = _open_iris(paths, "m01s03i236")
+
+    assert list(da.time.values) == list(expected.time.values)
+    numpy.testing.assert_array_equal(da.values, expected.values)
+
+
+def test_open_cache(conn, tmp_path):
+    from . import synthetic
+
+    path = tmp_path / "u-ab123"
+    synthetic.um_experiment(path, 3, stash=[3236], streams=["pa"])
+
+    edb = ExperimentDB(conn=conn)
+    edb.open_files.maxsize = 2
+    edb.scan("um-rose", str(path))
+    xarray_options = xarray.get_options()
+
+    a = edb.open_dataarray(variable_name="m01s03i236")
+    a.attrs["foo"] = "bar"
+    b = edb.open_dataarray(variable_name="m01s03i236")
+    assert edb.cache_info()["arrays"]["hits"] == 1
+    assert "foo" not in b.attrs
+
+    # Different times are cached separately
+    edb.open_dataarray(variable_name="m01s03i236", time=slice("1980", "1980"))
+    assert edb.cache_info()["arrays"]["misses"] == 2
+
+    # Scanning the experiment again invalidates the cache
+    edb.scan("um-rose", str(path))
+    edb.open_dataarray(variable_name="m01s03i236")
+    assert edb.cache_info()["arrays"]["misses"] == 3
+
+    # No more files are kept open than configured
+    assert (b.values == 3236).all()
+    assert edb.cache_info()["open files"]["size"] == 2
+
+    # The caches belong to each database, xarray's settings are unchanged
+    other = ExperimentDB(conn=conn)
+    assert other.cache_info()["open files"]["size"] == 0
+    assert other.open_files.maxsize == 128
+    assert xarray.get_options() == xarray_options
+
+    # Open files aren't sent to other processes
+    assert len(pickle.loads(pickle.dumps(edb.open_files))) == 0
+
+    # Changing values in place doesn't change later opens
+    b += 5
+    b[0] = -1
+    c = edb.open_dataarray(variable_name="m01s03i236")
+    assert (c.values == 3236).all()
+
+
+def test_open_cache_eager(conn, tmp_path):
+    from . import synthetic
+
+    synthetic.payu_experiment(tmp_path, 2, ntime=2)
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("access-om-payu", str(tmp_path))
+
+    # Eager arrays aren't cached, so changing their values is safe
+    a = edb.open_dataarray(variable_name="sst", stream="ocean_daily")
+    a += 5
+    b = edb.open_dataarray(variable_name="sst", stream="ocean_daily")
+    assert float(b.max()) == 0
+
+    # and don't count towards the cache statistics
+    assert edb.cache_info()["arrays"] == {
+        "hits": 0,
+        "misses": 0,
+        "size": 0,
+        "maxsize": edb.cache.maxsize,
+    }
+
+
+def test_open_time_range(conn):
+    conn.execute(
+        db.experiment.insert().values(id=1, name="foo", type_id="generic", path="/foo")
+    )
+    conn.execute(
+        db.stream.insert().values(
+            id=1,
+            experiment_id=1,
+            name="foo",
+            time_units="days since 1970-01-01",
+            calendar="standard",
+        )
+    )
+    # Files covering 1980, 1990 and 2000
+    conn.execute(
+        db.file.insert(),
+        [
+            {
+                "id": i,
+                "stream_id": 1,
+                "experiment_id": 1,
+                "type_id": "netcdf",
+                "relative_path": f"{year}.nc",
+                "start_date": start,
+                "end_date": start + 365,
+            }
+            for i, (year, start) in enumerate(
+                [(1980, 3652), (1990, 7305), (2000, 10957)]
+            )
+        ],
+    )
+    conn.execute(db.variable.insert().values(id=5, stream_id=1, name="T"))
+
+    sample = xarray.Dataset(
+        {"T": (("time",), numpy.zeros(12))},
+        coords={"time": pandas.date_range("1990-01-01", periods=12, freq="MS")},
+    )
+
+    edb = ExperimentDB(conn=conn)
+
+    with patch("xarray.open_dataset", return_value=sample) as p:
+        edb.open_dataarrays(variable_id=5, time=slice("1990-03-01", "1990-06-01"))
+
+        p.assert_called_once_with("/foo/1990.nc")
+
+    # numpy dates, as accepted by xarray's sel
+    with patch("xarray.open_dataset", return_value=sample) as p:
+        da = edb.open_dataarray(
+            variable_id=5,
+            time=slice(numpy.datetime64("1990-03-01"), numpy.datetime64("1990-06-01")),
+        )
+
+        p.assert_called_once_with("/foo/1990.nc")
+        assert len(da.time) == 4
+
+
+def test_open_partial_date(conn, tmp_path):
+    # Mid-month times, so the 1991 file starts after 1991-01-01
+    for i, year in enumerate([1990, 1991]):
+        ds = xarray.Dataset(
+            {"T": (("time", "lat"), numpy.full((12, 3), year))},
+            coords={
+                "time": pandas.date_range(f"{year}-01-01", periods=12, freq="MS")
+                + pandas.Timedelta(days=15),
+                "lat": [-10, 0, 10],
+            },
+        )
+        ocean = tmp_path / f"output{i:03d}" / "ocean"
+        ocean.mkdir(parents=True)
+        ds.to_netcdf(ocean / "ocean.nc")
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("access-om-payu", str(tmp_path))
+
+    # A partial stop date includes the whole period, like xarray
+    full = edb.open_dataarray(variable_name="T")
+    for time in [slice("1991", "1991"), slice("1990-06", "1991-02")]:
+        da = edb.open_dataarray(variable_name="T", time=time)
+        assert da.shape == full.sel(time=time).shape
+
+    da = edb.open_dataarray(variable_name="T", time=slice("1990-06", "1990-12-16"))
+    assert da.shape == (7, 3)
+
+    # No files in the time range
+    with pytest.raises(ValueError, match="No data"):
+        edb.open_dataarray(variable_name="T", time=slice("2050", "2060"))
+
+
+def test_period_end():
+    import cftime
+
+    def end(date):
+        return _period_end(date, "360_day")
+
+    assert end("1991") == cftime.datetime(1992, 1, 1, calendar="360_day")
+    assert end("1991-12") == cftime.datetime(1992, 1, 1, calendar="360_day")
+    assert end("1991-02-30") == cftime.datetime(1991, 3, 1, calendar="360_day")
+    assert end("1991-02-30T23") == cftime.datetime(1991, 3, 1, calendar="360_day")
+    assert end("1991-02-01 06:30") == cftime.datetime(
+        1991, 2, 1, 6, 31, calendar="360_day"
+    )
+
+
+def test_open_lazy(conn, tmp_path):
+    pytest.importorskip("dask")
+
+    conn.execute(
+        db.experiment.insert().values(
+            id=1, name="foo", type_id="generic", path=str(tmp_path)
+        )
+    )
+    conn.execute(db.stream.insert().values(id=1, experiment_id=1, name="foo"))
+    conn.execute(db.variable.insert().values(id=5, stream_id=1, name="T"))
+
+    for i, year in enumerate([1990, 1991]):
+        ds = xarray.Dataset(
+            {
+                "T": (("time", "lat"), numpy.full((12, 3), year)),
+                "U": (("time", "lat"), numpy.zeros((12, 3))),
+            },
+            coords={
+                "time": pandas.date_range(f"{year}-01-01", periods=12, freq="MS"),
+                "lat": [-10, 0, 10],
+            },
+        )
+        ds.to_netcdf(tmp_path / f"{year}.nc")
+
+        conn.execute(
+            db.file.insert().values(
+                id=i,
+                stream_id=1,
+                experiment_id=1,
+                type_id="netcdf",
+                relative_path=f"{year}.nc",
+                start_date=i,
+            )
+        )
+
+    edb = ExperimentDB(conn=conn)
+    da = edb.open_dataarray(variable_id=5, lazy=True)
+
+    # Data is not loaded
+    assert da.chunks is not None
+    assert da.shape == (24, 3)
+
+    assert da.sel(time="1991-06").values.tolist() == [[1991] * 3]
+
+
+def test_open_template(conn, tmp_path):
+    pytest.importorskip("dask")
+
+    _write_years(tmp_path, [1990, 1991])
+
+    edb = ExperimentDB(conn=conn)
+    edb.scan("access-om-payu", str(tmp_path))
+
+    # Count file reads (a plain function, as dask inspects Mock attributes)
+    reads = []
+
+    def read(path, varname):
+        reads.append(path)
+        return _read_variable(path, varname)
+
+    with patch("edb.experimentdb._read_variable", read):
+        da = edb.open_dataarray(variable_name="T", lazy=True)
+
+        # No files read until the data is needed
+        assert len(reads) == 0
+        assert da.shape == (24, 3)
+        assert da.lat.values.tolist() == [-10, 0, 10]
+        assert da.time.values[12] == numpy.datetime64("1991-01-01")
+
+        assert da.sel(time="1991-06").values.tolist() == [[1991] * 3]
+        assert len(reads) == 1
+
+
+def test_open_template_curvilinear(conn, tmp_path):
+    pytest.importorskip("dask")
+
+    lon = numpy.arange(6.0).reshape(2, 3)
+    for i, year in enumerate([1990, 1991]):
+        ds = xarray.Dataset(
+            {"T": (("time", "y", "x"), numpy.full((12, 2, 3), year))},
+            coords={
+                "time": pandas.date_range(f"{year}-01-01", periods=12, freq="MS"),
+                "x": [0, 1, 2],
+                "lon": (("y", "x"), lon),
+            },
+        )
+        ocean = tmp_path / f"output{i:03d}" / "ocean"
+        ocean.mkdir(parents=True)
+        ds.to_netcdf(ocean / "ocean.nc")
+
+    edb = ExperimentDB(conn=conn)
+    edb.config["scan references"] = False
+    edb.scan("access-om-payu", str(tmp_path))
+
+    # Only dimension coordinate values are stored
+    template = json.loads(conn.execute(sqa.select([db.stream.c.template])).scalar())
+    assert template["coords"]["x"]["data"] == [0, 1, 2]
+    assert "data" not in template["coords"]["lon"]
+
+    # Others are read from the first file
+    with patch("edb.experimentdb._open_mfdataarray") as open_mfdataarray:
+        da = edb.open_dataarray(variable_name="T", lazy=True)
+        open_mfdataarray.assert_not_called()
+    assert da.chunks is not None
+    assert da.lon.values.tolist() == lon.tolist()
+    assert da.sel(time="1991-06").values.tolist() == [[[1991] * 3] * 2]
+
+
+def test_open_time_counter(conn, tmp_path):
+    pytest.importorskip("dask")
+
+    for i, year in enumerate([1990, 1991]):
+        time = pandas.date_range(f"{year}-01-01", periods=12, freq="MS")
+        ds = xarray.Dataset(
+            {"T": (("time_counter", "lat"), numpy.full((12, 3), year))},
+            coords={
+                "time_counter": ("time_counter", time, {"axis": "T"}),
+                "lat": [-10, 0, 10],
+            },
+        )
+        ocean = tmp_path / f"output{i:03d}" / "ocean"
+        ocean.mkdir(parents=True)
+        ds.to_netcdf(ocean / "ocean.nc")
+
+    edb = ExperimentDB(conn=conn)
+    edb.config["scan references"] = False
+    edb.scan("access-om-payu", str(tmp_path))
+
+    # Concatenated along the stream's time dimension
+    with patch("edb.experimentdb._open_template", return_value=None):
+        da = edb.open_dataarray(variable_name="T", lazy=True)
+    assert da.dims == ("time_counter", "lat")
+    assert da.shape == (24, 3)
+
+    da = edb.open_dataarray(variable_name="T", time=slice("1991-06", "1991-06"))
+    assert da.dims == ("time_counter", "lat")
+    assert da.values.tolist() == [[1991] * 3]
+
+
+def _write_years(path, years):
+    for i, year in enumerate(years):
+        ds = xarray.Dataset(
+            {"T": (("time", "lat"), numpy.full((12, 3), year))},
+            coords={
+                "time": pandas.date_range(f"{year}-01-01", periods=12, freq="MS"),
+                "lat": [-10, 0, 10],
+            },
+        )
+        ocean = path / f"output{i:03d}" / "ocean"
+        ocean.mkdir(parents=True)
+        ds.to_netcdf(ocean / "ocean.nc")
+
+
+def test_references_disabled(conn, tmp_path):
+    _write_years(tmp_path, [1990, 1991])
+
+    edb = ExperimentDB(conn=conn)
+    edb.config["scan references"] = False
+    edb.scan("access-om-payu", str(tmp_path))
+
+    refs = conn.execute(sqa.select([db.file.c.chunk_refs])).fetchall()
+    assert refs == [(None,), (None,)]
+
+    var_id = edb.search(variable_name="T").index[0]
+    assert edb.references(var_id) is None
+
+
+def test_open_references(conn, tmp_path):
+    pytest.importorskip("kerchunk")
+    pytest.importorskip("dask")
+
+    _write_years(tmp_path, [1990, 1991])
+
+    edb = ExperimentDB(conn=conn)
+    edb.config["scan references"] = True
+    edb.scan("access-om-payu", str(tmp_path))
+
+    var_id = edb.search(variable_name="T").index[0]
+    refs = edb.references(var_id)
+    assert "T/.zarray" in refs["refs"]
+
+    # Opened from the references rather than the template
+    with patch("edb.experimentdb._open_template") as open_template:
+        da = edb.open_dataarray(variable_name="T", lazy=True)
+        open_template.assert_not_called()
+
+    assert da.shape == (24, 3)
+    assert da.sel(time="1991-06").values.tolist() == [[1991] * 3]
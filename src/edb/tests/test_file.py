@@ -0,0 +1,161 @@
+from ..model.experiment import Experiment
+from ..model.file import file_type, header_size, NCFile, UMFile
+from ..model import ff
+from . import synthetic
+
+import cftime
+
+import numpy
+import xarray
+
+
+def test_file_type_netcdf(tmp_path):
+    ds = xarray.DataArray(numpy.zeros((10, 10)), dims=["lat", "lon"], name="foo")
+
+    ds.to_netcdf(tmp_path / "nc4.nc", format="NETCDF4")
+    assert file_type(tmp_path / "nc4.nc") == "netcdf"
+
+    ds.to_netcdf(tmp_path / "nc3.nc", format="NETCDF3_CLASSIC")
+    assert file_type(tmp_path / "nc3.nc") == "netcdf"
+
+
+def test_file_type_um(tmp_path):
+    # Fixed length header of a fieldsfile
+    flh = numpy.full(256, -32768, dtype=">i8")
+    flh[0] = 20
+    flh[1] = 1
+    flh[4] = 3
+
+    (tmp_path / "ab123a.pa1980jan").write_bytes(flh.tobytes())
+    assert file_type(tmp_path / "ab123a.pa1980jan") == "um"
+
+
+def test_file_type_unknown(tmp_path):
+    (tmp_path / "empty").write_bytes(b"")
+    assert file_type(tmp_path / "empty") is None
+
+    (tmp_path / "text").write_text("hello\n" * header_size)
+    assert file_type(tmp_path / "text") is None
+
+    assert file_type(tmp_path / "missing") is None
+
+
+def test_um_time_range(tmp_path):
+    flh = numpy.full(256, -32768, dtype=">i8")
+    flh[0] = 20
+    flh[4] = 3
+    flh[7] = 2  # 360 day calendar
+    flh[20:26] = [1980, 1, 1, 0, 0, 0]
+    flh[27:33] = [1980, 1, 30, 0, 0, 0]
+
+    (tmp_path / "ab123a.pa1980jan").write_bytes(flh.tobytes())
+
+    exp = Experiment(tmp_path)
+    r = UMFile("ab123a.pa1980jan", exp).identify_time_range()
+
+    assert r.start == cftime.datetime(1980, 1, 1, calendar="360_day")
+    assert r.end == cftime.datetime(1980, 1, 30, calendar="360_day")
+
+
+def test_nc_identify_variables(tmp_path):
+    ds = xarray.Dataset(
+        {
+            "T": (("time", "y"), numpy.zeros((2, 3)), {"long_name": "temp"}),
+            "lat": ("y", numpy.zeros(3)),
+        },
+        coords={"time": [0, 1], "y": [0, 1, 2]},
+    )
+    ds["T"].attrs["units"] = "K"
+    ds["T"].encoding["coordinates"] = "lat"
+    ds = ds.set_coords("lat")
+    ds.to_netcdf(tmp_path / "foo.nc")
+
+    exp = Experiment(tmp_path)
+    vs = NCFile("foo.nc", exp).identify_variables()
+
+    # Coordinates aren't included
+    assert [v.name for v in vs] == ["T"]
+    assert vs[0].long_name == "temp"
+    assert vs[0].units == "K"
+
+
+def test_um_identify_variables(tmp_path):
+    nfields = 3
+    lookup = numpy.zeros((nfields + 1, 64), dtype=">i8")
+    lookup[:, ff.lbrel] = 3
+    lookup[-1, ff.lbrel] = ff.unused_lbrel
+    lookup[:, ff.lbuser7] = 1
+    lookup[:, ff.lbuser4] = [3236, 3236, 5270, 0]
+    lookup[:, ff.lbproc] = [0, 0, 128, 0]
+    lookup[:, ff.lbtim] = [0, 0, 122, 0]
+
+    flh = numpy.full(256, -32768, dtype=">i8")
+    flh[0] = 20
+    flh[4] = 3
+    flh[ff.lookup_start_index] = 257
+    flh[ff.lookup_dim1_index] = 64
+    flh[ff.lookup_dim2_index] = lookup.shape[0]
+
+    (tmp_path / "ab123a.pa1980jan").write_bytes(flh.tobytes() + lookup.tobytes())
+
+    exp = Experiment(tmp_path)
+    vs = UMFile("ab123a.pa1980jan", exp).identify_variables()
+
+    # One variable per distinct STASH code and processing
+    assert [(v.name, v.method) for v in vs] == [
+        ("m01s03i236", ""),
+        ("m01s05i270", "mean: time (1 hour)"),
+    ]
+
+
+def test_um_identify_fields(tmp_path):
+    synthetic.write_um(tmp_path / "ab123a.pa1980jan", [3236, 5216], shape=(4, 8))
+
+    exp = Experiment(tmp_path)
+    index = UMFile("ab123a.pa1980jan", exp).identify_fields()
+
+    assert list(index["stash"]) == [3236, 5216]
+    assert list(index["size"]) == [4 * 8 * 8] * 2
+    assert index[0]["lbrow"] == 4 and index[0]["lbnpt"] == 8
+
+    # Time means are from the start to the end of the month, and are at the
+    # middle of the month like in iris
+    assert list(index["t1"]) == [3600.0] * 2
+    assert list(index["t2"]) == [3630.0] * 2
+    assert list(ff.field_times(index)) == [3615.0] * 2
+
+    # The offsets point to each field's data
+    data = (tmp_path / "ab123a.pa1980jan").read_bytes()
+    for field in index:
+        values = numpy.frombuffer(
+            data[field["offset"] : field["offset"] + field["size"]], dtype=">f8"
+        )
+        assert (values == field["stash"]).all()
+
+    fields = ff.select_fields(index, "m01s05i216", "mean: time (1 hour)")
+    assert list(fields["stash"]) == [5216]
+    assert len(ff.select_fields(index, "m01s05i216", "")) == 0
+
+
+def test_read_field(tmp_path):
+    field = numpy.zeros((), dtype=ff.field_index_columns)
+    field["lbrow"] = 2
+    field["lbnpt"] = 3
+    field["lbuser1"] = 1
+    field["bmdi"] = -1.0e30
+    field["offset"] = 8
+    field["size"] = 6 * 4
+    field["lbpack"] = 2  # 32 bit
+
+    values = numpy.array([[1, 2, 3], [4, 5, -1.0e30]], dtype=">f4")
+    (tmp_path / "field").write_bytes(b"\0" * 8 + values.tobytes())
+
+    with open(tmp_path / "field", "rb") as f:
+        data = ff.read_field(f, field)
+
+    assert data.shape == (2, 3)
+    assert list(data[0]) == [1, 2, 3]
+    assert numpy.isnan(data[1, 2])
+
+    # Land/sea compressed fields aren't supported
+    assert not ff.can_unpack(120)
@@ -0,0 +1,123 @@
+from ..server import Server, forward, serve, socket_path, _frame, _peer_uid
+from ..experimentdb import ExperimentDB
+from ..cli import make_parser
+from .. import db
+
+import json
+import os
+import socket
+import threading
+
+import pytest
+
+
+def _request(path, request):
+    """
+    Send a request to the server at 'path', returning the reply frames
+    """
+    reply = []
+
+    def client():
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            with sock.makefile("rb") as f:
+                while header := f.read(_frame.size):
+                    channel, length = _frame.unpack(header)
+                    data = b"" if channel in b"xr" else f.read(length)
+                    reply.append((channel, length, data))
+
+    t = threading.Thread(target=client)
+    t.start()
+    return t, reply
+
+
+def test_forward_no_server(tmp_path):
+    path = str(tmp_path / "edb.sock")
+
+    # Run locally if there's no server
+    assert forward(["search"], path) is None
+
+    # Commands that write to the database are never forwarded
+    assert forward(["scan"], path) is None
+
+
+def test_server(conn, tmp_path):
+    conn.execute(
+        db.experiment.insert().values(id=1, name="foo", type_id="generic", path="/foo")
+    )
+
+    path = str(tmp_path / "edb.sock")
+    server = Server(path, ExperimentDB(conn=conn), make_parser())
+
+    # The database connection is used by this thread, so the clients run in
+    # the background
+    with server:
+        t, reply = _request(path, {"argv": ["experiments"], "config": None})
+        server.handle_request()
+        t.join()
+
+        out = b"".join(d for c, _, d in reply if c == b"o")
+        assert b"foo" in out
+        assert reply[-1][:2] == (b"x", 0)
+
+        # Argument errors give the same status as running locally
+        t, reply = _request(path, {"argv": ["search", "--bogus"], "config": None})
+        server.handle_request()
+        t.join()
+
+        err = b"".join(d for c, _, d in reply if c == b"e")
+        assert b"unrecognized arguments" in err
+        assert reply[-1][:2] == (b"x", 2)
+
+        # Commands using a different config are refused
+        t, reply = _request(path, {"argv": ["experiments"], "config": "/other.yaml"})
+        server.handle_request()
+        t.join()
+
+        assert reply == [(b"r", 0, b"")]
+
+        # As are commands that aren't forwarded
+        t, reply = _request(path, {"argv": ["scan"], "config": None})
+        server.handle_request()
+        t.join()
+
+        assert reply == [(b"r", 0, b"")]
+
+
+def test_socket_path(monkeypatch):
+    monkeypatch.delenv("EDB_SOCKET", raising=False)
+    monkeypatch.delenv("XDG_RUNTIME_DIR", raising=False)
+    monkeypatch.setenv("TMPDIR", "/tmp")
+
+    # Not directly in a shared directory
+    assert socket_path() == f"/tmp/experimentdb-{os.getuid()}/edb.sock"
+
+
+def test_forward_other_user(tmp_path, monkeypatch, capsys):
+    path = str(tmp_path / "edb.sock")
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.bind(path)
+        sock.listen()
+
+        # Sockets owned by another user aren't used
+        monkeypatch.setattr(os, "getuid", lambda: os.geteuid() + 1)
+        assert forward(["search"], path) is None
+        assert "not a socket owned by you" in capsys.readouterr().err
+
+
+def test_peer_uid():
+    a, b = socket.socketpair()
+    with a, b:
+        assert _peer_uid(a) in (os.getuid(), None)
+
+
+def test_serve_shared_dir(tmp_path):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    shared.chmod(0o777)
+
+    # Other users could replace the socket
+    with pytest.raises(RuntimeError, match="other users can write"):
+        serve(None, None, path=str(shared / "edb.sock"))
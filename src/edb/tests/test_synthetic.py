@@ -0,0 +1,75 @@
+from . import synthetic
+from ..experimentdb import ExperimentDB
+from ..model.experiment.generic import Generic
+from ..model.experiment.payu import Payu
+from ..model.experiment.um import UMRose
+from .. import db
+
+import sqlalchemy as sqa
+
+
+def test_generic_experiment(tmp_path):
+    synthetic.generic_experiment(tmp_path, 5, per_dir=2)
+
+    exp = Generic(tmp_path)
+    metrics = exp.update()
+
+    assert metrics["files"] == 5
+    assert metrics["streams"] == 5
+
+    stream = exp.streams["run0000/out000001.nc"]
+    assert [v.name for v in stream.variables] == ["tas", "pr"]
+    assert stream.variables[0].standard_name == "air_temperature"
+
+
+def test_payu_experiment(tmp_path):
+    synthetic.payu_experiment(tmp_path, 3, ntime=2)
+
+    exp = Payu(tmp_path)
+    exp.update()
+
+    assert sorted(exp.streams) == ["ocean_daily", "ocean_month"]
+    assert len(exp.streams["ocean_daily"].files) == 3
+    assert [v.name for v in exp.streams["ocean_month"].variables] == [
+        "sst",
+        "sos",
+        "hfls",
+    ]
+
+
+def test_um_experiment(tmp_path):
+    path = tmp_path / "u-ab123"
+    synthetic.um_experiment(path, 13, stash=[3236, 5216, 16222])
+
+    exp = UMRose(path)
+    exp.update()
+
+    assert sorted(exp.streams) == ["ab123a.pa", "ab123a.pe"]
+
+    stream = exp.streams["ab123a.pa"]
+    assert len(stream.files) == 13
+    assert [v.name for v in stream.variables] == [
+        "m01s03i236",
+        "m01s05i216",
+        "m01s16i222",
+    ]
+
+    # Monthly files on a 360 day calendar
+    f = next(f for f in stream.files if f.relative_path.endswith("1981jan"))
+    assert f.end_date - f.start_date == 30
+
+
+def test_fill_database(conn):
+    synthetic.fill_database(conn, 2, 3, 4, 5, batch_size=7)
+
+    def count(table):
+        return conn.execute(sqa.select([sqa.func.count()]).select_from(table)).scalar()
+
+    assert count(db.experiment) == 2
+    assert count(db.stream) == 2 * 3
+    assert count(db.variable) == 2 * 3 * 4
+    assert count(db.file) == 2 * 3 * 5
+
+    edb = ExperimentDB(conn=conn)
+    assert len(edb.search(standard_name="air_temperature")) == 2 * 3
+    assert len(edb.files(experiment="u-a00001", stream="a00001a.p1")) == 4 * 5
@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+from ..utils import LRUCache
+
+
+def test_lru_cache():
+    cache = LRUCache(maxsize=2)
+
+    assert cache.get("a") is None
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+
+    # 'b' is the least recently used
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+    assert cache.stats() == {"hits": 3, "misses": 2, "size": 2, "maxsize": 2}
+
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(maxsize=0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+
+
+def test_ignore_broken_pipe():
+    code = (
+        "import sys\n"
+        "from edb.utils import ignore_broken_pipe\n"
+        "with ignore_broken_pipe():\n"
+        "    while True:\n"
+        "        print('x' * 1000)\n"
+    )
+    proc = subprocess.Popen(
+        [sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    # Close the output early, like 'head'
+    proc.stdout.read(10)
+    proc.stdout.close()
+
+    assert proc.wait(timeout=60) == 0
+    assert proc.stderr.read() == b""
@@ -0,0 +1,34 @@
+from .. import walk
+
+import glob
+import os
+
+
+def make_tree(path):
+    for d in ["a/x", "a/y", "b/x", ".hidden/x"]:
+        (path / d).mkdir(parents=True)
+        (path / d / "foo.nc").write_text("")
+        (path / d / "bar.txt").write_text("")
+    (path / "top.nc").write_text("")
+    os.symlink(path / "a", path / "link")
+
+
+def test_iglob(tmp_path, monkeypatch):
+    make_tree(tmp_path)
+
+    for pattern in ["*", "*/x/*.nc", "a/*/foo.nc", ".*/x", "a/x/foo.nc", "*/z"]:
+        expected = glob.glob(str(tmp_path / pattern))
+        assert sorted(walk.iglob(str(tmp_path / pattern))) == sorted(expected)
+
+    # Relative patterns give relative paths
+    monkeypatch.chdir(tmp_path)
+    assert sorted(walk.iglob("*/x")) == sorted(glob.glob("*/x"))
+
+
+def test_walk_files(tmp_path):
+    make_tree(tmp_path)
+
+    expected = [
+        os.path.join(root, f) for root, _, files in os.walk(tmp_path) for f in files
+    ]
+    assert sorted(walk.walk_files(str(tmp_path))) == sorted(expected)
@@ -1,3 +1,12 @@
+import collections
+import contextlib
+import os
+import sys
+import threading
+import time
+import typing as T
+
+
 def all_subclasses(cls):
     """
     Recursively  list all subclasses of a given class
@@ -6,3 +15,91 @@ def all_subclasses(cls):
     return set(cls.__subclasses__()).union(
         [s for c in cls.__subclasses__() for s in all_subclasses(c)]
     )
+
+
+@contextlib.contextmanager
+def timer(metrics: T.Counter[str], phase: str):
+    """
+    Add the time spent in the context to the '{phase} seconds' metric
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics[f"{phase} seconds"] += time.perf_counter() - start
+
+
+@contextlib.contextmanager
+def ignore_broken_pipe():
+    """
+    Stop writing output without an error if stdout is closed early, e.g. when
+    piped to 'head'
+    """
+    try:
+        yield
+    except BrokenPipeError:
+        # Point stdout at devnull so flushing it on exit doesn't fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+
+
+class LRUCache:
+    """
+    Keeps the 'maxsize' most recently used items
+
+    Hits and misses of :meth:`get` are counted, see :meth:`stats`. Safe to use
+    from multiple threads.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._items: T.OrderedDict[T.Hashable, T.Any] = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: T.Hashable, default: T.Any = None) -> T.Any:
+        """
+        Get an item, marking it as most recently used
+        """
+        with self._lock:
+            try:
+                value = self._items[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._items.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: T.Hashable, value: T.Any):
+        """
+        Add an item, removing the least recently used items if full
+        """
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Remove all items
+        """
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> T.Dict[str, int]:
+        """
+        Returns the hits, misses and current and maximum size of the cache
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._items),
+            "maxsize": self.maxsize,
+        }
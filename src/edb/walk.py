@@ -0,0 +1,174 @@
+"""
+Concurrent filesystem discovery
+
+On parallel filesystems like Lustre each directory listing is a round trip to
+the metadata server. These functions list many directories at once with a
+bounded pool of threads, yielding results as each listing completes so that
+later stages of a scan can start on them straight away.
+
+Results are yielded in the order the listings complete, not sorted.
+"""
+
+from __future__ import annotations
+
+import concurrent.futures
+import fnmatch
+import os
+import re
+import typing as T
+
+# Number of directory listings in flight at once
+default_workers = 16
+
+_magic = re.compile("[*?[]")
+
+In = T.TypeVar("In")
+Out = T.TypeVar("Out")
+
+
+def imap_unordered(
+    fn: T.Callable[[In], T.Tuple[T.Iterable[Out], T.Iterable[In]]],
+    items: T.Iterable[In],
+    workers: T.Optional[int] = None,
+) -> T.Iterator[Out]:
+    """
+    Run 'fn' on each item in a thread pool, yielding outputs as they complete
+
+    'fn' returns a pair of outputs to yield and further items to run 'fn'
+    on, so a tree of directories can be expanded as it is discovered
+
+    Args:
+        fn: Function to run
+        items: Initial items
+        workers: Number of threads, default :data:`default_workers`
+    """
+    if workers is None:
+        workers = default_workers
+
+    with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+        pending = {pool.submit(fn, i) for i in items}
+
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    outputs, children = future.result()
+                    pending.update(pool.submit(fn, c) for c in children)
+                    yield from outputs
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def scandir_match(path: str, pattern: str, dirs_only: bool = False) -> T.List[str]:
+    """
+    List the entries of directory 'path' whose names match 'pattern'
+
+    As with :func:`glob.glob` names starting with '.' are only matched if the
+    pattern also starts with '.'
+
+    Args:
+        path: Directory to list
+        pattern: Shell-style pattern for the entry names
+        dirs_only: Only return directories
+    Returns:
+        Paths of the matching entries, or an empty list if 'path' can't be
+        listed
+    """
+    hidden = pattern.startswith(".")
+
+    try:
+        with os.scandir(path) as it:
+            entries = [
+                e
+                for e in it
+                if (hidden or not e.name.startswith("."))
+                and fnmatch.fnmatch(e.name, pattern)
+            ]
+    except OSError:
+        return []
+
+    return [os.path.join(path, e.name) for e in entries if not dirs_only or _is_dir(e)]
+
+
+def _is_dir(entry: os.DirEntry) -> bool:
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def iglob(pattern: str, workers: T.Optional[int] = None) -> T.Iterator[str]:
+    """
+    Find paths matching a shell-style pattern, like :func:`glob.iglob`
+
+    Each directory level containing a wildcard is listed concurrently.
+    Recursive '**' patterns aren't supported.
+
+    Args:
+        pattern: Path pattern
+        workers: Number of concurrent listings, default :data:`default_workers`
+    """
+    parts = pattern.split(os.sep)
+    if pattern.startswith(os.sep):
+        start = os.sep
+        parts = parts[1:]
+    else:
+        start = ""
+    parts = [p for p in parts if p != ""]
+
+    def expand(item: T.Tuple[str, T.List[str]]):
+        path, parts = item
+
+        # Literal components don't need a listing
+        while len(parts) > 0 and _magic.search(parts[0]) is None:
+            path = os.path.join(path, parts[0])
+            parts = parts[1:]
+
+        if len(parts) == 0:
+            found = [path] if os.path.lexists(path) else []
+            return found, []
+
+        matches = scandir_match(path or os.curdir, parts[0], dirs_only=len(parts) > 1)
+        if path == "":
+            matches = [os.path.relpath(m) for m in matches]
+
+        if len(parts) == 1:
+            return matches, []
+        return [], [(m, parts[1:]) for m in matches]
+
+    return imap_unordered(expand, [(start, parts)], workers)
+
+
+def walk_files(top: str, workers: T.Optional[int] = None) -> T.Iterator[str]:
+    """
+    Find all files under directory 'top', like :func:`os.walk`
+
+    Subdirectories are listed concurrently. As with :func:`os.walk`, symlinks
+    to directories aren't followed.
+
+    Args:
+        top: Directory to search
+        workers: Number of concurrent listings, default :data:`default_workers`
+    Returns:
+        Paths of the files found
+    """
+
+    def expand(path: str):
+        files = []
+        dirs = []
+        try:
+            with os.scandir(path) as it:
+                for e in it:
+                    if not _is_dir(e):
+                        files.append(e.path)
+                    elif not e.is_symlink():
+                        dirs.append(e.path)
+        except OSError:
+            pass
+
+        return files, dirs
+
+    return imap_unordered(expand, [top], workers)